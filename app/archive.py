@@ -0,0 +1,88 @@
+import logging
+import time
+
+import sqlalchemy
+
+from app.database import (
+    archived_comment_table,
+    archived_post_table,
+    comment_table,
+    database,
+    like_table,
+    post_table,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def archive_batch(before: float, limit: int) -> int:
+    """Move up to limit posts created before `before` to the archive tables.
+
+    Comments are copied as they are, likes only as a count on the archived
+    post. Everything happens in one transaction, so readers see a post
+    either in the hot tables or in the archive, never in both or neither.
+    """
+    async with database.transaction():
+        query = (
+            sqlalchemy.select(post_table.c.id)
+            .where(post_table.c.created_at < before)
+            .order_by(post_table.c.id)
+            .limit(limit)
+        )
+        post_ids = [post.id for post in await database.fetch_all(query)]
+        if not post_ids:
+            return 0
+
+        likes = (
+            sqlalchemy.select(sqlalchemy.func.count(like_table.c.id))
+            .where(like_table.c.post_id == post_table.c.id)
+            .scalar_subquery()
+        )
+        posts = sqlalchemy.select(
+            post_table.c.id,
+            post_table.c.body,
+            post_table.c.user_id,
+            post_table.c.created_at,
+            post_table.c.media,
+            likes,
+        ).where(post_table.c.id.in_(post_ids))
+        await database.execute(
+            archived_post_table.insert().from_select(
+                ["id", "body", "user_id", "created_at", "media", "likes"], posts
+            )
+        )
+
+        comments = sqlalchemy.select(comment_table).where(
+            comment_table.c.post_id.in_(post_ids)
+        )
+        await database.execute(
+            archived_comment_table.insert().from_select(
+                [column.name for column in comment_table.c], comments
+            )
+        )
+
+        # The posts go first so the change log does not record their likes
+        # as unlikes; the foreign keys are checked once everything is gone
+        await database.execute("PRAGMA defer_foreign_keys = ON")
+        await database.execute(post_table.delete().where(post_table.c.id.in_(post_ids)))
+        await database.execute(
+            comment_table.delete().where(comment_table.c.post_id.in_(post_ids))
+        )
+        await database.execute(
+            like_table.delete().where(like_table.c.post_id.in_(post_ids))
+        )
+        await database.execute("PRAGMA defer_foreign_keys = OFF")
+
+    logger.info(f"Archived {len(post_ids)} posts")
+    return len(post_ids)
+
+
+async def archive_posts(
+    older_than_days: float, batch_size: int, now: float | None = None
+) -> int:
+    # Short transactions keep the writers waiting on the lock brief
+    before = (time.time() if now is None else now) - older_than_days * 86400
+    total = 0
+    while archived := await archive_batch(before, batch_size):
+        total += archived
+    return total
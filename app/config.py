@@ -1,8 +1,13 @@
+from collections.abc import Callable
 from functools import lru_cache
-from typing import Optional
+from typing import Any, Literal, Optional
 
+from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+# Names logging.setLevel takes, checked here so a bad one fails validation
+LogLevel = Literal["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG", "NOTSET"]
+
 
 class BaseConfig(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
@@ -13,13 +18,116 @@ class BaseConfig(BaseSettings):
 class GlobalConfig(BaseConfig):
     DATABASE_URL: Optional[str] = None
     DB_FORCE_ROLL_BACK: bool = False
+    DB_POOL_SIZE: int = 20  # Connections shared by all workers on the host
+    WEB_CONCURRENCY: int = Field(default=1, validation_alias="WEB_CONCURRENCY")
     LOGTAIL_API_KEY: Optional[str] = None
     LOGTAIL_HOST: Optional[str] = None
+    LOG_LEVELS: dict[str, LogLevel] = {
+        "app": "INFO",
+        "uvicorn": "INFO",
+        "databases": "WARNING",
+        "aiosqlite": "WARNING",
+    }
+    ADMIN_API_KEY: Optional[str] = None  # Admin endpoints are disabled without it
+    BCRYPT_ROUNDS: Optional[int] = None  # passlib's default unless set
+    TOKEN_VERSION_CACHE_SIZE: int = 10_000
+    TOKEN_VERSION_CACHE_SECONDS: float = 30.0  # How late revocations may apply
+
+    PROFILING_ENABLED: bool = False
+    PROFILING_SAMPLE_RATE: float = 0.0  # Fraction of requests profiled continuously
+    PROFILING_INTERVAL_MS: float = 5.0
+    PROFILING_MAX_STACKS: int = 10_000
+
+    KNOWN_POSTS_CACHE_SIZE: int = 10_000
+    AUTHOR_CACHE_SIZE: int = 10_000
+    POST_READ_CACHE_SIZE: int = 1000
+    POST_READ_CACHE_SECONDS: float = 1.0  # How stale GET /post/{id} may be served
+
+    # Readiness fails this long before the worker stops accepting requests,
+    # enough for the load balancer's health checks to notice
+    SHUTDOWN_DELAY_SECONDS: float = 0.0
+    # Then in-flight requests, followed by running jobs, get this long in all
+    SHUTDOWN_TIMEOUT_SECONDS: float = 20.0
+    HEALTH_CHECK_TIMEOUT_SECONDS: float = 1.0  # Database ping of /health/ready
+
+    JOB_WORKERS: int = 2  # Per app worker process
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BACKOFF_SECONDS: float = 2.0  # Doubled after every failed attempt
+    JOB_LEASE_SECONDS: float = 300.0  # A crashed worker's job is retried after this
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0
+
+    EVENTS_BACKPLANE: Literal["local"] = "local"
+    EVENTS_BUFFER_SIZE: int = 100  # Per subscriber, a full buffer evicts it
+    EVENTS_HEARTBEAT_SECONDS: float = 15.0
+
+    GZIP_MIN_SIZE: int = 1000  # Smaller responses are not worth compressing
+    GZIP_LEVEL: int = 5  # Level 9 takes ~8x as long for ~10% fewer bytes
+
+    ARCHIVE_AFTER_DAYS: float = 365.0  # Older posts move to the archive tables
+    ARCHIVE_BATCH_SIZE: int = 500  # Posts moved per transaction
+
+    USER_STATS_CHECK_INTERVAL_SECONDS: float = 3600.0
+    USER_STATS_CHECK_BATCH_SIZE: int = 500  # Users recounted per query
+
+    CHANGES_BATCH_SIZE: int = 500  # Most changes returned by one /changes call
+    COMMENTS_PAGE_SIZE: int = 500  # Most comments returned by one call
+
+    MEDIA_BACKEND: Literal["local"] = "local"
+    MEDIA_ROOT: str = "media"  # Where the local backend keeps the files
+    MEDIA_ACCEL_REDIRECT: Optional[str] = None  # nginx location serving MEDIA_ROOT
+    MEDIA_MAX_BYTES: int = 20 * 1024 * 1024
+    MEDIA_MAX_PER_POST: int = 10
+    # Served as uploaded; anything else (HTML, SVG...) as an opaque download
+    MEDIA_SAFE_TYPES: list[str] = [
+        "image/png",
+        "image/jpeg",
+        "image/gif",
+        "image/webp",
+        "video/mp4",
+        "video/webm",
+        "audio/mpeg",
+        "audio/ogg",
+    ]
+    MEDIA_THUMBNAIL_SIZE: int = 256  # Longest side, in pixels
+    MEDIA_THUMBNAIL_WORKERS: int = 2  # Threads resizing images, per worker process
+
+    # Seconds a request may take, checked before and during every query
+    REQUEST_DEADLINE_SECONDS: Optional[float] = 10.0
+    ROUTE_DEADLINES: dict[str, float] = {
+        "GET /post": 2.0,
+        "GET /post/{post_id}": 2.0,
+        "GET /post/{post_id}/comment": 2.0,
+        "GET /changes": 2.0,
+        "POST /media": 300.0,  # Uploads are as slow as the client's connection
+    }
+
+    # Per-request query counting against the budgets declared on routes
+    QUERY_BUDGET_MODE: Literal["off", "warn", "raise"] = "off"
+    QUERY_STATS_RECENT_REQUESTS: int = 1000  # Kept for the query stats lookup
+
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: Literal["memory", "sqlite"] = "memory"
+    RATE_LIMIT_SQLITE_PATH: str = "ratelimit.db"  # Shared by workers on one host
+    RATE_LIMIT_MAX_KEYS: int = 100_000  # Buckets kept by the memory backend
+    RATE_LIMITS: dict[str, str] = {
+        "POST /token": "10/minute",
+        "POST /register": "5/minute",
+        "POST /like": "120/minute",
+    }
+    ROUTE_CONCURRENCY: dict[str, int] = {"POST /token": 16, "POST /register": 16}
 
 
 class DevConfig(GlobalConfig):
     model_config = SettingsConfigDict(env_prefix="DEV_")
 
+    LOG_LEVELS: dict[str, LogLevel] = {
+        "app": "DEBUG",
+        "uvicorn": "INFO",
+        "databases": "WARNING",
+        "aiosqlite": "WARNING",
+    }
+    QUERY_BUDGET_MODE: Literal["off", "warn", "raise"] = "warn"
+
 
 class ProdConfig(GlobalConfig):
     model_config = SettingsConfigDict(env_prefix="PROD_")
@@ -30,6 +138,11 @@ class TestConfig(GlobalConfig):
 
     DB_FORCE_ROLL_BACK: bool = True  # This is used to reset the database
     DATABASE_URL: str = "sqlite:///test.db"
+    ADMIN_API_KEY: str = "test-admin-key"
+    BCRYPT_ROUNDS: Optional[int] = 4  # The minimum, hashing is not under test
+    PROFILING_ENABLED: bool = True
+    QUERY_BUDGET_MODE: Literal["off", "warn", "raise"] = "raise"
+    RATE_LIMIT_ENABLED: bool = False
 
 
 @lru_cache()
@@ -39,3 +152,46 @@ def get_config(env_state: str) -> GlobalConfig:
 
 
 config = get_config(BaseConfig().ENV_STATE)
+
+# Settings every user reads on each use (or is told about by a hook), so
+# they can change on a running worker
+RELOADABLE_SETTINGS = (
+    "LOG_LEVELS",
+    "PROFILING_SAMPLE_RATE",
+    "POST_READ_CACHE_SECONDS",
+    "TOKEN_VERSION_CACHE_SECONDS",
+)
+
+# Called with the names of the settings a reload changed
+reload_hooks: list[Callable[[set[str]], None]] = []
+
+
+def reload_config() -> dict[str, Any]:
+    """Re-read the environment and .env, applying the reloadable settings.
+
+    Returns the settings that changed. Everything else only takes effect
+    once the worker restarts. When a hook fails, the previous values are
+    put back and applied again before the error is raised.
+    """
+    fresh = type(config)()
+    changed = {
+        name: getattr(fresh, name)
+        for name in RELOADABLE_SETTINGS
+        if getattr(fresh, name) != getattr(config, name)
+    }
+    if not changed:
+        return changed
+
+    previous = {name: getattr(config, name) for name in changed}
+    for name, value in changed.items():
+        setattr(config, name, value)
+    try:
+        for hook in reload_hooks:
+            hook(set(changed))
+    except Exception:
+        for name, value in previous.items():
+            setattr(config, name, value)
+        for hook in reload_hooks:
+            hook(set(changed))
+        raise
+    return changed
@@ -1,17 +1,39 @@
+import fcntl
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from functools import lru_cache
+
+import anyio
 import databases
 import sqlalchemy
 
 from app.config import config
+from app.deadlines import DeadlineExceeded, current_deadline, rejections, timeouts
+from app.query_counter import record_query
 
 # ---- The sqlalchemy modules is used to create the database schema ----
 metadata = sqlalchemy.MetaData()
 
+# Unix time in seconds, filled in by sqlite so inserts need not pass it
+unix_now = sqlalchemy.text("((julianday('now') - 2440587.5) * 86400.0)")
+
 post_table = sqlalchemy.Table(
     "posts",
     metadata,
     sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
     sqlalchemy.Column("body", sqlalchemy.String),
     sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False),
+    sqlalchemy.Column(
+        "created_at", sqlalchemy.Float, nullable=False, server_default=unix_now
+    ),
+    # Digests of the attached media, in order
+    sqlalchemy.Column("media", sqlalchemy.JSON, nullable=False, server_default="[]"),
+    sqlalchemy.Index("ix_posts_created_at", "created_at"),
+    sqlalchemy.Index("ix_posts_user_id", "user_id"),
+    # Archived posts leave the table, their ids must not be handed out again
+    sqlite_autoincrement=True,
 )
 
 user_table = sqlalchemy.Table(
@@ -21,9 +43,36 @@ user_table = sqlalchemy.Table(
     sqlalchemy.Column("email", sqlalchemy.String, unique=True),
     sqlalchemy.Column("password", sqlalchemy.String),
     sqlalchemy.Column("confirmed", sqlalchemy.Boolean, default=False),
+    # Bumped to revoke every access token issued to the user so far
+    sqlalchemy.Column(
+        "token_version", sqlalchemy.Integer, nullable=False, server_default="0"
+    ),
 )
 
 
+# Replies nest this deep at most, the thread triggers are written for it
+MAX_COMMENT_DEPTH = 16
+
+# Every comment's path is its ancestors' ids and its own, zero padded, so
+# sorting by path lists threads depth first and a subtree is a path range
+PATH_SEGMENT = "printf('%%010d.', {id})"  # DDL statements are %-formatted
+PATH_SEGMENT_LENGTH = 11
+
+
+def thread_columns() -> list[sqlalchemy.Column]:
+    return [
+        sqlalchemy.Column("parent_id", sqlalchemy.Integer),
+        sqlalchemy.Column("path", sqlalchemy.String),
+        sqlalchemy.Column(
+            "depth", sqlalchemy.Integer, nullable=False, server_default="0"
+        ),
+        # Replies anywhere below the comment, kept up to date by a trigger
+        sqlalchemy.Column(
+            "replies", sqlalchemy.Integer, nullable=False, server_default="0"
+        ),
+    ]
+
+
 comment_table = sqlalchemy.Table(
     "comments",
     metadata,
@@ -33,6 +82,10 @@ comment_table = sqlalchemy.Table(
         "post_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("posts.id"), nullable=False
     ),
     sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False),
+    *thread_columns(),
+    sqlalchemy.Index("ix_comments_post_id_path", "post_id", "path"),
+    sqlalchemy.Index("ix_comments_user_id", "user_id"),
+    sqlite_autoincrement=True,
 )
 
 like_table = sqlalchemy.Table(
@@ -43,19 +96,389 @@ like_table = sqlalchemy.Table(
         "post_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("posts.id"), nullable=False
     ),
     sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False),
+    sqlalchemy.UniqueConstraint("post_id", "user_id", name="uq_like_post_user"),
+    sqlalchemy.Index("ix_like_user_id", "user_id"),
+)
+
+# Posts past ARCHIVE_AFTER_DAYS, read-only and with their likes rolled up
+archived_post_table = sqlalchemy.Table(
+    "archived_posts",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("body", sqlalchemy.String),
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False),
+    sqlalchemy.Column("created_at", sqlalchemy.Float, nullable=False),
+    sqlalchemy.Column("media", sqlalchemy.JSON, nullable=False, server_default="[]"),
+    sqlalchemy.Column("likes", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Index("ix_archived_posts_user_id", "user_id"),
+)
+
+archived_comment_table = sqlalchemy.Table(
+    "archived_comments",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("body", sqlalchemy.String),
+    sqlalchemy.Column(
+        "post_id",
+        sqlalchemy.Integer,
+        sqlalchemy.ForeignKey("archived_posts.id"),
+        nullable=False,
+    ),
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False),
+    *thread_columns(),
+    sqlalchemy.Index("ix_archived_comments_post_id_path", "post_id", "path"),
+    sqlalchemy.Index("ix_archived_comments_user_id", "user_id"),
+)
+
+# Uploaded files, stored once per content whoever uploads them again
+media_table = sqlalchemy.Table(
+    "media",
+    metadata,
+    sqlalchemy.Column("digest", sqlalchemy.String, primary_key=True),  # SHA-256
+    sqlalchemy.Column("size", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("content_type", sqlalchemy.String, nullable=False),
+    # The first uploader
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False),
+    sqlalchemy.Column(
+        "created_at", sqlalchemy.Float, nullable=False, server_default=unix_now
+    ),
 )
 
-engine = sqlalchemy.create_engine(
-    url=config.DATABASE_URL,
-    connect_args={
-        "check_same_thread": False  # This enables sqlite to be multithreaded
-    },  # Because sqlite is single threaded by default
+job_table = sqlalchemy.Table(
+    "jobs",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("name", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("payload", sqlalchemy.JSON, nullable=False),
+    sqlalchemy.Column("status", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("attempts", sqlalchemy.Integer, nullable=False, default=0),
+    sqlalchemy.Column("max_attempts", sqlalchemy.Integer, nullable=False),
+    # Next time the job may run; while running it is the end of the worker's lease
+    sqlalchemy.Column("run_at", sqlalchemy.Float, nullable=False),
+    sqlalchemy.Column("last_error", sqlalchemy.String),
+    sqlalchemy.Index("ix_jobs_status_run_at", "status", "run_at"),
+)
+
+# Append-only log of writes to the tables clients sync, ordered by seq
+change_table = sqlalchemy.Table(
+    "changes",
+    metadata,
+    sqlalchemy.Column("seq", sqlalchemy.Integer, primary_key=True, autoincrement=True),
+    sqlalchemy.Column("entity", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("op", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("data", sqlalchemy.JSON, nullable=False),
+    sqlite_autoincrement=True,  # seq values are never reused after a rollback
+)
+
+# entity -> (table, columns copied into the change)
+TRACKED_TABLES = {
+    "post": (post_table, ("id", "body", "user_id", "media")),
+    "comment": (
+        comment_table,
+        ("id", "body", "post_id", "user_id", "parent_id", "depth"),
+    ),
+    "like": (like_table, ("id", "post_id", "user_id")),
+}
+
+
+def value(table: sqlalchemy.Table, row: str, column: str) -> str:
+    # JSON columns are stored as text, json() nests them as they are
+    if isinstance(table.c[column].type, sqlalchemy.JSON):
+        return f"json({row}.{column})"
+    return f"{row}.{column}"
+
+
+def change_trigger(entity: str, event: str) -> sqlalchemy.DDL:
+    # Written by the database in the same transaction as the row itself, so
+    # the write paths stay at one round trip and no change can be missed
+    table, columns = TRACKED_TABLES[entity]
+    row = "OLD" if event == "DELETE" else "NEW"
+    op = "delete" if event == "DELETE" else "upsert"
+    data = ", ".join(f"'{column}', {value(table, row, column)}" for column in columns)
+    # Rows deleted along with their post were archived, not undone
+    condition = (
+        f"WHEN EXISTS (SELECT 1 FROM {post_table.name} WHERE id = OLD.post_id) "
+        if event == "DELETE" and "post_id" in columns
+        else ""
+    )
+    return sqlalchemy.DDL(
+        f"CREATE TRIGGER IF NOT EXISTS {table.name}_{event.lower()}_change "
+        f'AFTER {event} ON "{table.name}" {condition}BEGIN '
+        f"INSERT INTO {change_table.name} (entity, op, data) "
+        f"VALUES ('{entity}', '{op}', json_object({data})); END"
+    )
+
+
+for entity, event in [
+    ("post", "INSERT"),
+    ("comment", "INSERT"),
+    ("like", "INSERT"),
+    ("like", "DELETE"),
+]:
+    sqlalchemy.event.listen(
+        metadata,
+        "after_create",
+        change_trigger(entity, event).execute_if(dialect="sqlite"),
+    )
+
+PARENT_NOT_FOUND = "Parent comment not found"
+REPLY_TOO_DEEP = "Replies are nested too deep"
+
+parent_comment = (
+    f"(SELECT {{column}} FROM {comment_table.name} WHERE id = NEW.parent_id)"
+)
+# The ancestors' ids, read back from the parent's path
+ancestor_ids = ", ".join(
+    f"CAST(substr({parent_comment.format(column='path')}, "
+    f"{level * PATH_SEGMENT_LENGTH + 1}, {PATH_SEGMENT_LENGTH - 1}) AS INTEGER)"
+    for level in range(MAX_COMMENT_DEPTH)
 )
 
-metadata.create_all(engine)
+for trigger in [
+    # Raised as IntegrityError with the message, no query needed up front
+    sqlalchemy.DDL(
+        f"CREATE TRIGGER IF NOT EXISTS comments_check_parent "
+        f"BEFORE INSERT ON {comment_table.name} WHEN NEW.parent_id IS NOT NULL BEGIN "
+        f"SELECT RAISE(ABORT, '{PARENT_NOT_FOUND}') WHERE NOT EXISTS ("
+        f"SELECT 1 FROM {comment_table.name} "
+        f"WHERE id = NEW.parent_id AND post_id = NEW.post_id); "
+        f"SELECT RAISE(ABORT, '{REPLY_TOO_DEEP}') "
+        f"WHERE {parent_comment.format(column='depth')} >= {MAX_COMMENT_DEPTH - 1}; "
+        f"END"
+    ),
+    # The id is only known once the row is in
+    sqlalchemy.DDL(
+        f"CREATE TRIGGER IF NOT EXISTS comments_insert_thread "
+        f"AFTER INSERT ON {comment_table.name} BEGIN "
+        f"UPDATE {comment_table.name} SET path = "
+        f"coalesce({parent_comment.format(column='path')}, '') "
+        f"|| {PATH_SEGMENT.format(id='NEW.id')} WHERE id = NEW.id; "
+        f"UPDATE {comment_table.name} SET replies = replies + 1 "
+        f"WHERE NEW.parent_id IS NOT NULL AND id IN ({ancestor_ids}); "
+        f"END"
+    ),
+]:
+    sqlalchemy.event.listen(
+        metadata, "after_create", trigger.execute_if(dialect="sqlite")
+    )
+
+# Per-user counters kept up to date by triggers, so reading them is one row
+user_stats_table = sqlalchemy.Table(
+    "user_stats",
+    metadata,
+    sqlalchemy.Column(
+        "user_id",
+        sqlalchemy.ForeignKey("users.id"),
+        primary_key=True,
+        autoincrement=False,
+    ),
+    sqlalchemy.Column("posts", sqlalchemy.Integer, nullable=False, server_default="0"),
+    sqlalchemy.Column(
+        "comments", sqlalchemy.Integer, nullable=False, server_default="0"
+    ),
+    sqlalchemy.Column(
+        "likes_given", sqlalchemy.Integer, nullable=False, server_default="0"
+    ),
+    sqlalchemy.Column(
+        "likes_received", sqlalchemy.Integer, nullable=False, server_default="0"
+    ),
+    # Likes given on since archived posts, whose like rows are gone
+    sqlalchemy.Column(
+        "archived_likes_given", sqlalchemy.Integer, nullable=False, server_default="0"
+    ),
+)
+
+
+def stats_update(user: str, **deltas: int) -> str:
+    # Upserts, so a user missing a stats row gets one instead of a lost update
+    columns = "".join(f", {column}" for column in deltas)
+    values = "".join(f", {delta}" for delta in deltas.values())
+    updates = ", ".join(
+        f"{column} = {column} + {delta}" for column, delta in deltas.items()
+    )
+    conflict = f"DO UPDATE SET {updates}" if deltas else "DO NOTHING"
+    return (
+        f"INSERT INTO {user_stats_table.name} (user_id{columns}) "
+        f"VALUES ({user}{values}) ON CONFLICT (user_id) {conflict};"
+    )
+
+
+def stats_trigger(
+    name: str, table: sqlalchemy.Table, event: str, *updates: str, when: str = ""
+) -> sqlalchemy.DDL:
+    condition = f"WHEN {when} " if when else ""
+    return sqlalchemy.DDL(
+        f"CREATE TRIGGER IF NOT EXISTS {name} "
+        f'AFTER {event} ON "{table.name}" {condition}BEGIN {" ".join(updates)} END'
+    )
+
+
+post_author = f"(SELECT user_id FROM {post_table.name} WHERE id = {{row}}.post_id)"
+post_exists = f"EXISTS (SELECT 1 FROM {post_table.name} WHERE id = OLD.post_id)"
+
+for trigger in [
+    stats_trigger("users_insert_stats", user_table, "INSERT", stats_update("NEW.id")),
+    stats_trigger(
+        "posts_insert_stats",
+        post_table,
+        "INSERT",
+        stats_update("NEW.user_id", posts=1),
+    ),
+    stats_trigger(
+        "comments_insert_stats",
+        comment_table,
+        "INSERT",
+        stats_update("NEW.user_id", comments=1),
+    ),
+    stats_trigger(
+        "like_insert_stats",
+        like_table,
+        "INSERT",
+        stats_update("NEW.user_id", likes_given=1),
+        stats_update(post_author.format(row="NEW"), likes_received=1),
+    ),
+    stats_trigger(
+        "like_unlike_stats",
+        like_table,
+        "DELETE",
+        stats_update("OLD.user_id", likes_given=-1),
+        stats_update(post_author.format(row="OLD"), likes_received=-1),
+        when=post_exists,
+    ),
+    # Archiving keeps the received likes as a count on the archived post,
+    # the given ones are only kept here
+    stats_trigger(
+        "like_archive_stats",
+        like_table,
+        "DELETE",
+        stats_update("OLD.user_id", archived_likes_given=1),
+        when=f"NOT {post_exists}",
+    ),
+]:
+    sqlalchemy.event.listen(
+        metadata, "after_create", trigger.execute_if(dialect="sqlite")
+    )
+
+
+database_url = sqlalchemy.engine.make_url(config.DATABASE_URL)
+
+
+@lru_cache()
+def get_engine() -> sqlalchemy.Engine:
+    # Only used for DDL, so it is created when the schema is set up in lifespan
+    return sqlalchemy.create_engine(
+        url=database_url,
+        connect_args={
+            "check_same_thread": False  # This enables sqlite to be multithreaded
+        },  # Because sqlite is single threaded by default
+    )
+
+
+# Set by the launcher once the schema exists so workers skip the DDL
+SCHEMA_READY_ENV = "APP_SCHEMA_READY"
+
+
+@contextmanager
+def schema_lock():
+    if database_url.get_backend_name() == "sqlite" and database_url.database:
+        path = f"{database_url.database}.lock"
+    else:
+        path = os.path.join(tempfile.gettempdir(), "social-media-schema.lock")
+
+    with open(path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def create_schema() -> None:
+    # Concurrent workers would otherwise race each other on CREATE TABLE
+    with schema_lock():
+        metadata.create_all(get_engine())
+
 
 # ---- The databases module is used to interact with the database ----
-database = databases.Database(
+class ForeignKeysConnection(sqlite3.Connection):
+    # sqlite only enforces foreign keys when asked to, once per connection
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.execute("PRAGMA foreign_keys = ON")
+
+
+class InstrumentedDatabase(databases.Database):
+    # Every round trip is reported to the per-request query counter and runs
+    # within what is left of the request's deadline
+    async def fetch_all(self, query, values=None):
+        record_query(query)
+        return await self._within_deadline(super().fetch_all, query, values)
+
+    async def fetch_one(self, query, values=None):
+        record_query(query)
+        return await self._within_deadline(super().fetch_one, query, values)
+
+    async def fetch_val(self, query, values=None, column=0):
+        record_query(query)
+        return await self._within_deadline(
+            super().fetch_val, query, values, column=column
+        )
+
+    async def execute(self, query, values=None):
+        record_query(query)
+        return await self._within_deadline(super().execute, query, values)
+
+    async def execute_many(self, query, values):
+        record_query(query)
+        return await self._within_deadline(super().execute_many, query, values)
+
+    async def iterate(self, query, values=None):
+        record_query(query)
+        async for record in super().iterate(query, values):
+            yield record
+
+    async def _within_deadline(self, call, *args, **kwargs):
+        deadline = current_deadline()
+        if deadline is None:
+            return await call(*args, **kwargs)
+
+        remaining = deadline.remaining()
+        if remaining is not None and remaining <= 0:
+            rejections[deadline.route] += 1
+            raise DeadlineExceeded(deadline.route, started=False)
+
+        # Holding the connection keeps it around to interrupt the query
+        async with self.connection() as connection:
+            try:
+                with anyio.fail_after(remaining):
+                    return await call(*args, **kwargs)
+            except TimeoutError as e:
+                await self._interrupt(connection)
+                timeouts[deadline.route] += 1
+                raise DeadlineExceeded(deadline.route, started=True) from e
+            except anyio.get_cancelled_exc_class():
+                await self._interrupt(connection)
+                raise
+
+    async def _interrupt(self, connection: databases.core.Connection) -> None:
+        # Cancelling the await leaves sqlite running the statement in
+        # aiosqlite's thread, holding the connection until it finishes
+        if database_url.get_backend_name() == "sqlite":
+            await connection.raw_connection.interrupt()
+
+
+def database_options() -> dict:
+    if database_url.get_backend_name() == "sqlite":
+        # aiosqlite opens a connection per acquire, there is no pool to size
+        return {"factory": ForeignKeysConnection}
+
+    # The connection budget is split between the workers on the host
+    pool_size = max(1, config.DB_POOL_SIZE // config.WEB_CONCURRENCY)
+    return {"min_size": 1, "max_size": pool_size}
+
+
+database = InstrumentedDatabase(
     config.DATABASE_URL,
     force_rollback=config.DB_FORCE_ROLL_BACK,
+    **database_options(),
 )
@@ -0,0 +1,248 @@
+"""Bulk-load synthetic users, posts, comments and likes.
+
+    ENV_STATE=dev python -m app.datagen --users 100000 --posts 1000000 \\
+        --comments 2000000 --likes 5000000 --seed 1
+
+Popularity is skewed the way it is in production: a few users write most of
+the posts, comments and likes, likes follow a Zipf distribution over the
+posts and a small share of viral posts get a multiple of that on top. The
+same spec and seed always produce the same rows.
+
+Rows are inserted with sqlite's executemany straight into the tables, so the
+triggers keep the change log and the user stats in step as they would be
+after the same writes through the API.
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from itertools import accumulate, islice
+
+import sqlalchemy
+from sqlalchemy.dialects import sqlite
+
+from app.database import (
+    comment_table,
+    create_schema,
+    database,
+    like_table,
+    post_table,
+    user_table,
+)
+from app.security import get_password_hash
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 10_000
+
+# Likes are drawn with the skew and repeats drawn again; past this share of
+# all (user, post) pairs the last ones take ever longer to find
+MAX_LIKE_DENSITY = 0.5
+
+PASSWORD = "password"
+
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while friends like share and "
+    "comment on every photo of lunch coffee cats sunsets and weekend plans"
+).split()
+
+
+@dataclass
+class DatasetSpec:
+    users: int = 1000
+    posts: int = 10_000
+    comments: int = 20_000
+    likes: int = 50_000
+    seed: int = 0
+    skew: float = 1.1  # Zipf exponent of post popularity and user activity
+    viral_share: float = 0.001
+    viral_boost: float = 50.0  # Like weight multiplier of a viral post
+    days: float = 365.0  # Posts are spread over this many days up to now
+
+
+@dataclass
+class Dataset:
+    spec: DatasetSpec
+    user_ids: range
+    post_ids: range
+    viral_post_ids: list[int]
+
+
+def zipf_weights(count: int, skew: float, rng: random.Random) -> list[float]:
+    # Shuffled so popularity has nothing to do with the id
+    weights = [1 / rank**skew for rank in range(1, count + 1)]
+    rng.shuffle(weights)
+    return weights
+
+
+def text(rng: random.Random, low: int, high: int) -> str:
+    return " ".join(rng.choices(WORDS, k=rng.randint(low, high)))
+
+
+class DatasetGenerator:
+    """Rows of one dataset, appended after the given first ids."""
+
+    def __init__(self, spec: DatasetSpec, first_user_id: int, first_post_id: int):
+        if spec.likes > MAX_LIKE_DENSITY * spec.users * spec.posts:
+            raise ValueError(
+                f"More likes than {MAX_LIKE_DENSITY:.0%} of the (user, post) pairs"
+            )
+
+        self.spec = spec
+        self.rng = random.Random(spec.seed)
+        self.user_ids = range(first_user_id, first_user_id + spec.users)
+        self.post_ids = range(first_post_id, first_post_id + spec.posts)
+
+        self.user_weights = list(
+            accumulate(zipf_weights(spec.users, spec.skew, self.rng))
+        )
+        post_weights = zipf_weights(spec.posts, spec.skew, self.rng)
+        viral = self.rng.sample(range(spec.posts), round(spec.posts * spec.viral_share))
+        for index in viral:
+            post_weights[index] *= spec.viral_boost
+        self.viral_post_ids = sorted(self.post_ids[index] for index in viral)
+        self.post_weights = list(accumulate(post_weights))
+
+    def active_users(self, count: int) -> list[int]:
+        return self.rng.choices(self.user_ids, cum_weights=self.user_weights, k=count)
+
+    def popular_posts(self, count: int) -> list[int]:
+        return self.rng.choices(self.post_ids, cum_weights=self.post_weights, k=count)
+
+    def users(self, password_hash: str) -> Iterator[dict]:
+        for user_id in self.user_ids:
+            yield {
+                "id": user_id,
+                "email": f"user{user_id}@example.net",
+                "password": password_hash,
+                "confirmed": True,
+            }
+
+    def posts(self, now: float) -> Iterator[dict]:
+        # Ids follow creation time, as they do for posts written through the API
+        start = now - self.spec.days * 86400
+        times = sorted(self.rng.uniform(start, now) for _ in self.post_ids)
+        authors = self.active_users(self.spec.posts)
+        for post_id, user_id, created_at in zip(self.post_ids, authors, times):
+            yield {
+                "id": post_id,
+                "body": text(self.rng, 3, 40),
+                "user_id": user_id,
+                "created_at": created_at,
+            }
+
+    def comments(self) -> Iterator[dict]:
+        # Commented on in proportion to their likes
+        posts = self.popular_posts(self.spec.comments)
+        users = self.active_users(self.spec.comments)
+        for post_id, user_id in zip(posts, users):
+            yield {
+                "body": text(self.rng, 1, 20),
+                "post_id": post_id,
+                "user_id": user_id,
+            }
+
+    def likes(self) -> Iterator[dict]:
+        # Pairs are kept as one int each, a tuple per like would not fit in
+        # memory at millions of likes
+        seen: set[int] = set()
+        while len(seen) < self.spec.likes:
+            missing = self.spec.likes - len(seen)
+            pairs = zip(self.popular_posts(missing), self.active_users(missing))
+            for post_id, user_id in pairs:
+                # A user likes a post at most once, repeats are drawn again
+                pair = (user_id - self.user_ids.start) * self.spec.posts + (
+                    post_id - self.post_ids.start
+                )
+                if pair not in seen:
+                    seen.add(pair)
+                    yield {"post_id": post_id, "user_id": user_id}
+
+
+def batches(rows: Iterable[dict], size: int) -> Iterator[list[dict]]:
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+async def insert_rows(table: sqlalchemy.Table, rows: Iterable[dict]) -> int:
+    # The INSERT is compiled once: compiling a multi-row INSERT per batch
+    # takes SQLAlchemy longer than it takes sqlite to run it
+    total = 0
+    statement = None
+    async with database.connection() as connection:
+        for batch in batches(rows, BATCH_SIZE):
+            if statement is None:
+                statement = table.insert().compile(
+                    dialect=sqlite.dialect(), column_keys=list(batch[0])
+                )
+            values = [[row[key] for key in statement.positiontup] for row in batch]
+            await connection.raw_connection.executemany(statement.string, values)
+            total += len(batch)
+    logger.info(f"Inserted {total} rows into {table.name}")
+    return total
+
+
+async def next_id(table: sqlalchemy.Table) -> int:
+    query = sqlalchemy.select(sqlalchemy.func.max(table.c.id))
+    return (await database.fetch_val(query) or 0) + 1
+
+
+async def load_dataset(spec: DatasetSpec, now: float | None = None) -> Dataset:
+    """Insert a dataset after the rows already in the database.
+
+    Runs in one transaction, so a failed load leaves nothing behind.
+    """
+    now = time.time() if now is None else now
+    async with database.transaction():
+        generator = DatasetGenerator(
+            spec, await next_id(user_table), await next_id(post_table)
+        )
+        # Hashed once, every generated user logs in with the same password
+        await insert_rows(user_table, generator.users(get_password_hash(PASSWORD)))
+        await insert_rows(post_table, generator.posts(now))
+        await insert_rows(comment_table, generator.comments())
+        await insert_rows(like_table, generator.likes())
+
+    return Dataset(
+        spec, generator.user_ids, generator.post_ids, generator.viral_post_ids
+    )
+
+
+def parse_args(argv=None) -> DatasetSpec:
+    parser = argparse.ArgumentParser(prog="python -m app.datagen")
+    defaults = DatasetSpec()
+    for name, value in vars(defaults).items():
+        parser.add_argument(
+            f"--{name.replace('_', '-')}", type=type(value), default=value
+        )
+    return DatasetSpec(**vars(parser.parse_args(argv)))
+
+
+async def run(spec: DatasetSpec) -> None:
+    await database.connect()
+    try:
+        start = time.perf_counter()
+        dataset = await load_dataset(spec)
+        logger.info(
+            f"Loaded users {dataset.user_ids.start}-{dataset.user_ids.stop - 1} "
+            f"and posts {dataset.post_ids.start}-{dataset.post_ids.stop - 1} "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+    finally:
+        await database.disconnect()
+
+
+def main(argv=None) -> None:
+    spec = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    create_schema()
+    asyncio.run(run(spec))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+import anyio
+
+from app.profiling import route_label
+
+logger = logging.getLogger(__name__)
+
+# Per route label, reported by /admin/deadlines
+timeouts: Counter = Counter()  # A query ran out of time, answered 504
+rejections: Counter = Counter()  # No time was left to start a query, 503
+cancellations: Counter = Counter()  # The client went away before the response
+
+_current_deadline: ContextVar["Deadline | None"] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, route: str, started: bool) -> None:
+        super().__init__(f"{route} ran out of time")
+        self.route = route
+        # A query that was cut off is a timeout, one never sent is load shed
+        self.status_code = 504 if started else 503
+
+
+@dataclass
+class Deadline:
+    scope: dict = field(repr=False)
+    deadlines: dict[str, float] = field(repr=False)
+    default: float | None
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def route(self) -> str:
+        return route_label(self.scope)
+
+    def remaining(self) -> float | None:
+        # Looked up lazily as the route is only known once routing has happened
+        seconds = self.deadlines.get(self.route, self.default)
+        if seconds is None:
+            return None
+        return seconds - (time.monotonic() - self.started)
+
+
+def current_deadline() -> Deadline | None:
+    return _current_deadline.get()
+
+
+class DeadlineMiddleware:
+    """Bounds how long a request may spend on database calls.
+
+    The deadline starts when the request comes in; InstrumentedDatabase runs
+    every query with whatever is left of it. The request is also cancelled,
+    in-flight query included, as soon as the client disconnects.
+    """
+
+    def __init__(self, app, deadlines: dict[str, float], default: float | None):
+        self.app = app
+        self.deadlines = deadlines
+        self.default = default
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        deadline = Deadline(scope, self.deadlines, self.default)
+        token = _current_deadline.set(deadline)
+        # The watcher is the only reader of receive and reads at most one
+        # message ahead, so a slow reader still applies backpressure to uploads
+        send_message, receive_message = anyio.create_memory_object_stream(1)
+        response_sent = False
+
+        async def receive_from_watcher():
+            return await receive_message.receive()
+
+        async def send_and_track(message):
+            nonlocal response_sent
+            if message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                response_sent = True
+            await send(message)
+
+        async def watch_disconnect(cancel_scope: anyio.CancelScope) -> None:
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    break
+                await send_message.send(message)
+
+            # Servers also report a disconnect once the response is complete
+            if not response_sent:
+                logger.warning(f"Client disconnected from {deadline.route}")
+                cancellations[deadline.route] += 1
+                cancel_scope.cancel()
+                return
+            await send_message.send(message)
+
+        try:
+            async with anyio.create_task_group() as task_group:
+                task_group.start_soon(watch_disconnect, task_group.cancel_scope)
+                await self.app(scope, receive_from_watcher, send_and_track)
+                task_group.cancel_scope.cancel()
+        finally:
+            _current_deadline.reset(token)
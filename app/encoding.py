@@ -0,0 +1,64 @@
+from collections.abc import Iterable, Mapping
+
+import msgpack
+from fastapi import Response
+from fastapi.middleware.gzip import GZipMiddleware as BaseGZipMiddleware
+from pydantic import BaseModel
+
+MSGPACK = "application/x-msgpack"
+
+
+class MsgPackResponse(Response):
+    media_type = MSGPACK
+
+    def render(self, content) -> bytes:
+        return msgpack.packb(content)
+
+
+# Negotiated bodies depend on Accept, shared caches must key on it as well
+VARY_ACCEPT = {"Vary": "Accept"}
+
+
+def vary_on_accept(response: Response) -> None:
+    # Route dependency for the JSON branch; msgpack is returned as a response
+    # of its own and passes VARY_ACCEPT itself
+    response.headers["Vary"] = "Accept"
+
+
+def accepts_msgpack(accept: str | None) -> bool:
+    # JSON stays the default, only clients asking for msgpack by name get it
+    if not accept:
+        return False
+    return any(
+        media_range.split(";")[0].strip() == MSGPACK
+        for media_range in accept.split(",")
+    )
+
+
+def columnar(model: type[BaseModel], rows: Iterable[Mapping]) -> dict[str, list]:
+    """One list per field of model instead of one object per row.
+
+    Field names are sent once rather than on every row, which is most of
+    the bytes of a list of small rows. The fields come from the response
+    model so both formats describe the same data.
+    """
+    rows = list(rows)
+    return {name: [row[name] for row in rows] for name in model.model_fields}
+
+
+class GZipMiddleware(BaseGZipMiddleware):
+    """GZipMiddleware leaving the responses under some path prefixes alone.
+
+    Uploaded media is mostly compressed already, and its range responses
+    must stay byte ranges of the stored file.
+    """
+
+    def __init__(self, app, exclude_paths: tuple[str, ...] = (), **kwargs) -> None:
+        super().__init__(app, **kwargs)
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith(self.exclude_paths):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
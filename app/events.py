@@ -0,0 +1,134 @@
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from itertools import count
+
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Event:
+    type: str
+    data: dict
+    id: int = field(default_factory=count(1).__next__)
+
+    def encode(self) -> str:
+        # Server-sent events wire format
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data)}\n\n"
+
+
+# Sent in place of the buffered events to a subscriber that fell behind
+EVICTED = Event("evicted", {"reason": "slow consumer, resync and reconnect"})
+# Sent after the buffered events when the worker stops
+RESTARTING = Event("restarting", {"reason": "server restarting, reconnect"})
+
+
+class Subscription:
+    def __init__(self, hub: "EventHub", maxsize: int) -> None:
+        self.hub = hub
+        self.queue: asyncio.Queue[Event] = asyncio.Queue(maxsize)
+        self.evicted = False
+
+    def offer(self, event: Event) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.evict()
+
+    def evict(self) -> None:
+        logger.warning("Evicting slow event subscriber")
+        self.evicted = True
+        self.hub.unsubscribe(self)
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(EVICTED)
+
+    def close(self) -> None:
+        self.hub.unsubscribe(self)
+        try:
+            self.queue.put_nowait(RESTARTING)
+        except asyncio.QueueFull:
+            self.evict()
+
+    async def get(self) -> Event:
+        return await self.queue.get()
+
+
+class EventHub:
+    """In-process fan-out to subscribers, each with a bounded buffer.
+
+    Publishing never waits on a subscriber: one whose buffer is full is
+    evicted instead of slowing down the write path or growing without bound.
+    """
+
+    def __init__(self, buffer_size: int) -> None:
+        self.buffer_size = buffer_size
+        self.subscribers: set[Subscription] = set()
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(self, self.buffer_size)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self.subscribers.discard(subscription)
+
+    def dispatch(self, event: Event) -> None:
+        for subscription in list(self.subscribers):
+            subscription.offer(event)
+
+    def close(self) -> None:
+        # Ends every stream once it has sent what is buffered
+        for subscription in list(self.subscribers):
+            subscription.close()
+
+
+class Backplane(ABC):
+    """Carries events between app workers; each worker dispatches to its hub."""
+
+    def __init__(self, hub: EventHub) -> None:
+        self.hub = hub
+
+    @abstractmethod
+    async def publish(self, event: Event) -> None: ...
+
+
+class LocalBackplane(Backplane):
+    # Stand-in for a shared transport (e.g. Redis pub/sub): only reaches the
+    # subscribers of this worker
+    async def publish(self, event: Event) -> None:
+        self.hub.dispatch(event)
+
+
+BACKPLANES = {"local": LocalBackplane}
+
+hub = EventHub(buffer_size=config.EVENTS_BUFFER_SIZE)
+backplane: Backplane = BACKPLANES[config.EVENTS_BACKPLANE](hub)
+
+
+async def publish(type: str, data: dict) -> None:
+    await backplane.publish(Event(type, data))
+
+
+async def event_stream(
+    subscription: Subscription, heartbeat: float
+) -> AsyncIterator[str]:
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), heartbeat)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle connection
+                yield ": ping\n\n"
+                continue
+
+            yield event.encode()
+            if event is EVICTED or event is RESTARTING:
+                return
+    finally:
+        subscription.hub.unsubscribe(subscription)
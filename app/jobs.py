@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable
+
+import sqlalchemy
+
+from app.config import config
+from app.database import database, job_table
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[..., Awaitable[None]]
+
+
+class JobQueue:
+    """In-process worker pool over a durable job table.
+
+    Jobs are rows in job_table, so they survive restarts and are shared by
+    every app worker using the same database. A job is claimed with a single
+    UPDATE ... RETURNING that also sets a lease; if the worker dies the lease
+    expires and another worker picks the job up again.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int,
+        backoff: float,
+        lease: float,
+        poll_interval: float,
+    ) -> None:
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.handlers: dict[str, JobHandler] = {}
+        self._workers: list[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    def task(self, handler: JobHandler) -> JobHandler:
+        self.handlers[handler.__name__] = handler
+        return handler
+
+    async def enqueue(self, name: str, delay: float = 0.0, **payload) -> int:
+        query = job_table.insert().values(
+            name=name,
+            payload=payload,
+            status="pending",
+            attempts=0,
+            max_attempts=self.max_attempts,
+            run_at=time.time() + delay,
+        )
+
+        logger.debug(f"Enqueuing job {name}")
+
+        job_id = await database.execute(query)
+        self._wakeup.set()
+        return job_id
+
+    async def ensure_scheduled(self, name: str, delay: float = 0.0) -> None:
+        # Starts a job that re-enqueues itself unless one is already waiting,
+        # so every app worker can call it on startup
+        scheduled = sqlalchemy.exists().where(
+            job_table.c.name == name, job_table.c.status.in_(["pending", "running"])
+        )
+        values = sqlalchemy.select(
+            sqlalchemy.literal(name),
+            sqlalchemy.literal({}, sqlalchemy.JSON),
+            sqlalchemy.literal("pending"),
+            sqlalchemy.literal(0),
+            sqlalchemy.literal(self.max_attempts),
+            sqlalchemy.literal(time.time() + delay),
+        ).where(~scheduled)
+        query = job_table.insert().from_select(
+            ["name", "payload", "status", "attempts", "max_attempts", "run_at"], values
+        )
+        await database.execute(query)
+
+    async def get(self, job_id: int):
+        query = job_table.select().where(job_table.c.id == job_id)
+        return await database.fetch_one(query)
+
+    async def start(self, concurrency: int) -> None:
+        for number in range(concurrency):
+            worker = asyncio.create_task(self._work(), name=f"job-worker-{number}")
+            self._workers.append(worker)
+
+    async def stop(self, timeout: float = 0.0) -> None:
+        # Idle workers stop right away, busy ones get up to timeout to finish
+        # their job; a job cut short is retried once its lease runs out
+        self._stopping = True
+        self._wakeup.set()
+        if self._workers and timeout > 0:
+            _, running = await asyncio.wait(self._workers, timeout=timeout)
+            if running:
+                logger.warning(f"Cancelling {len(running)} running jobs")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        self._stopping = False
+
+    async def run_pending(self, now: float | None = None) -> int:
+        # Runs every due job inline, used when no workers are started (tests)
+        count = 0
+        while (job := await self._claim(now)) is not None:
+            await self._run(job, now)
+            count += 1
+        return count
+
+    async def _work(self) -> None:
+        while not self._stopping:
+            try:
+                job = await self._claim()
+            except Exception:
+                logger.exception("Claiming a job failed")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                if self._stopping:
+                    break
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._run(job)
+            except Exception:
+                # Recording the outcome failed; the lease brings the job back
+                logger.exception(f"Finishing job {job.id} ({job.name}) failed")
+
+    async def _claim(self, now: float | None = None):
+        now = time.time() if now is None else now
+        next_job = (
+            sqlalchemy.select(job_table.c.id)
+            .where(job_table.c.status.in_(["pending", "running"]))
+            .where(job_table.c.run_at <= now)
+            .order_by(job_table.c.run_at)
+            .limit(1)
+            .scalar_subquery()
+        )
+        query = (
+            job_table.update()
+            .where(job_table.c.id == next_job)
+            .values(
+                status="running",
+                attempts=job_table.c.attempts + 1,
+                run_at=now + self.lease,
+            )
+            .returning(*job_table.c)
+        )
+        return await database.fetch_one(query)
+
+    async def _run(self, job, now: float | None = None) -> None:
+        handler = self.handlers.get(job.name)
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for job {job.name}")
+            await handler(**job.payload)
+        except Exception as e:
+            await self._failed(job, e, now)
+        else:
+            query = (
+                job_table.update()
+                .where(job_table.c.id == job.id)
+                .values(status="done", last_error=None)
+            )
+            await database.execute(query)
+            logger.debug(f"Job {job.id} ({job.name}) done")
+
+    async def _failed(self, job, error: Exception, now: float | None) -> None:
+        now = time.time() if now is None else now
+        values = {"last_error": repr(error)}
+        if job.attempts >= job.max_attempts:
+            logger.error(f"Job {job.id} ({job.name}) failed for good: {error!r}")
+            values["status"] = "failed"
+        else:
+            # Exponential backoff with jitter so retries do not arrive in lockstep
+            delay = self.backoff * 2 ** (job.attempts - 1)
+            logger.warning(
+                f"Job {job.id} ({job.name}) failed, retrying in {delay:.1f}s: {error!r}"
+            )
+            values["status"] = "pending"
+            values["run_at"] = now + delay * random.uniform(1, 1.25)
+
+        query = job_table.update().where(job_table.c.id == job.id).values(**values)
+        await database.execute(query)
+
+
+job_queue = JobQueue(
+    max_attempts=config.JOB_MAX_ATTEMPTS,
+    backoff=config.JOB_RETRY_BACKOFF_SECONDS,
+    lease=config.JOB_LEASE_SECONDS,
+    poll_interval=config.JOB_POLL_INTERVAL_SECONDS,
+)
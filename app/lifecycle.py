@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import signal
+import threading
+from collections.abc import Callable
+
+from fastapi.responses import JSONResponse
+
+from app.events import hub
+
+logger = logging.getLogger(__name__)
+
+
+class Drain:
+    """How far a worker is into stopping, and the requests it still serves.
+
+    Draining starts by failing the readiness check while requests are still
+    served, so the load balancer stops sending new ones. Then the worker
+    stops accepting: new requests are turned away and the event streams are
+    ended so their clients reconnect to another worker.
+    """
+
+    def __init__(self) -> None:
+        self.draining = False
+        self.accepting = True
+        self.in_flight = 0
+        # Set by app.server, whose server stops accepting on its own schedule
+        self.server_managed = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def begin(self) -> None:
+        if not self.draining:
+            logger.info("Draining, readiness checks fail from now on")
+            self.draining = True
+
+    def stop_accepting(self) -> None:
+        self.begin()
+        if self.accepting:
+            logger.info(f"No longer accepting requests, {self.in_flight} in flight")
+            self.accepting = False
+            hub.close()
+
+    def started(self) -> None:
+        self.in_flight += 1
+        self._idle.clear()
+
+    def finished(self) -> None:
+        self.in_flight -= 1
+        if not self.in_flight:
+            self._idle.set()
+
+    async def wait_idle(self, timeout: float) -> bool:
+        # False when requests were still running at the timeout
+        if not self.in_flight:
+            return True
+        try:
+            await asyncio.wait_for(self._idle.wait(), max(timeout, 0))
+        except asyncio.TimeoutError:
+            logger.warning(f"Stopping with {self.in_flight} requests in flight")
+            return False
+        return True
+
+    def reset(self) -> None:
+        self.draining = False
+        self.accepting = True
+
+
+drain = Drain()
+
+
+def stop_accepting_on_signals(drain: Drain) -> Callable[[], None]:
+    """Stop accepting as soon as the server is told to exit.
+
+    uvicorn runs lifespan shutdown only once every connection has closed,
+    and the event streams never close on their own. Returns a function
+    putting the previous signal handlers back.
+    """
+    if (
+        drain.server_managed
+        or threading.current_thread() is not threading.main_thread()
+    ):
+        return lambda: None
+
+    loop = asyncio.get_running_loop()
+    previous = {}
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        handler = signal.getsignal(sig)
+        if not callable(handler):
+            continue
+
+        def stop(signum, frame, handler=handler):
+            loop.call_soon_threadsafe(drain.stop_accepting)
+            handler(signum, frame)
+
+        previous[sig] = signal.signal(sig, stop)
+
+    def restore() -> None:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+
+    return restore
+
+
+class DrainMiddleware:
+    # Counts the requests in flight and turns new ones away once the worker
+    # stops accepting; the health checks are always answered
+
+    def __init__(self, app, drain: Drain, exempt_paths: tuple[str, ...] = ()) -> None:
+        self.app = app
+        self.drain = drain
+        self.exempt_paths = exempt_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exempt_paths):
+            await self.app(scope, receive, send)
+            return
+
+        if not self.drain.accepting:
+            response = JSONResponse(
+                {"detail": "Server shutting down"},
+                status_code=503,
+                headers={"Retry-After": "1", "Connection": "close"},
+            )
+            await response(scope, receive, send)
+            return
+
+        self.drain.started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.drain.finished()
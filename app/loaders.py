@@ -0,0 +1,65 @@
+import logging
+from collections.abc import Iterable, Sequence
+
+import sqlalchemy
+
+from app.cache import RecentDict
+from app.config import config
+from app.database import database, user_table
+from app.models.user import Author
+
+logger = logging.getLogger(__name__)
+
+# Emails never change, so an author once loaded stays valid
+author_cache = RecentDict(maxsize=config.AUTHOR_CACHE_SIZE)
+
+
+def display_name(email: str) -> str:
+    # "testemail@example.net" -> "te***@example.net"
+    local, _, domain = email.partition("@")
+    return f"{local[:2]}***@{domain}"
+
+
+class UserLoader:
+    """Resolves user ids to authors, batching the lookups of one request.
+
+    Every id is looked up in the shared author cache first; whatever is
+    missing is fetched with a single IN query however many rows need it.
+    """
+
+    def __init__(self, cache: RecentDict) -> None:
+        self.cache = cache
+
+    async def load_many(self, user_ids: Iterable[int]) -> dict[int, Author]:
+        authors = {}
+        missing = set()
+        for user_id in set(user_ids):
+            author = self.cache.get(user_id)
+            if author is None:
+                missing.add(user_id)
+            else:
+                authors[user_id] = author
+
+        if missing:
+            logger.debug(f"Loading {len(missing)} authors")
+            query = sqlalchemy.select(user_table.c.id, user_table.c.email).where(
+                user_table.c.id.in_(missing)
+            )
+            for user in await database.fetch_all(query):
+                author = Author(id=user.id, name=display_name(user.email))
+                self.cache.set(user.id, author)
+                authors[user.id] = author
+
+        return authors
+
+
+async def with_authors(rows: Sequence) -> list[dict]:
+    authors = await UserLoader(author_cache).load_many(row.user_id for row in rows)
+    embedded = []
+    for row in rows:
+        # A user deleted after the row was read has no author to embed
+        author = authors.get(row.user_id)
+        embedded.append(
+            {**row._mapping, "author": author.model_dump() if author else None}
+        )
+    return embedded
@@ -1,7 +1,7 @@
 import logging
 from logging.config import dictConfig
 
-from app.config import DevConfig, ProdConfig, config
+from app.config import DevConfig, ProdConfig, config, reload_hooks
 
 HANDLERS = ["default", "rotating_file"]
 
@@ -27,6 +27,39 @@ class EmailObfuscationFilter(logging.Filter):
         return True
 
 
+def build_handlers() -> dict:
+    # dictConfig imports the class of every handler it is given, so only the
+    # handlers actually in use are declared (logtail is prod only)
+    handlers = {
+        "default": {
+            "class": "rich.logging.RichHandler",
+            "level": "DEBUG",
+            "formatter": "console",
+            "filters": ["correlation_id", "email_obfuscation"],
+        },
+        "rotating_file": {
+            "class": "logging.handlers.RotatingFileHandler",
+            "level": "DEBUG",
+            "formatter": "file",
+            "filename": "storeapi.log",
+            "maxBytes": 1024 * 1025 * 2,  # 2 megabytes
+            "backupCount": 5,
+            "encoding": "utf8",
+            "filters": ["correlation_id", "email_obfuscation"],
+        },
+    }
+    if "logtail" in HANDLERS:
+        handlers["logtail"] = {
+            "class": "logtail.LogtailHandler",
+            "host": config.LOGTAIL_HOST,
+            "level": "DEBUG",
+            "formatter": "console",
+            "filters": ["correlation_id", "email_obfuscation"],
+            "source_token": config.LOGTAIL_API_KEY,
+        }
+    return handlers
+
+
 def configure_logging() -> None:
     dictConfig(
         {
@@ -58,41 +91,43 @@ def configure_logging() -> None:
                 # z iso format
                 # -8s always 8 characters long
             },
-            "handlers": {
-                "default": {
-                    "class": "rich.logging.RichHandler",
-                    "level": "DEBUG",
-                    "formatter": "console",
-                    "filters": ["correlation_id", "email_obfuscation"],
-                },
-                "logtail": {
-                    "class": "logtail.LogtailHandler",
-                    "host": config.LOGTAIL_HOST,
-                    "level": "DEBUG",
-                    "formatter": "console",
-                    "filters": ["correlation_id", "email_obfuscation"],
-                    "source_token": config.LOGTAIL_API_KEY,
-                },
-                "rotating_file": {
-                    "class": "logging.handlers.RotatingFileHandler",
-                    "level": "DEBUG",
-                    "formatter": "file",
-                    "filename": "storeapi.log",
-                    "maxBytes": 1024 * 1025 * 2,  # 2 megabytes
-                    "backupCount": 5,
-                    "encoding": "utf8",
-                    "filters": ["correlation_id", "email_obfuscation"],
-                },
-            },
+            "handlers": build_handlers(),
             "loggers": {
-                "uvicorn": {"handlers": ["default", "rotating_file"], "level": "INFO"},
+                "uvicorn": {"handlers": ["default", "rotating_file"]},
                 "app": {  # root.storeapi.routers.post
                     "handlers": HANDLERS,
-                    "level": "DEBUG" if isinstance(config, DevConfig) else "INFO",
                     "propagate": False,
                 },
-                "databases": {"handlers": ["default"], "level": "WARNING"},
-                "aiosqlite": {"handlers": ["default"], "level": "WARNING"},
+                "databases": {"handlers": ["default"]},
+                "aiosqlite": {"handlers": ["default"]},
             },
         }
     )
+    apply_log_levels()
+
+
+# Loggers given a level from LOG_LEVELS, so a reload can take it back
+levelled: set[str] = set()
+
+
+def apply_log_levels(changed: set[str] | None = None) -> None:
+    if changed is None or "LOG_LEVELS" in changed:
+        # Loggers no longer listed inherit their parent's level again
+        for name in levelled - set(config.LOG_LEVELS):
+            logging.getLogger(name).setLevel(logging.NOTSET)
+        for name, level in config.LOG_LEVELS.items():
+            logging.getLogger(name).setLevel(level)
+        levelled.clear()
+        levelled.update(config.LOG_LEVELS)
+
+
+reload_hooks.append(apply_log_levels)
+
+
+def flush_logs() -> None:
+    # Handlers that batch (logtail) send what they hold before the worker exits
+    handlers = set(logging.getLogger().handlers)
+    for logger in logging.Logger.manager.loggerDict.values():
+        handlers.update(getattr(logger, "handlers", ()))
+    for handler in handlers:
+        handler.flush()
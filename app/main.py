@@ -1,12 +1,29 @@
 import logging
+import os
+import time
 from contextlib import asynccontextmanager
 
 from asgi_correlation_id import CorrelationIdMiddleware
 from fastapi import FastAPI, HTTPException
 from fastapi.exception_handlers import http_exception_handler
+from fastapi.responses import JSONResponse
 
-from app.database import database
-from app.logging_conf import configure_logging
+from app import tasks  # noqa: F401 - registers the job handlers
+from app.config import config
+from app.database import SCHEMA_READY_ENV, create_schema, database
+from app.deadlines import DeadlineExceeded, DeadlineMiddleware
+from app.encoding import GZipMiddleware
+from app.jobs import job_queue
+from app.lifecycle import DrainMiddleware, drain, stop_accepting_on_signals
+from app.logging_conf import configure_logging, flush_logs
+from app.profiling import ProfilingMiddleware, profiler
+from app.query_counter import QueryCounterMiddleware
+from app.rate_limit import RateLimitMiddleware, create_bucket_store
+from app.routers.admin import router as admin_router
+from app.routers.changes import router as changes_router
+from app.routers.events import router as events_router
+from app.routers.health import router as health_router
+from app.routers.media import router as media_router
 from app.routers.post import router as post_router
 from app.routers.user import router as user_router
 
@@ -16,16 +33,68 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     configure_logging()
+    if not os.environ.get(SCHEMA_READY_ENV):
+        create_schema()
+    drain.reset()
     await database.connect()  # setup
+    await job_queue.start(config.JOB_WORKERS)
+    # Not at delay 0, a restart would otherwise recount everything right away
+    await job_queue.ensure_scheduled(
+        "check_user_stats_periodically",
+        delay=config.USER_STATS_CHECK_INTERVAL_SECONDS,
+    )
+    restore_signals = stop_accepting_on_signals(drain)
     yield
-    await database.disconnect()  # teardown
+    # Servers wait for open connections before this runs, so the event
+    # streams were ended when the exit was signalled (app.server fails
+    # readiness first); whatever is still in flight and the running jobs
+    # share SHUTDOWN_TIMEOUT_SECONDS
+    restore_signals()
+    drain.stop_accepting()
+    finish_by = time.monotonic() + config.SHUTDOWN_TIMEOUT_SECONDS
+    await drain.wait_idle(finish_by - time.monotonic())
+    await job_queue.stop(timeout=finish_by - time.monotonic())
+    flush_logs()
+    await database.disconnect()  # teardown, nothing is using the pool anymore
 
 
 app = FastAPI(lifespan=lifespan)
 
 app.include_router(post_router)
 app.include_router(user_router)
+app.include_router(admin_router)
+app.include_router(events_router)
+app.include_router(changes_router)
+app.include_router(media_router)
+app.include_router(health_router)
 
+app.add_middleware(
+    DeadlineMiddleware,
+    deadlines=config.ROUTE_DEADLINES,
+    default=config.REQUEST_DEADLINE_SECONDS,
+)
+if config.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+if config.QUERY_BUDGET_MODE != "off":
+    app.add_middleware(QueryCounterMiddleware, mode=config.QUERY_BUDGET_MODE)
+if config.RATE_LIMIT_ENABLED:
+    app.add_middleware(
+        RateLimitMiddleware,
+        store=create_bucket_store(
+            config.RATE_LIMIT_BACKEND,
+            config.RATE_LIMIT_SQLITE_PATH,
+            config.RATE_LIMIT_MAX_KEYS,
+        ),
+        limits=config.RATE_LIMITS,
+        concurrency=config.ROUTE_CONCURRENCY,
+    )
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=config.GZIP_MIN_SIZE,
+    compresslevel=config.GZIP_LEVEL,
+    exclude_paths=("/media/",),
+)
+app.add_middleware(DrainMiddleware, drain=drain, exempt_paths=("/health/",))
 app.add_middleware(CorrelationIdMiddleware)
 
 
@@ -33,3 +102,11 @@ app.add_middleware(CorrelationIdMiddleware)
 async def http_exception_handle_logging(request, exc):
     logger.error(f"HTTPException: {exc.status_code} {exc.detail}")
     return await http_exception_handler(request, exc)
+
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request, exc):
+    logger.error(f"DeadlineExceeded: {exc.status_code} {exc}")
+    return JSONResponse(
+        {"detail": "Request took too long"}, status_code=exc.status_code
+    )
@@ -0,0 +1,230 @@
+import contextlib
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+import anyio
+from fastapi import Response
+from fastapi.responses import FileResponse
+
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+ORIGINAL = ""
+THUMBNAIL = ".thumbnail.jpg"
+
+OCTET_STREAM = "application/octet-stream"
+
+
+class MediaTooLarge(Exception):
+    pass
+
+
+class MediaNotFound(Exception):
+    pass
+
+
+@dataclass
+class StoredMedia:
+    digest: str
+    size: int
+    created: bool  # False when the same content was stored before
+
+
+def safe_media_type(content_type: str) -> str:
+    # Files are served from the app's own origin, so a type a browser would
+    # run (text/html, image/svg+xml) would let an upload script the app
+    if content_type in config.MEDIA_SAFE_TYPES:
+        return content_type
+    return OCTET_STREAM
+
+
+def media_headers(media_type: str) -> dict[str, str]:
+    headers = {
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "X-Content-Type-Options": "nosniff",
+    }
+    if not media_type.startswith("image/"):
+        headers["Content-Disposition"] = "attachment"
+    return headers
+
+
+def make_temp_file(directory: Path) -> str:
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory)
+    os.close(fd)
+    return temp_path
+
+
+def move_into_place(temp_path: str, path: Path) -> bool:
+    # False when the same content was stored before, the copy is dropped
+    if path.exists():
+        os.unlink(temp_path)
+        return False
+    path.parent.mkdir(exist_ok=True)
+    os.replace(temp_path, path)
+    return True
+
+
+def remove_file(path: str) -> None:
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+
+
+class MediaStore(ABC):
+    """Content-addressed storage: files are kept once, under their SHA-256.
+
+    Uploads are streamed in and hashed on the way, so a file never has to
+    fit in memory. The read and write methods other than save are blocking
+    and meant for worker threads.
+    """
+
+    @abstractmethod
+    async def save(self, chunks: AsyncIterator[bytes], max_bytes: int) -> StoredMedia:
+        """Store the uploaded chunks, raising MediaTooLarge past max_bytes."""
+
+    @abstractmethod
+    def exists(self, digest: str, variant: str = ORIGINAL) -> bool: ...
+
+    @abstractmethod
+    def read(self, digest: str, variant: str = ORIGINAL) -> bytes: ...
+
+    @abstractmethod
+    def open(self, digest: str, variant: str = ORIGINAL) -> BinaryIO: ...
+
+    @abstractmethod
+    def write(self, digest: str, variant: str, data: bytes) -> None: ...
+
+    @abstractmethod
+    async def response(self, digest: str, variant: str, media_type: str) -> Response:
+        """How the file is sent, e.g. a redirect to object storage.
+
+        Raises MediaNotFound when the stored file is missing.
+        """
+
+
+class LocalMediaStore(MediaStore):
+    # Stand-in for object storage, kept on the local disk under root
+
+    def __init__(self, root: str, accel_redirect: str | None = None) -> None:
+        self.root = Path(root)
+        # With nginx in front, the files are handed to it to send
+        self.accel_redirect = accel_redirect
+
+    def path(self, digest: str, variant: str = ORIGINAL) -> Path:
+        return self.root / digest[:2] / f"{digest}{variant}"
+
+    async def save(self, chunks: AsyncIterator[bytes], max_bytes: int) -> StoredMedia:
+        # Every filesystem call runs on a worker thread, a slow disk must not
+        # hold up the event loop
+        temp_path = await anyio.to_thread.run_sync(
+            make_temp_file, self.root / "incoming"
+        )
+
+        sha256 = hashlib.sha256()
+        size = 0
+        try:
+            # Written from a worker thread chunk by chunk, the body is only
+            # read as fast as the disk takes it
+            async with await anyio.open_file(temp_path, "wb") as file:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise MediaTooLarge(f"Uploads are limited to {max_bytes} bytes")
+                    sha256.update(chunk)
+                    await file.write(chunk)
+
+            digest = sha256.hexdigest()
+            created = await anyio.to_thread.run_sync(
+                move_into_place, temp_path, self.path(digest)
+            )
+            return StoredMedia(digest, size, created)
+        except BaseException:
+            # Also when the upload was cancelled, the partial file is removed
+            with anyio.CancelScope(shield=True):
+                await anyio.to_thread.run_sync(remove_file, temp_path)
+            raise
+
+    def exists(self, digest: str, variant: str = ORIGINAL) -> bool:
+        return self.path(digest, variant).exists()
+
+    def read(self, digest: str, variant: str = ORIGINAL) -> bytes:
+        return self.path(digest, variant).read_bytes()
+
+    def open(self, digest: str, variant: str = ORIGINAL) -> BinaryIO:
+        return self.path(digest, variant).open("rb")
+
+    def write(self, digest: str, variant: str, data: bytes) -> None:
+        path = self.path(digest, variant)
+        temp_path = path.with_name(f".{path.name}")
+        temp_path.write_bytes(data)
+        os.replace(temp_path, path)
+
+    async def response(self, digest: str, variant: str, media_type: str) -> Response:
+        media_type = safe_media_type(media_type)
+        headers = media_headers(media_type)
+        if self.accel_redirect:
+            location = f"{self.accel_redirect}/{digest[:2]}/{digest}{variant}"
+            return Response(
+                media_type=media_type,
+                headers={**headers, "X-Accel-Redirect": location},
+            )
+
+        path = self.path(digest, variant)
+        try:
+            stat_result = await anyio.to_thread.run_sync(os.stat, path)
+        except FileNotFoundError as e:
+            raise MediaNotFound(f"{digest}{variant}") from e
+
+        # Range requests are answered by FileResponse, which also hands the
+        # file to servers supporting the pathsend extension
+        return FileResponse(
+            path, media_type=media_type, headers=headers, stat_result=stat_result
+        )
+
+
+STORES = {"local": LocalMediaStore}
+
+store: MediaStore = STORES[config.MEDIA_BACKEND](
+    config.MEDIA_ROOT, config.MEDIA_ACCEL_REDIRECT
+)
+
+# Resizing is CPU bound, it runs on a few threads rather than the event loop
+thumbnail_limiter = anyio.CapacityLimiter(config.MEDIA_THUMBNAIL_WORKERS)
+
+
+def render_thumbnail(source: BinaryIO, size: int) -> bytes:
+    from PIL import Image  # Imported by the workers making thumbnails only
+
+    with Image.open(source) as image:
+        image.thumbnail((size, size))
+        output = io.BytesIO()
+        image.convert("RGB").save(output, "JPEG", quality=85)
+    return output.getvalue()
+
+
+async def create_thumbnail(digest: str) -> bool:
+    from PIL import Image
+
+    def work() -> bool:
+        # Read from the file as Pillow decodes, not loaded whole beforehand
+        with store.open(digest) as source:
+            try:
+                thumbnail = render_thumbnail(source, config.MEDIA_THUMBNAIL_SIZE)
+            except (OSError, Image.DecompressionBombError) as e:
+                # Unreadable, truncated or too many pixels: the same every
+                # time, so the job is not failed to be retried
+                logger.warning(f"No thumbnail for {digest}: {e!r}")
+                return False
+        store.write(digest, THUMBNAIL, thumbnail)
+        return True
+
+    return await anyio.to_thread.run_sync(work, limiter=thumbnail_limiter)
@@ -0,0 +1,18 @@
+from typing import List, Literal
+
+from pydantic import BaseModel, ConfigDict
+
+
+class Change(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    seq: int
+    entity: Literal["post", "comment", "like"]
+    op: Literal["upsert", "delete"]
+    data: dict
+
+
+class ChangeBatch(BaseModel):
+    changes: List[Change]
+    cursor: int  # Pass back as since to get the next batch
+    has_more: bool
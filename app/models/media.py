@@ -0,0 +1,8 @@
+from pydantic import BaseModel
+
+
+class Media(BaseModel):
+    digest: str
+    size: int
+    content_type: str
+    url: str
@@ -1,10 +1,13 @@
-from typing import List
+from typing import List, Optional
 
 from pydantic import BaseModel, ConfigDict
 
+from app.models.user import Author
+
 
 class UserPostIn(BaseModel):
     body: str
+    media: List[str] = []  # Digests returned by POST /media
 
 
 class UserPost(UserPostIn):
@@ -20,9 +23,14 @@ class UserPostWithLikes(UserPost):
     likes: int = 0
 
 
+class UserPostWithAuthor(UserPostWithLikes):
+    author: Optional[Author] = None
+
+
 class CommentIn(BaseModel):
     body: str
     post_id: int
+    parent_id: Optional[int] = None  # Replies to this comment of the same post
 
 
 class Comment(CommentIn):
@@ -30,6 +38,12 @@ class Comment(CommentIn):
 
     id: int
     user_id: int
+    depth: int = 0  # Top-level comments are at 0
+    replies: int = 0  # All replies below, at any depth
+
+
+class CommentWithAuthor(Comment):
+    author: Optional[Author] = None
 
 
 class UserPostWithComments(BaseModel):
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class User(BaseModel):
@@ -8,3 +8,19 @@ class User(BaseModel):
 
 class UserIn(User):
     password: str
+
+
+class Author(BaseModel):
+    # What other users get to see of the user behind a post or comment
+    id: int
+    name: str
+
+
+class UserStats(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    user_id: int
+    posts: int
+    comments: int
+    likes_given: int
+    likes_received: int
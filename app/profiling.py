@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+
+from app.config import config, reload_hooks
+
+logger = logging.getLogger(__name__)
+
+
+def route_label(scope: dict) -> str:
+    # FastAPI stores the matched route on the scope once routing has happened,
+    # so samples taken before that fall back to the raw path
+    route = scope.get("route")
+    path = getattr(route, "path", None) or scope.get("path", "-")
+    return f"{scope.get('method', '-')} {path}"
+
+
+def frame_label(frame: FrameType) -> str:
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{frame.f_code.co_name}"
+
+
+class SamplingProfiler:
+    """Statistical profiler producing collapsed stacks tagged by route.
+
+    Request coroutine frames are registered by the middleware; a daemon thread
+    periodically walks every thread's stack and records a sample whenever it
+    finds a registered frame, so only requests running on the CPU are counted.
+    """
+
+    def __init__(
+        self, interval: float, max_stacks: int, sample_rate: float = 0.0
+    ) -> None:
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.sample_rate = sample_rate  # Fraction of requests profiled continuously
+        self.samples: Counter = Counter()
+        self.dropped = 0
+        self._active: dict[FrameType, dict] = {}
+        self._captures: list[Counter] = []
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def capturing(self) -> bool:
+        return bool(self._captures)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def register(self, frame: FrameType, scope: dict) -> None:
+        self.start()
+        self._active[frame] = scope
+
+    def unregister(self, frame: FrameType) -> None:
+        self._active.pop(frame, None)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.samples.clear()
+            self.dropped = 0
+
+    def collapsed(self, samples: Counter | None = None) -> str:
+        samples = self.samples if samples is None else samples
+        with self._lock:
+            lines = [f"{stack} {count}" for stack, count in samples.most_common()]
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    async def capture(self, seconds: float) -> str:
+        # Profiles every request for the given window on top of the sampled ones
+        samples: Counter = Counter()
+        self._captures.append(samples)
+        self.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self._captures.remove(samples)
+        return self.collapsed(samples)
+
+    def _run(self) -> None:
+        own_thread = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            if not self._active:
+                continue
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_thread:
+                    self._sample(frame)
+
+    def _sample(self, frame: FrameType) -> None:
+        stack = []
+        while frame is not None:
+            scope = self._active.get(frame)
+            if scope is not None:
+                stack.append(route_label(scope))
+                self._record(";".join(reversed(stack)))
+                return
+            stack.append(frame_label(frame))
+            frame = frame.f_back
+
+    def _record(self, stack: str) -> None:
+        with self._lock:
+            for samples in (self.samples, *self._captures):
+                if stack in samples or len(samples) < self.max_stacks:
+                    samples[stack] += 1
+                else:
+                    self.dropped += 1
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, profiler: SamplingProfiler) -> None:
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (
+            self.profiler.capturing or random.random() < self.profiler.sample_rate
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        # Downstream handlers run in this task, so their frames sit on top of ours
+        frame = sys._getframe()
+        self.profiler.register(frame, scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.unregister(frame)
+
+
+profiler = SamplingProfiler(
+    interval=config.PROFILING_INTERVAL_MS / 1000,
+    max_stacks=config.PROFILING_MAX_STACKS,
+    sample_rate=config.PROFILING_SAMPLE_RATE,
+)
+
+
+def apply_sample_rate(changed: set[str]) -> None:
+    profiler.sample_rate = config.PROFILING_SAMPLE_RATE
+
+
+reload_hooks.append(apply_sample_rate)
@@ -0,0 +1,101 @@
+import logging
+from collections import OrderedDict
+from collections.abc import Callable
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Literal
+
+from asgi_correlation_id import correlation_id
+
+from app.config import config
+from app.profiling import route_label
+
+logger = logging.getLogger(__name__)
+
+QueryBudgetMode = Literal["off", "warn", "raise"]
+
+# Called with the stats of every finished request, used by the test suite
+listeners: list[Callable[["QueryStats"], None]] = []
+
+recent: "OrderedDict[str, QueryStats]" = OrderedDict()
+
+_current_stats: ContextVar["QueryStats | None"] = ContextVar(
+    "query_stats", default=None
+)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+@dataclass
+class QueryStats:
+    correlation_id: str
+    scope: dict = field(repr=False)
+    mode: QueryBudgetMode = "warn"
+    count: int = 0
+
+    @property
+    def route(self) -> str:
+        return route_label(self.scope)
+
+    @property
+    def budget(self) -> int | None:
+        return getattr(self.scope.get("endpoint"), "__query_budget__", None)
+
+    @property
+    def exceeded(self) -> bool:
+        return self.budget is not None and self.count > self.budget
+
+
+def query_budget(max_queries: int):
+    # Declares how many database round trips a route is allowed per request
+    def decorator(endpoint):
+        endpoint.__query_budget__ = max_queries
+        return endpoint
+
+    return decorator
+
+
+def record_query(query) -> None:
+    stats = _current_stats.get()
+    if stats is None:
+        return
+
+    stats.count += 1
+    if stats.mode == "raise" and stats.exceeded:
+        raise QueryBudgetExceeded(
+            f"{stats.route} exceeded its budget of {stats.budget} queries: {query}"
+        )
+
+
+class QueryCounterMiddleware:
+    def __init__(self, app, mode: QueryBudgetMode) -> None:
+        self.app = app
+        self.mode = mode
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats(correlation_id.get() or "-", scope, self.mode)
+        token = _current_stats.set(stats)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_stats.reset(token)
+            self._finish(stats)
+
+    def _finish(self, stats: QueryStats) -> None:
+        recent[stats.correlation_id] = stats
+        while len(recent) > config.QUERY_STATS_RECENT_REQUESTS:
+            recent.popitem(last=False)
+
+        if stats.exceeded:
+            logger.warning(
+                f"{stats.route} ran {stats.count} queries, budget is {stats.budget}"
+            )
+
+        for listener in listeners:
+            listener(stats)
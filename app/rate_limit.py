@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import math
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from app.security import get_subject_for_token_type
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass(frozen=True)
+class Rate:
+    requests: int
+    period: float
+
+    @classmethod
+    def parse(cls, value: str) -> "Rate":
+        # "10/minute" -> 10 requests refilled evenly over 60 seconds
+        requests, period = value.split("/")
+        return cls(int(requests), PERIODS[period.strip()])
+
+    @property
+    def per_second(self) -> float:
+        return self.requests / self.period
+
+
+def refill(
+    tokens: float, updated: float, now: float, rate: Rate
+) -> tuple[float, float]:
+    # Returns the remaining tokens and how long to wait if the request is denied
+    tokens = min(rate.requests, tokens + (now - updated) * rate.per_second)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate.per_second
+
+
+class BucketStore(ABC):
+    @abstractmethod
+    async def take(self, key: str, rate: Rate) -> float:
+        """Take a token from the bucket, returning 0 or the seconds to retry after."""
+
+
+class MemoryBucketStore(BucketStore):
+    def __init__(self, max_keys: int = 100_000) -> None:
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def take(self, key: str, rate: Rate, now: float | None = None) -> float:
+        now = time.monotonic() if now is None else now
+        tokens, updated = self._buckets.pop(key, (rate.requests, now))
+        tokens, retry_after = refill(tokens, updated, now, rate)
+
+        # Evicting the least recently used bucket only ever makes a client whole
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+class SQLiteBucketStore(BucketStore):
+    """Buckets shared by every worker on the host.
+
+    Stand-in for a networked store such as Redis: each take is a single
+    short write transaction, run off the event loop. Buckets are deleted
+    once they have refilled, a missing bucket being a full one.
+    """
+
+    def __init__(
+        self, path: str, timeout: float = 1.0, prune_interval: float = 60.0
+    ) -> None:
+        self.path = path
+        self.timeout = timeout  # Longest wait for another worker's write lock
+        self.prune_interval = prune_interval
+        self._lock = threading.Lock()
+        self._connection: sqlite3.Connection | None = None
+        self._pruned = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        # Opened on first use so a preforking launcher never shares it
+        connection = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        # full_at is when the bucket is back to its rate's size, whatever
+        # the rate, so refilled buckets are found without knowing it
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets (key TEXT PRIMARY KEY, "
+            "tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS ix_rate_buckets_full_at "
+            "ON rate_buckets (full_at)"
+        )
+        return connection
+
+    async def take(self, key: str, rate: Rate, now: float | None = None) -> float:
+        now = time.time() if now is None else now
+        try:
+            return await asyncio.to_thread(self._take, key, rate, now)
+        except sqlite3.OperationalError as e:
+            # Locked by the other workers for too long: the request goes
+            # through unlimited rather than failing on the limiter
+            logger.warning(f"Not rate limiting {key}: {e}")
+            return 0.0
+
+    def _take(self, key: str, rate: Rate, now: float) -> float:
+        with self._lock:
+            if self._connection is None:
+                self._connection = self._connect()
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                if now - self._pruned >= self.prune_interval:
+                    self._connection.execute(
+                        "DELETE FROM rate_buckets WHERE full_at <= ?", (now,)
+                    )
+                    self._pruned = now
+                row = self._connection.execute(
+                    "SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens, updated = row or (rate.requests, now)
+                tokens, retry_after = refill(tokens, updated, now, rate)
+                full_at = now + (rate.requests - tokens) / rate.per_second
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO rate_buckets VALUES (?, ?, ?, ?)",
+                    (key, tokens, now, full_at),
+                )
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+            return retry_after
+
+
+def create_bucket_store(backend: str, path: str, max_keys: int) -> BucketStore:
+    if backend == "sqlite":
+        return SQLiteBucketStore(path)
+    return MemoryBucketStore(max_keys)
+
+
+def bearer_subject(scope: dict) -> str | None:
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer":
+                return None
+            try:
+                return get_subject_for_token_type(token, "access")
+            except HTTPException:
+                return None
+    return None
+
+
+class RateLimitMiddleware:
+    """Admission control in front of the routers.
+
+    Requests are rejected before they reach any handler, so a throttled
+    client never costs a database round trip or a password hash.
+    """
+
+    def __init__(
+        self,
+        app,
+        store: BucketStore,
+        limits: dict[str, str],
+        concurrency: dict[str, int],
+    ) -> None:
+        self.app = app
+        self.store = store
+        self.limits = {route: Rate.parse(rate) for route, rate in limits.items()}
+        self.concurrency = concurrency
+        self.in_flight: dict[str, int] = {route: 0 for route in concurrency}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = f"{scope['method']} {scope['path']}"
+
+        rate = self.limits.get(route)
+        if rate is not None:
+            retry_after = await self.store.take(self._client_key(route, scope), rate)
+            if retry_after:
+                logger.warning(f"Rate limited {route}")
+                response = self._reject(429, "Too many requests", retry_after)
+                await response(scope, receive, send)
+                return
+
+        limit = self.concurrency.get(route)
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Shed load instead of queueing behind work we cannot finish in time
+        if self.in_flight[route] >= limit:
+            logger.warning(f"Shedding load on {route}")
+            await self._reject(503, "Server busy", 1)(scope, receive, send)
+            return
+
+        self.in_flight[route] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight[route] -= 1
+
+    def _client_key(self, route: str, scope: dict) -> str:
+        subject = bearer_subject(scope)
+        if subject is not None:
+            return f"{route}|user:{subject}"
+        client = scope.get("client")
+        return f"{route}|ip:{client[0] if client else '-'}"
+
+    def _reject(self, status_code: int, detail: str, retry_after: float):
+        return JSONResponse(
+            {"detail": detail},
+            status_code=status_code,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
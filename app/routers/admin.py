@@ -0,0 +1,94 @@
+import json
+import logging
+
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from pydantic import ValidationError
+
+from app import deadlines, singleflight
+from app.config import config, reload_config
+from app.jobs import job_queue
+from app.models.job import Job
+from app.profiling import profiler
+from app.query_counter import query_budget
+from app.security import require_admin
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+@query_budget(0)
+async def get_profile(
+    seconds: float = Query(default=0, ge=0, le=60), reset: bool = False
+):
+    # Collapsed stacks ("route;frame;frame count") for flamegraph.pl / speedscope
+    if not config.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+
+    if seconds:
+        logger.info(f"Profiling all requests for {seconds}s")
+        return await profiler.capture(seconds)
+
+    output = profiler.collapsed()
+    if reset:
+        profiler.reset()
+    return output
+
+
+@router.get("/deadlines")
+@query_budget(0)
+async def get_deadline_metrics():
+    # Counts per route since the worker started
+    return {
+        "timeouts": deadlines.timeouts,
+        "rejections": deadlines.rejections,
+        "cancellations": deadlines.cancellations,
+    }
+
+
+@router.get("/singleflight")
+@query_budget(0)
+async def get_singleflight_metrics():
+    # Counts per coalesced read since the worker started
+    return {
+        "leaders": singleflight.leaders,
+        "coalesced": singleflight.coalesced,
+        "cache_hits": singleflight.cache_hits,
+    }
+
+
+@router.post("/config/reload")
+@query_budget(0)
+async def reload_settings():
+    # Only this worker; the others need the same request, the settings that
+    # cannot be reloaded need the launcher restarted
+    try:
+        changed = await anyio.to_thread.run_sync(reload_config)
+    except ValidationError as e:
+        # Nothing is applied; the values are left out, they may be secrets
+        errors = json.loads(e.json(include_url=False, include_input=False))
+        raise HTTPException(status_code=422, detail=errors) from e
+    if changed:
+        logger.info(f"Reloaded settings: {', '.join(changed)}")
+    return {"changed": changed}
+
+
+@router.get("/jobs/{job_id}", response_model=Job)
+@query_budget(1)
+async def get_job(job_id: int):
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/archive", response_model=Job, status_code=202)
+@query_budget(2)
+async def archive_old_posts():
+    # Runs on the job queue, moving a large backlog can take a while
+    logger.info("Scheduling archival of old posts")
+    job_id = await job_queue.enqueue("archive_old_posts")
+    return await job_queue.get(job_id)
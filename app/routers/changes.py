@@ -0,0 +1,35 @@
+import logging
+
+from fastapi import APIRouter, Query
+
+from app.config import config
+from app.database import change_table, database
+from app.models.change import ChangeBatch
+from app.query_counter import query_budget
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get("/changes", response_model=ChangeBatch)
+@query_budget(1)
+async def get_changes(
+    since: int = Query(default=0, ge=0),
+    limit: int = Query(default=config.CHANGES_BATCH_SIZE, ge=1),
+):
+    limit = min(limit, config.CHANGES_BATCH_SIZE)
+    logger.info(f"Getting up to {limit} changes since {since}")
+
+    # One extra row tells whether the client has to come back for more
+    query = (
+        change_table.select()
+        .where(change_table.c.seq > since)
+        .order_by(change_table.c.seq)
+        .limit(limit + 1)
+    )
+    changes = await database.fetch_all(query)
+
+    changes, has_more = changes[:limit], len(changes) > limit
+    cursor = changes[-1].seq if changes else since
+    return {"changes": changes, "cursor": cursor, "has_more": has_more}
@@ -0,0 +1,25 @@
+import logging
+
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+
+from app.config import config
+from app.events import event_stream, hub
+from app.query_counter import query_budget
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get("/events")
+@query_budget(0)
+async def stream_events():
+    logger.info("Subscribing to events")
+
+    subscription = hub.subscribe()
+    return StreamingResponse(
+        event_stream(subscription, config.EVENTS_HEARTBEAT_SECONDS),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,39 @@
+import asyncio
+import logging
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.config import config
+from app.database import database
+from app.lifecycle import drain
+from app.query_counter import query_budget
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/health")
+
+
+@router.get("/live")
+@query_budget(0)
+async def liveness():
+    # The event loop answers; nothing else is checked, so a slow database
+    # never gets a worker restarted
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+@query_budget(1)
+async def readiness():
+    if drain.draining:
+        return JSONResponse({"status": "draining"}, status_code=503)
+
+    try:
+        await asyncio.wait_for(
+            database.fetch_val("SELECT 1"), config.HEALTH_CHECK_TIMEOUT_SECONDS
+        )
+    except Exception as e:
+        logger.warning(f"Readiness check failed: {e!r}")
+        return JSONResponse({"status": "database unreachable"}, status_code=503)
+
+    return {"status": "ok"}
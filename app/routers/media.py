@@ -0,0 +1,106 @@
+import logging
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Request, Response
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.config import config
+from app.database import database, media_table
+from app.jobs import job_queue
+from app.media import (
+    ORIGINAL,
+    THUMBNAIL,
+    MediaNotFound,
+    MediaTooLarge,
+    safe_media_type,
+    store,
+)
+from app.models.media import Media
+from app.models.user import User
+from app.query_counter import query_budget
+from app.security import get_current_user
+
+router = APIRouter()
+
+logger = logging.getLogger(__name__)
+
+Digest = Annotated[str, Path(pattern="^[0-9a-f]{64}$")]
+
+
+def media_url(digest: str) -> str:
+    return f"/media/{digest}"
+
+
+@router.post("/media", response_model=Media, status_code=201)
+@query_budget(3)
+async def upload_media(
+    request: Request,
+    response: Response,
+    current_user: Annotated[User, Depends(get_current_user)],
+    content_type: Annotated[str, Header()] = "application/octet-stream",
+    content_length: Annotated[int | None, Header()] = None,
+):
+    # The body is the file itself, streamed to the store as it arrives
+    # rather than read into memory or spooled by a multipart parser
+    if content_length is not None and content_length > config.MEDIA_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Upload too large")
+
+    try:
+        stored = await store.save(request.stream(), config.MEDIA_MAX_BYTES)
+    except MediaTooLarge as e:
+        raise HTTPException(status_code=413, detail="Upload too large") from e
+
+    logger.info(f"Stored {stored.size} bytes as {stored.digest}")
+    content_type = safe_media_type(content_type.split(";")[0].strip().lower())
+    query = (
+        sqlite_insert(media_table)
+        .values(
+            digest=stored.digest,
+            size=stored.size,
+            content_type=content_type,
+            user_id=current_user.id,
+        )
+        .on_conflict_do_nothing()
+        .returning(media_table.c.content_type)
+    )
+    record = await database.fetch_one(query)
+
+    if record is None:
+        # Uploaded before, whoever did: the existing file is shared
+        response.status_code = 200
+        query = media_table.select().where(media_table.c.digest == stored.digest)
+        record = await database.fetch_one(query)
+    elif content_type.startswith("image/"):
+        await job_queue.enqueue("make_thumbnail", digest=stored.digest)
+
+    return {
+        "digest": stored.digest,
+        "size": stored.size,
+        "content_type": record.content_type,
+        "url": media_url(stored.digest),
+    }
+
+
+@router.get("/media/{digest}")
+@query_budget(1)
+async def get_media(digest: Digest):
+    query = media_table.select().where(media_table.c.digest == digest)
+    media = await database.fetch_one(query)
+    if media is None:
+        raise HTTPException(status_code=404, detail="Media not found")
+
+    try:
+        return await store.response(digest, ORIGINAL, media.content_type)
+    except MediaNotFound as e:
+        logger.error(f"Media {digest} has a row but no file")
+        raise HTTPException(status_code=404, detail="Media not found") from e
+
+
+@router.get("/media/{digest}/thumbnail")
+@query_budget(0)
+async def get_thumbnail(digest: Digest):
+    # Made in the background after the upload, missing until then
+    try:
+        return await store.response(digest, THUMBNAIL, "image/jpeg")
+    except MediaNotFound as e:
+        raise HTTPException(status_code=404, detail="Thumbnail not found") from e
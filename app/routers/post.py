@@ -1,22 +1,49 @@
 import logging
+import sqlite3
 from enum import Enum
 from typing import Annotated, List
 
 import sqlalchemy
-from fastapi import APIRouter, Depends, HTTPException
-
-from app.database import comment_table, database, like_table, post_table
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app import events
+from app.cache import RecentSet
+from app.config import config, reload_hooks
+from app.database import (
+    PARENT_NOT_FOUND,
+    REPLY_TOO_DEEP,
+    archived_comment_table,
+    archived_post_table,
+    comment_table,
+    database,
+    like_table,
+    media_table,
+    post_table,
+)
+from app.encoding import (
+    VARY_ACCEPT,
+    MsgPackResponse,
+    accepts_msgpack,
+    columnar,
+    vary_on_accept,
+)
+from app.loaders import with_authors
 from app.models.post import (
     Comment,
     CommentIn,
+    CommentWithAuthor,
     PostLike,
     PostLikeIn,
     UserPostIn,
+    UserPostWithAuthor,
     UserPostWithComments,
     UserPostWithLikes,
 )
 from app.models.user import User
+from app.query_counter import query_budget
 from app.security import get_current_user
+from app.singleflight import SingleFlight
 
 router = APIRouter()
 
@@ -34,25 +61,166 @@ select_post_with_likes = (
 )
 
 
-async def find_post(post_id: int):
-    logger.info(f"Logging post with id: {post_id}")
+def select_post(post_id: int):
+    # Archived posts are read from the archive in the same round trip
+    return select_post_with_likes.where(post_table.c.id == post_id).union_all(
+        archived_post_table.select().where(archived_post_table.c.id == post_id)
+    )
 
-    query = post_table.select().where(post_table.c.id == post_id)
 
-    logger.debug(query)
+def select_thread(
+    table: sqlalchemy.Table,
+    post_id: int,
+    parent_id: int | None,
+    max_depth: int | None,
+    after: int | None,
+):
+    # Every condition is a range on (post_id, path), the ones on another
+    # comment look its path up by primary key
+    other = table.alias("other")
+
+    def path_of(comment_id: int):
+        return (
+            sqlalchemy.select(other.c.path)
+            .where(other.c.id == comment_id)
+            .scalar_subquery()
+        )
+
+    query = table.select().where(table.c.post_id == post_id)
+    first_depth = 0
+    if parent_id is not None:
+        parent_path = path_of(parent_id)
+        # Digits and dots sort before ":", so this is the whole subtree
+        query = query.where(
+            table.c.path > parent_path, table.c.path < parent_path + ":"
+        )
+        first_depth = (
+            sqlalchemy.select(other.c.depth + 1)
+            .where(other.c.id == parent_id)
+            .scalar_subquery()
+        )
+    if max_depth is not None:
+        query = query.where(table.c.depth < first_depth + max_depth)
+    if after is not None:
+        query = query.where(table.c.path > path_of(after))
+    return query
+
+
+def select_comments(
+    post_id: int,
+    parent_id: int | None = None,
+    max_depth: int | None = None,
+    after: int | None = None,
+    limit: int | None = None,
+):
+    # Threads in order, replies right after what they reply to; archived
+    # comments are read in the same round trip
+    return (
+        select_thread(comment_table, post_id, parent_id, max_depth, after)
+        .union_all(
+            select_thread(archived_comment_table, post_id, parent_id, max_depth, after)
+        )
+        .order_by(sqlalchemy.literal_column("path"))
+        .limit(limit)
+    )
+
+
+# Post ids recently seen to exist, letting writes skip the EXISTS guard
+known_posts = RecentSet(maxsize=config.KNOWN_POSTS_CACHE_SIZE)
+
+# Posts with their comments, coalesced and kept briefly; writes in this
+# worker forget the post, other workers see them within the TTL
+post_reads = SingleFlight(
+    "GET /post/{post_id}",
+    ttl=config.POST_READ_CACHE_SECONDS,
+    maxsize=config.POST_READ_CACHE_SIZE,
+)
+
+
+def apply_post_read_ttl(changed: set[str]) -> None:
+    post_reads.ttl = config.POST_READ_CACHE_SECONDS
+
 
-    return await database.fetch_one(query)
+reload_hooks.append(apply_post_read_ttl)
+
+
+def insert_for_post(table: sqlalchemy.Table, data: dict, **expressions):
+    # Known posts take a plain insert with the foreign key as the safety net,
+    # anything else inserts nothing unless the post exists - one statement
+    if data["post_id"] in known_posts:
+        return sqlite_insert(table).values({**data, **expressions})
+
+    post_exists = sqlalchemy.exists().where(post_table.c.id == data["post_id"])
+    values = sqlalchemy.select(
+        *(sqlalchemy.literal(v) for v in data.values()), *expressions.values()
+    )
+    return sqlite_insert(table).from_select(
+        [*data, *expressions], values.where(post_exists)
+    )
+
+
+# Raised by the comment triggers
+THREAD_ERRORS = {PARENT_NOT_FOUND: 404, REPLY_TOO_DEEP: 422}
+
+
+async def insert_for_post_returning_id(query, post_id: int):
+    try:
+        record = await database.fetch_one(query)
+    except sqlite3.IntegrityError as e:
+        if str(e) in THREAD_ERRORS:
+            raise HTTPException(status_code=THREAD_ERRORS[str(e)], detail=str(e)) from e
+        known_posts.discard(post_id)
+        raise HTTPException(status_code=404, detail="Post not found") from e
+
+    if record is not None:
+        known_posts.add(post_id)
+    return record
+
+
+async def insert_post_with_media(data: dict) -> int:
+    # Inserts nothing unless every attachment was uploaded - one statement
+    digests = set(data["media"])
+    if len(data["media"]) > config.MEDIA_MAX_PER_POST:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {config.MEDIA_MAX_PER_POST} attachments per post",
+        )
+
+    uploaded = (
+        sqlalchemy.select(sqlalchemy.func.count())
+        .where(media_table.c.digest.in_(digests))
+        .scalar_subquery()
+    )
+    values = sqlalchemy.select(
+        sqlalchemy.literal(data["body"]),
+        sqlalchemy.literal(data["user_id"]),
+        sqlalchemy.literal(data["media"], sqlalchemy.JSON),
+    ).where(uploaded == len(digests))
+    query = (
+        post_table.insert()
+        .from_select(["body", "user_id", "media"], values)
+        .returning(post_table.c.id)
+    )
+    post_id = await database.fetch_val(query)
+    if post_id is None:
+        raise HTTPException(status_code=422, detail="Media not found")
+    return post_id
 
 
 @router.post("/post", response_model=UserPostWithLikes, status_code=201)
+@query_budget(2)
 async def create_post(
     post: UserPostIn, current_user: Annotated[User, Depends(get_current_user)]
 ):
     logger.info("Creating post")
 
     data = {**post.model_dump(), "user_id": current_user.id}
-    query = post_table.insert().values(**data)
-    last_record_id = await database.execute(query)
+    if not post.media:
+        last_record_id = await database.execute(post_table.insert().values(**data))
+    else:
+        last_record_id = await insert_post_with_media(data)
+    known_posts.add(last_record_id)
+    await events.publish("post", {**data, "id": last_record_id})
     return {**data, "id": last_record_id}
 
 
@@ -62,8 +230,19 @@ class PostSorting(str, Enum):
     most_likes = "most_likes"
 
 
-@router.get("/post", response_model=List[UserPostWithLikes])
-async def get_all_posts(sorting: PostSorting = PostSorting.new):
+# Authors are only embedded on request, so the default responses are unchanged
+@router.get(
+    "/post",
+    response_model=List[UserPostWithAuthor],
+    dependencies=[Depends(vary_on_accept)],
+    response_model_exclude_unset=True,
+)
+@query_budget(2)
+async def get_all_posts(
+    sorting: PostSorting = PostSorting.new,
+    include_author: bool = False,
+    accept: Annotated[str | None, Header()] = None,
+):
     logger.info("Getting all posts")
 
     # query = post_table.select()
@@ -79,41 +258,90 @@ async def get_all_posts(sorting: PostSorting = PostSorting.new):
 
     logger.debug(query)
 
-    return await database.fetch_all(query)
+    posts = await database.fetch_all(query)
+    model = UserPostWithLikes
+    if include_author:
+        posts, model = await with_authors(posts), UserPostWithAuthor
+
+    if accepts_msgpack(accept):
+        return MsgPackResponse(columnar(model, posts), headers=VARY_ACCEPT)
+    return posts
 
 
 @router.post("/comment", response_model=Comment, status_code=201)
+@query_budget(2)
 async def create_comment(
     comment: CommentIn, current_user: Annotated[User, Depends(get_current_user)]
 ):
     logger.info("Creating comment")
 
-    post = await find_post(comment.post_id)
-    if not post:
+    data = {**comment.model_dump(), "user_id": current_user.id}
+    # The depth is set here so it can be returned, the path needs the id and
+    # is set by a trigger
+    parent = comment_table.alias("parent")
+    depth = sqlalchemy.func.coalesce(
+        sqlalchemy.select(parent.c.depth + 1)
+        .where(parent.c.id == comment.parent_id)
+        .scalar_subquery(),
+        0,
+    )
+    query = insert_for_post(comment_table, data, depth=depth).returning(
+        comment_table.c.id, comment_table.c.depth
+    )
+
+    logger.debug(query)
+
+    comment_record = await insert_for_post_returning_id(query, comment.post_id)
+    if comment_record is None:
         raise HTTPException(status_code=404, detail="Post not found")
 
-    data = {**comment.model_dump(), "user_id": current_user.id}
-    query = comment_table.insert().values(**data)
-    last_record_id = await database.execute(query)
-    return {**data, "id": last_record_id}
+    created = {
+        **data,
+        "id": comment_record.id,
+        "depth": comment_record.depth,
+        "replies": 0,
+    }
+    post_reads.forget(comment.post_id)
+    await events.publish("comment", created)
+    return created
 
 
-@router.get("/post/{post_id}/comment", response_model=List[Comment])
-async def get_comments_for_post(post_id: int):
+@router.get(
+    "/post/{post_id}/comment",
+    response_model=List[CommentWithAuthor],
+    dependencies=[Depends(vary_on_accept)],
+    response_model_exclude_unset=True,
+)
+@query_budget(2)
+async def get_comments_for_post(
+    post_id: int,
+    parent_id: int | None = None,
+    max_depth: Annotated[int | None, Query(ge=1)] = None,
+    after: int | None = None,
+    limit: Annotated[int, Query(ge=1)] = config.COMMENTS_PAGE_SIZE,
+    include_author: bool = False,
+    accept: Annotated[str | None, Header()] = None,
+):
+    # The whole thread, or the replies below parent_id, up to max_depth
+    # levels deep; pages continue after the last comment id of the previous
+    limit = min(limit, config.COMMENTS_PAGE_SIZE)
     logger.info("Getting comments on posts")
 
-    query = comment_table.select().where(comment_table.c.post_id == post_id)
+    query = select_comments(post_id, parent_id, max_depth, after, limit)
 
     logger.debug(query)
-    return await database.fetch_all(query)
+    comments = await database.fetch_all(query)
+    model = Comment
+    if include_author:
+        comments, model = await with_authors(comments), CommentWithAuthor
 
+    if accepts_msgpack(accept):
+        return MsgPackResponse(columnar(model, comments), headers=VARY_ACCEPT)
+    return comments
 
-@router.get("/post/{post_id}", response_model=UserPostWithComments)
-async def get_post_with_comments(post_id: int):
-    logger.info("Getting posts and comments")
 
-    # post = await find_post(post_id)
-    query = select_post_with_likes.where(post_table.c.id == post_id)
+async def load_post_with_comments(post_id: int) -> dict:
+    query = select_post(post_id)
 
     logger.debug(query)
 
@@ -121,29 +349,80 @@ async def get_post_with_comments(post_id: int):
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
 
-    return {
-        "post": post,
-        "comments": await get_comments_for_post(post_id),
-    }
+    # The whole thread, not a page of it: this response has no cursor
+    query = select_comments(post_id)
+    logger.debug(query)
+    return {"post": post, "comments": await database.fetch_all(query)}
+
+
+@router.get("/post/{post_id}", response_model=UserPostWithComments)
+@query_budget(2)
+async def get_post_with_comments(post_id: int):
+    logger.info("Getting posts and comments")
+
+    # A viral post is read by many clients at once, they share the queries
+    result = await post_reads.do(post_id, lambda: load_post_with_comments(post_id))
+    known_posts.add(post_id)
+    return result
 
 
 @router.post("/like", response_model=PostLike, status_code=201)
+@query_budget(3)
 async def list_post(
-    like: PostLikeIn, current_user: Annotated[User, Depends(get_current_user)]
+    like: PostLikeIn,
+    current_user: Annotated[User, Depends(get_current_user)],
+    response: Response,
 ):
     logger.info("Liking post")
 
-    post = await find_post(like.post_id)
-
-    if not post:
-        raise HTTPException(detail="Post not found", status_code=404)
-
     data = {**like.model_dump(), "user_id": current_user.id}
 
-    query = like_table.insert().values(data)
+    # The unique constraint dedupes retries and double taps
+    query = (
+        insert_for_post(like_table, data)
+        .on_conflict_do_nothing(index_elements=["post_id", "user_id"])
+        .returning(like_table.c.id)
+    )
 
     logger.debug(data)
 
-    last_record_id = await database.execute(query)
+    like_record = await insert_for_post_returning_id(query, like.post_id)
 
-    return {**data, "id": last_record_id}
+    if like_record is None:
+        # Nothing inserted: either already liked or the post does not exist
+        query = like_table.select().where(
+            (like_table.c.post_id == like.post_id)
+            & (like_table.c.user_id == current_user.id)
+        )
+        like_record = await database.fetch_one(query)
+        if like_record is None:
+            raise HTTPException(detail="Post not found", status_code=404)
+        response.status_code = 200
+    else:
+        post_reads.forget(like.post_id)
+        await events.publish("like", {"post_id": like.post_id, "delta": 1})
+
+    return {**data, "id": like_record.id}
+
+
+@router.delete("/like/{post_id}", status_code=204)
+@query_budget(2)
+async def unlike_post(
+    post_id: int, current_user: Annotated[User, Depends(get_current_user)]
+):
+    logger.info("Unliking post")
+
+    query = (
+        like_table.delete()
+        .where(
+            (like_table.c.post_id == post_id)
+            & (like_table.c.user_id == current_user.id)
+        )
+        .returning(like_table.c.id)
+    )
+
+    logger.debug(query)
+
+    if await database.fetch_one(query):
+        post_reads.forget(post_id)
+        await events.publish("like", {"post_id": post_id, "delta": -1})
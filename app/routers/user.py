@@ -1,18 +1,23 @@
 import logging
+import sqlite3
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
 
-from app.database import database, user_table
-from app.models.user import UserIn
+from app.database import database, user_stats_table, user_table
+from app.jobs import job_queue
+from app.models.user import User, UserIn, UserStats
+from app.query_counter import query_budget
 from app.security import (
     authenticate_user,
     create_access_token,
     create_confirm_token,
+    get_current_user,
     get_password_hash,
     get_subject_for_token_type,
-    get_user,
+    remember_token_version,
+    revoke_tokens,
 )
 
 logger = logging.getLogger(__name__)
@@ -21,36 +26,59 @@ router = APIRouter()
 
 
 @router.post("/register", status_code=201)
+@query_budget(2)
 async def register(user: UserIn, request: Request):
-    if await get_user(email=user.email):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"A user with the email id: {user.email} already exists!",
-        )
-
     hashed_password = get_password_hash(user.password)
     query = user_table.insert().values(email=user.email, password=hashed_password)
+    confirmation_url = request.url_for(
+        "confirm_email", token=create_confirm_token(user.email)
+    )
 
     logger.debug(query)
-    await database.execute(query)
+
+    # The unique email replaces a lookup, the email itself goes out in the
+    # background and is only enqueued if the user was created
+    try:
+        async with database.transaction():
+            await database.execute(query)
+            await job_queue.enqueue(
+                "send_confirmation_email",
+                email=user.email,
+                confirmation_url=str(confirmation_url),
+            )
+    except sqlite3.IntegrityError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A user with the email id: {user.email} already exists!",
+        ) from e
 
     return {
         "detail": "user created, please confirm your email",
-        "confirmation": request.url_for(
-            "confirm_email", token=create_confirm_token(user.email)
-        ),
+        "confirmation": confirmation_url,
     }
 
 
 @router.post("/token")
+@query_budget(1)
 async def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
     user = await authenticate_user(form_data.username, form_data.password)
-    access_token = create_access_token(user.email)
+    access_token = create_access_token(user.email, user)
+    remember_token_version(user.id, user.token_version)
 
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+@router.post("/token/revoke", status_code=204)
+@query_budget(2)
+async def revoke_all_tokens(current_user: Annotated[User, Depends(get_current_user)]):
+    # Signs the user out everywhere, including the token used for this call
+    logger.info("Revoking access tokens")
+
+    await revoke_tokens(current_user.id)
+
+
 @router.get("/confirm/{token}")
+@query_budget(1)
 async def confirm_email(token: str):
     email = get_subject_for_token_type(token, "confirm")
     query = (
@@ -61,3 +89,18 @@ async def confirm_email(token: str):
 
     await database.execute(query)
     return {"detail": "user confirmed"}
+
+
+@router.get("/user/{user_id}/stats", response_model=UserStats)
+@query_budget(1)
+async def get_user_stats(user_id: int):
+    logger.info(f"Getting stats of user {user_id}")
+
+    query = user_stats_table.select().where(user_stats_table.c.user_id == user_id)
+
+    logger.debug(query)
+
+    stats = await database.fetch_one(query)
+    if not stats:
+        raise HTTPException(status_code=404, detail="User not found")
+    return stats
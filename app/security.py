@@ -1,13 +1,18 @@
 import datetime
 import logging
+import secrets
+import time
+from functools import lru_cache
 from typing import Annotated, Literal
 
+import sqlalchemy
 from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
-from jose import ExpiredSignatureError, JWTError, jwt
-from passlib.context import CryptContext
+from fastapi.security import APIKeyHeader, OAuth2PasswordBearer
 
+from app.cache import RecentDict
+from app.config import config
 from app.database import database, user_table
+from app.models.user import User
 
 logger = logging.getLogger(__name__)
 
@@ -15,8 +20,17 @@ SECRET_KEY = "1234"
 ALGORITHM = "HS256"
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+admin_key_scheme = APIKeyHeader(name="X-Admin-Key", auto_error=False)
 
-pwd_context = CryptContext(schemes=["bcrypt"])
+
+# jose and passlib/bcrypt are imported on first use to keep app start fast
+@lru_cache()
+def get_pwd_context():
+    from passlib.context import CryptContext
+
+    if config.BCRYPT_ROUNDS is None:
+        return CryptContext(schemes=["bcrypt"])
+    return CryptContext(schemes=["bcrypt"], bcrypt__rounds=config.BCRYPT_ROUNDS)
 
 
 def create_credential_exception(detail: str) -> HTTPException:
@@ -35,17 +49,26 @@ def confirm_token_expiry_minutes():
     return 1440
 
 
-def create_access_token(email: str):
+def create_access_token(email: str, user=None):
+    from jose import jwt
+
     logger.debug("Access token created", extra={"email": email})
     expiry = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
         minutes=access_token_expiry_minutes()
     )
     jwt_data = {"sub": email, "exp": expiry, "type": "access"}
+    if user is not None:
+        # Enough to authenticate later requests without loading the user
+        jwt_data.update(
+            uid=user.id, confirmed=bool(user.confirmed), ver=user.token_version
+        )
     encoded_jwt = jwt.encode(jwt_data, key=SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
 def create_confirm_token(email: str):
+    from jose import jwt
+
     logger.debug("Access token created", extra={"email": email})
     expiry = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
         minutes=confirm_token_expiry_minutes()
@@ -55,7 +78,9 @@ def create_confirm_token(email: str):
     return encoded_jwt
 
 
-def get_subject_for_token_type(token: str, type: Literal["access", "confirm"]):
+def decode_token(token: str, type: Literal["access", "confirm"]) -> dict:
+    from jose import ExpiredSignatureError, JWTError, jwt
+
     try:
         payload = jwt.decode(token=token, key=SECRET_KEY, algorithms=ALGORITHM)
     except ExpiredSignatureError as e:
@@ -76,15 +101,19 @@ def get_subject_for_token_type(token: str, type: Literal["access", "confirm"]):
     if token_type is None or token_type != type:
         raise create_credential_exception(f"Invalid Token Type - expected {type}")
 
-    return email
+    return payload
+
+
+def get_subject_for_token_type(token: str, type: Literal["access", "confirm"]):
+    return decode_token(token, type)["sub"]
 
 
 def get_password_hash(plain_password: str) -> str:
-    return pwd_context.hash(plain_password)
+    return get_pwd_context().hash(plain_password)
 
 
 def verify_password(plain_password: str, password_hash: str) -> bool:
-    return pwd_context.verify(plain_password, password_hash)
+    return get_pwd_context().verify(plain_password, password_hash)
 
 
 async def get_user(email: str):
@@ -110,10 +139,65 @@ async def authenticate_user(email: str, password: str):
     return user
 
 
+# user id -> (token version, when it was read); other workers see a
+# revocation once their entry is older than TOKEN_VERSION_CACHE_SECONDS
+token_versions = RecentDict(maxsize=config.TOKEN_VERSION_CACHE_SIZE)
+
+
+def remember_token_version(user_id: int, version: int) -> None:
+    token_versions.set(user_id, (version, time.monotonic()))
+
+
+async def get_token_version(user_id: int) -> int | None:
+    cached = token_versions.get(user_id)
+    if cached and time.monotonic() - cached[1] < config.TOKEN_VERSION_CACHE_SECONDS:
+        return cached[0]
+
+    query = sqlalchemy.select(user_table.c.token_version).where(
+        user_table.c.id == user_id
+    )
+    version = await database.fetch_val(query)
+    if version is not None:
+        remember_token_version(user_id, version)
+    return version
+
+
+async def revoke_tokens(user_id: int) -> None:
+    # Every token issued so far carries an older version from now on
+    query = (
+        user_table.update()
+        .where(user_table.c.id == user_id)
+        .values(token_version=user_table.c.token_version + 1)
+        .returning(user_table.c.token_version)
+    )
+    version = await database.fetch_val(query)
+    remember_token_version(user_id, version)
+
+
 async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
-    email = get_subject_for_token_type(token, "access")
-    user = await get_user(email)
-    if user is None:
-        raise create_credential_exception("No user exists")
+    payload = decode_token(token, "access")
 
-    return user
+    if "uid" not in payload:
+        # Tokens issued before the claims were added
+        user = await get_user(payload["sub"])
+        if user is None:
+            raise create_credential_exception("No user exists")
+        return user
+
+    if not payload.get("confirmed"):
+        raise create_credential_exception("User has not confirmed mail")
+    if await get_token_version(payload["uid"]) != payload.get("ver"):
+        raise create_credential_exception("Token has been revoked")
+
+    return User(id=payload["uid"], email=payload["sub"])
+
+
+def require_admin(api_key: Annotated[str | None, Depends(admin_key_scheme)]):
+    if (
+        config.ADMIN_API_KEY is None
+        or api_key is None
+        or not secrets.compare_digest(api_key, config.ADMIN_API_KEY)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required"
+        )
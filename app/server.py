@@ -0,0 +1,225 @@
+"""Preforking production launcher.
+
+    python -m app.server --workers 4 --port 8000
+
+The master creates the schema once, imports the app and binds the socket,
+then forks the workers so they start with the code already loaded. SIGHUP
+replaces the workers one at a time, SIGTERM/SIGINT stop them gracefully.
+Replacements are forked from the master too, with the settings it read at
+start; changed settings need the launcher restarted.
+
+A stopping worker fails its readiness check for SHUTDOWN_DELAY_SECONDS while
+it keeps serving, then stops accepting, waits for the requests in flight and
+the running jobs (SHUTDOWN_TIMEOUT_SECONDS) and closes its database pool.
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+logger = logging.getLogger("app.server")
+
+# Kill a stopping worker this long after it should have drained
+GRACEFUL_MARGIN = 10
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m app.server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 1))
+    )
+    # Seconds before a stopping worker is killed, by default enough to drain
+    parser.add_argument("--graceful-timeout", type=float, default=None)
+    return parser.parse_args(argv)
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+class DrainingServer(uvicorn.Server):
+    # uvicorn stops accepting as soon as it is signalled; the exit is put
+    # off until the load balancer has seen the worker is no longer ready
+
+    def __init__(self, config: uvicorn.Config, delay: float) -> None:
+        super().__init__(config)
+        self.delay = delay
+        self.exit_requested_at: float | None = None
+
+        from app.lifecycle import drain
+
+        drain.server_managed = True
+
+    async def on_tick(self, counter: int) -> bool:
+        if not await super().on_tick(counter):
+            return False
+
+        from app.lifecycle import drain
+
+        if self.exit_requested_at is None:
+            self.exit_requested_at = time.monotonic()
+            drain.begin()
+        waited = time.monotonic() - self.exit_requested_at
+        if waited < self.delay and not self.force_exit:
+            return False
+
+        drain.stop_accepting()
+        return True
+
+
+class Master:
+    def __init__(self, app, sock: socket.socket, workers: int, timeout: float):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.timeout = timeout
+        self.children: set[int] = set()
+        self.retiring: set[int] = set()
+        self.stopping = False
+        self.reload_requested = False
+
+    def spawn(self) -> int:
+        pid = os.fork()
+        if pid:
+            self.children.add(pid)
+            return pid
+
+        # ---- Worker process ----
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(sig, signal.SIG_DFL)
+        from app.config import config
+
+        server_config = uvicorn.Config(
+            self.app,
+            lifespan="on",
+            log_config=None,
+            timeout_graceful_shutdown=config.SHUTDOWN_TIMEOUT_SECONDS,
+        )
+        DrainingServer(server_config, config.SHUTDOWN_DELAY_SECONDS).run(
+            sockets=[self.sock]
+        )
+        os._exit(0)
+
+    def stop_child(self, pid: int) -> None:
+        self.retiring.add(pid)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            self.children.discard(pid)
+
+    def reap(self) -> None:
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if not pid:
+                return
+            self.children.discard(pid)
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+            else:
+                logger.warning(f"Worker {pid} exited with status {status}")
+
+    def reload(self) -> None:
+        # Start a replacement before stopping each old worker so the socket
+        # always has someone accepting
+        for old in list(self.children):
+            self.spawn()
+            self.stop_child(old)
+            deadline = time.monotonic() + self.timeout
+            while old in self.children and time.monotonic() < deadline:
+                self.reap()
+                time.sleep(0.1)
+        logger.info("Workers reloaded")
+
+    def stop(self) -> None:
+        self.stopping = True
+        for pid in list(self.children):
+            self.stop_child(pid)
+
+        deadline = time.monotonic() + self.timeout
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass  # Exited since the last reap
+        self.reap()
+
+    def run(self) -> None:
+        signal.signal(signal.SIGHUP, self._handle_reload)
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+
+        for _ in range(self.workers):
+            self.spawn()
+
+        while not self.stopping:
+            time.sleep(0.5)
+            self.reap()
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+            for _ in range(self.workers - len(self.children)):
+                self.spawn()
+
+        self.stop()
+
+    def _handle_reload(self, signum, frame) -> None:
+        self.reload_requested = True
+
+    def _handle_stop(self, signum, frame) -> None:
+        self.stopping = True
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+
+    # Read by the config when the app is imported below
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+
+    from app.database import SCHEMA_READY_ENV, create_schema
+
+    create_schema()
+    os.environ[SCHEMA_READY_ENV] = "1"
+
+    from app.config import config
+    from app.main import app
+
+    timeout = args.graceful_timeout
+    if timeout is None:
+        timeout = (
+            config.SHUTDOWN_DELAY_SECONDS
+            + 2 * config.SHUTDOWN_TIMEOUT_SECONDS  # Connections, then lifespan
+            + GRACEFUL_MARGIN
+        )
+
+    logging.basicConfig(level=logging.INFO)
+    sock = bind_socket(args.host, args.port)
+    logger.info(
+        f"Listening on {args.host}:{args.port} with {args.workers} workers "
+        f"(master pid {os.getpid()})"
+    )
+    Master(app, sock, args.workers, timeout).run()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+from app.cache import RecentDict
+
+logger = logging.getLogger(__name__)
+
+# Per name, reported by /admin/singleflight
+leaders: Counter = Counter()  # Calls that ran the computation
+coalesced: Counter = Counter()  # Calls that joined one already in flight
+cache_hits: Counter = Counter()  # Calls answered from the recent results
+
+
+class SingleFlight:
+    """Shares one computation between concurrent calls with the same key.
+
+    The first caller starts it as a task of its own and every caller that
+    arrives while it runs awaits the same task, so a burst of identical
+    reads costs one set of queries. The task runs in the first caller's
+    context: its queries count against that request and its deadline.
+
+    A result is then served for `ttl` seconds. Errors are shared with the
+    callers waiting at the time but never kept.
+    """
+
+    def __init__(self, name: str, ttl: float, maxsize: int) -> None:
+        self.name = name
+        self.ttl = ttl
+        self._results = RecentDict(maxsize)
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        cached = self._results.get(key)
+        if cached is not None and time.monotonic() - cached[1] < self.ttl:
+            cache_hits[self.name] += 1
+            return cached[0]
+
+        task = self._inflight.get(key)
+        if task is None:
+            leaders[self.name] += 1
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(lambda task: self._done(key, task))
+        else:
+            coalesced[self.name] += 1
+
+        # A caller that goes away (disconnect, deadline) leaves the task
+        # running for the others
+        return await asyncio.shield(task)
+
+    def forget(self, key: Hashable) -> None:
+        # After a write: a computation already running may have read the old
+        # state, so later callers start a new one and its result is not kept
+        self._results.discard(key)
+        self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        self._results.clear()
+        self._inflight.clear()
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        # Also marks the exception as retrieved when every caller is gone
+        failed = task.cancelled() or task.exception() is not None
+        if self._inflight.get(key) is not task:
+            return  # Forgotten while it ran
+
+        del self._inflight[key]
+        if not failed:
+            self._results.set(key, (task.result(), time.monotonic()))
@@ -0,0 +1,155 @@
+import logging
+
+import sqlalchemy
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.database import (
+    archived_comment_table,
+    archived_post_table,
+    comment_table,
+    database,
+    like_table,
+    post_table,
+    user_stats_table,
+    user_table,
+)
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("posts", "comments", "likes_given", "likes_received")
+
+
+def count_by_user(user_id, value, first_user: int, last_user: int, from_=None):
+    # One grouped pass over the rows of a batch of users, read through the
+    # user_id indexes rather than a count per user
+    query = sqlalchemy.select(user_id.label("user_id"), value.label("count"))
+    if from_ is not None:
+        query = query.select_from(from_)
+    return (
+        query.where(user_id.between(first_user, last_user)).group_by(user_id).subquery()
+    )
+
+
+def select_expected_stats(first_user: int, last_user: int):
+    # The full aggregation the triggers save the reads from, only run by the
+    # consistency check
+    count = sqlalchemy.func.count
+    counts = {
+        "posts": [
+            count_by_user(post_table.c.user_id, count(), first_user, last_user),
+            count_by_user(
+                archived_post_table.c.user_id, count(), first_user, last_user
+            ),
+        ],
+        "comments": [
+            count_by_user(comment_table.c.user_id, count(), first_user, last_user),
+            count_by_user(
+                archived_comment_table.c.user_id, count(), first_user, last_user
+            ),
+        ],
+        "likes_given": [
+            count_by_user(like_table.c.user_id, count(), first_user, last_user),
+        ],
+        "likes_received": [
+            count_by_user(
+                post_table.c.user_id,
+                count(like_table.c.id),
+                first_user,
+                last_user,
+                from_=like_table.join(post_table),
+            ),
+            count_by_user(
+                archived_post_table.c.user_id,
+                sqlalchemy.func.sum(archived_post_table.c.likes),
+                first_user,
+                last_user,
+            ),
+        ],
+    }
+
+    users = user_table.outerjoin(user_stats_table)
+    for subqueries in counts.values():
+        for subquery in subqueries:
+            users = users.outerjoin(subquery, subquery.c.user_id == user_table.c.id)
+
+    def total(counter: str):
+        return sum(
+            sqlalchemy.func.coalesce(subquery.c.count, 0)
+            for subquery in counts[counter]
+        )
+
+    archived_likes_given = sqlalchemy.func.coalesce(
+        user_stats_table.c.archived_likes_given, 0
+    )
+    return (
+        sqlalchemy.select(
+            user_table.c.id.label("user_id"),
+            total("posts").label("posts"),
+            total("comments").label("comments"),
+            (total("likes_given") + archived_likes_given).label("likes_given"),
+            total("likes_received").label("likes_received"),
+            *(
+                user_stats_table.c[counter].label(f"stored_{counter}")
+                for counter in COUNTERS
+            ),
+        )
+        .select_from(users)
+        .where(user_table.c.id.between(first_user, last_user))
+    )
+
+
+async def check_user_stats(batch_size: int) -> int:
+    """Recount every user's stats and repair the rows that drifted.
+
+    Returns how many rows were repaired. Drift means a write bypassed the
+    triggers, e.g. a manual fix in the database. Users are recounted
+    batch_size at a time, and only the repairs write.
+    """
+    repaired = 0
+    last_user = 0
+    while True:
+        query = (
+            sqlalchemy.select(user_table.c.id)
+            .where(user_table.c.id > last_user)
+            .order_by(user_table.c.id)
+            .limit(batch_size)
+        )
+        users = [row.id for row in await database.fetch_all(query)]
+        if not users:
+            return repaired
+        first_user, last_user = users[0], users[-1]
+
+        stats = select_expected_stats(first_user, last_user).subquery()
+        drifted = sqlalchemy.select(stats).where(
+            sqlalchemy.or_(
+                *(
+                    stats.c[counter].is_distinct_from(stats.c[f"stored_{counter}"])
+                    for counter in COUNTERS
+                )
+            )
+        )
+        rows = await database.fetch_all(drifted)
+        if not rows:
+            continue
+
+        for row in rows:
+            expected = {counter: row[counter] for counter in COUNTERS}
+            stored = {counter: row[f"stored_{counter}"] for counter in COUNTERS}
+            logger.warning(
+                f"Repairing stats of user {row.user_id}: {stored} -> {expected}"
+            )
+
+        # The write recounts in the same statement, so a like made since the
+        # read above is not overwritten by the older count
+        recount = sqlalchemy.select(
+            stats.c.user_id, *(stats.c[counter] for counter in COUNTERS)
+        ).where(stats.c.user_id.in_([row.user_id for row in rows]))
+        query = sqlite_insert(user_stats_table).from_select(
+            ["user_id", *COUNTERS], recount
+        )
+        query = query.on_conflict_do_update(
+            index_elements=["user_id"],
+            set_={counter: query.excluded[counter] for counter in COUNTERS},
+        )
+        await database.execute(query)
+        repaired += len(rows)
@@ -0,0 +1,42 @@
+import logging
+
+from app.archive import archive_posts
+from app.config import config
+from app.jobs import job_queue
+from app.media import create_thumbnail
+from app.stats import check_user_stats
+
+logger = logging.getLogger(__name__)
+
+
+@job_queue.task
+async def send_confirmation_email(email: str, confirmation_url: str) -> None:
+    # No mail provider is wired up yet, the link is also returned by /register
+    logger.info(
+        f"Sending confirmation email with {confirmation_url}", extra={"email": email}
+    )
+
+
+@job_queue.task
+async def archive_old_posts() -> None:
+    archived = await archive_posts(config.ARCHIVE_AFTER_DAYS, config.ARCHIVE_BATCH_SIZE)
+    logger.info(f"Archived {archived} posts")
+
+
+@job_queue.task
+async def check_user_stats_periodically() -> None:
+    # A failed run is retried by the queue, only a successful one schedules
+    # the next; a run that fails for good is started again by
+    # ensure_scheduled when a worker starts
+    repaired = await check_user_stats(config.USER_STATS_CHECK_BATCH_SIZE)
+    logger.info(f"Checked user stats, repaired {repaired}")
+    await job_queue.enqueue(
+        "check_user_stats_periodically",
+        delay=config.USER_STATS_CHECK_INTERVAL_SECONDS,
+    )
+
+
+@job_queue.task
+async def make_thumbnail(digest: str) -> None:
+    if await create_thumbnail(digest):
+        logger.info(f"Made the thumbnail of {digest}")
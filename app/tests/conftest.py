@@ -1,4 +1,6 @@
 import os
+import shutil
+import tempfile
 from typing import AsyncGenerator, Generator
 
 import pytest
@@ -7,13 +9,45 @@ from httpx import ASGITransport, AsyncClient
 
 os.environ["ENV_STATE"] = "test"
 
-from app.database import database, user_table  # noqa
+# Every xdist worker (and every run) gets a database file of its own, so the
+# suite can run in parallel and never sees a schema left over from a past run
+TEST_DB = os.path.join(
+    tempfile.gettempdir(),
+    f"social-media-test-{os.getpid()}-{os.environ.get('PYTEST_XDIST_WORKER', 'main')}.db",
+)
+os.environ.setdefault("TEST_DATABASE_URL", f"sqlite:///{TEST_DB}")
+MEDIA_ROOT = tempfile.mkdtemp(prefix="social-media-test-media-")
+os.environ.setdefault("TEST_MEDIA_ROOT", MEDIA_ROOT)
+
+from app import query_counter  # noqa: E402
+from app.database import create_schema, database, user_table  # noqa
+from app.datagen import Dataset, DatasetSpec, load_dataset  # noqa: E402
+from app.loaders import author_cache  # noqa: E402
 from app.main import app  # noqa: E402
+from app.routers.post import known_posts, post_reads  # noqa: E402
+from app.security import token_versions  # noqa: E402
+
+create_schema()
 
 # noqa tells to no quality assure
 # E402 rule tells about import on top of the file
 
 
+def pytest_sessionfinish(session, exitstatus):
+    for path in (TEST_DB, f"{TEST_DB}.lock"):
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "query_budget(max_queries, route=None): fail if a request made during the "
+        "test (optionally only to route, e.g. 'POST /comment') ran more queries",
+    )
+
+
 @pytest.fixture(scope="session")
 def anyio_backend():
     return "asyncio"
@@ -24,13 +58,70 @@ def client() -> Generator:
     yield TestClient(app)
 
 
-@pytest.fixture(autouse=True)
-async def db() -> AsyncGenerator:
+@pytest.fixture(scope="session")
+async def connected_db() -> AsyncGenerator:
+    # One connection for the whole session, held in a transaction that is
+    # rolled back at the end (DB_FORCE_ROLL_BACK)
     await database.connect()
     yield
     await database.disconnect()
 
 
+@pytest.fixture(autouse=True)
+async def db(connected_db) -> AsyncGenerator:
+    # Each test runs in a savepoint, undone instead of reconnecting
+    await database.execute("SAVEPOINT test")
+    yield
+    await database.execute("ROLLBACK TO SAVEPOINT test")
+    await database.execute("RELEASE SAVEPOINT test")
+
+
+@pytest.fixture(autouse=True)
+def clear_caches() -> Generator:
+    # The process-wide caches outlive the rolled back test database, and its
+    # ids are handed out again, so what they hold would be stale
+    yield
+    post_reads.clear()
+    known_posts.clear()
+    author_cache.clear()
+    token_versions.clear()
+
+
+@pytest.fixture()
+def make_dataset():
+    # Bulk-loaded synthetic data, rolled back with the rest of the test
+    async def make(**spec) -> Dataset:
+        return await load_dataset(DatasetSpec(**spec))
+
+    return make
+
+
+@pytest.fixture()
+async def large_dataset(make_dataset) -> Dataset:
+    return await make_dataset(users=500, posts=5000, comments=10_000, likes=20_000)
+
+
+@pytest.fixture()
+def query_log() -> Generator:
+    log: list[query_counter.QueryStats] = []
+    query_counter.listeners.append(log.append)
+    yield log
+    query_counter.listeners.remove(log.append)
+
+
+@pytest.fixture(autouse=True)
+def enforce_query_budgets(request, query_log: list) -> Generator:
+    yield
+    for marker in request.node.iter_markers("query_budget"):
+        max_queries = marker.args[0]
+        route = marker.kwargs.get("route")
+        for stats in query_log:
+            if route is None or stats.route == route:
+                assert stats.count <= max_queries, (
+                    f"{stats.route} ran {stats.count} queries, budget is {max_queries}"
+                )
+
+
 @pytest.fixture()
 async def async_client(client) -> AsyncGenerator:
     async with AsyncClient(
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+
+import pytest
+from httpx import AsyncClient
+
+from app.config import config, reload_config, reload_hooks
+from app.jobs import job_queue
+from app.profiling import profiler
+from app.routers.post import post_reads
+
+
+@pytest.fixture()
+def admin_headers() -> dict:
+    return {"X-Admin-Key": config.ADMIN_API_KEY}
+
+
+@pytest.mark.anyio
+async def test_profile_requires_admin_key(async_client: AsyncClient):
+    response = await async_client.get("/admin/profile")
+
+    assert response.status_code == 403
+
+
+@pytest.mark.anyio
+async def test_profile_wrong_admin_key(async_client: AsyncClient):
+    response = await async_client.get(
+        "/admin/profile", headers={"X-Admin-Key": "wrong"}
+    )
+
+    assert response.status_code == 403
+
+
+@pytest.mark.anyio
+async def test_profile_disabled(async_client: AsyncClient, admin_headers, mocker):
+    mocker.patch.object(config, "PROFILING_ENABLED", False)
+
+    response = await async_client.get("/admin/profile", headers=admin_headers)
+
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_profile_capture_tags_route(async_client: AsyncClient, admin_headers):
+    capture = asyncio.create_task(
+        async_client.get("/admin/profile", params={"seconds": 1}, headers=admin_headers)
+    )
+    while not profiler.capturing:
+        await asyncio.sleep(0.01)
+    await async_client.post(
+        "/register", json={"email": "profiled@example.net", "password": "1234"}
+    )
+    response = await capture
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "POST /register;" in response.text
+
+
+@pytest.mark.anyio
+async def test_get_job(async_client: AsyncClient, admin_headers):
+    job_id = await job_queue.enqueue("send_confirmation_email", email="a@b.c")
+
+    response = await async_client.get(f"/admin/jobs/{job_id}", headers=admin_headers)
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "id": job_id,
+        "name": "send_confirmation_email",
+        "status": "pending",
+        "attempts": 0,
+        "max_attempts": job_queue.max_attempts,
+        "last_error": None,
+    }
+
+
+@pytest.mark.anyio
+async def test_get_missing_job(async_client: AsyncClient, admin_headers):
+    response = await async_client.get("/admin/jobs/1", headers=admin_headers)
+
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_archive_schedules_job(async_client: AsyncClient, admin_headers):
+    response = await async_client.post("/admin/archive", headers=admin_headers)
+
+    assert response.status_code == 202
+    assert response.json()["name"] == "archive_old_posts"
+    assert await job_queue.run_pending() == 1
+    assert (await job_queue.get(response.json()["id"])).status == "done"
+
+
+@pytest.mark.anyio
+async def test_deadline_metrics(async_client: AsyncClient, admin_headers):
+    response = await async_client.get("/admin/deadlines", headers=admin_headers)
+
+    assert response.status_code == 200
+    assert set(response.json()) == {"timeouts", "rejections", "cancellations"}
+
+
+@pytest.mark.anyio
+async def test_singleflight_metrics(async_client: AsyncClient, admin_headers):
+    response = await async_client.get("/admin/singleflight", headers=admin_headers)
+
+    assert response.status_code == 200
+    assert set(response.json()) == {"leaders", "coalesced", "cache_hits"}
+
+
+@pytest.fixture()
+def settings_env(monkeypatch):
+    # The reloaded settings go back once the environment is restored
+    yield monkeypatch
+    monkeypatch.undo()
+    reload_config()
+
+
+@pytest.mark.anyio
+async def test_reload_settings(async_client: AsyncClient, admin_headers, settings_env):
+    settings_env.setenv("TEST_POST_READ_CACHE_SECONDS", "5")
+    settings_env.setenv("TEST_PROFILING_SAMPLE_RATE", "0.5")
+    settings_env.setenv("TEST_LOG_LEVELS", '{"app": "WARNING"}')
+
+    response = await async_client.post("/admin/config/reload", headers=admin_headers)
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "changed": {
+            "LOG_LEVELS": {"app": "WARNING"},
+            "PROFILING_SAMPLE_RATE": 0.5,
+            "POST_READ_CACHE_SECONDS": 5.0,
+        }
+    }
+    assert post_reads.ttl == 5.0
+    assert profiler.sample_rate == 0.5
+    assert logging.getLogger("app").level == logging.WARNING
+
+
+@pytest.mark.anyio
+async def test_reload_resets_dropped_log_levels(
+    async_client: AsyncClient, admin_headers, settings_env
+):
+    settings_env.setenv("TEST_LOG_LEVELS", '{"app": "INFO", "app.noisy": "DEBUG"}')
+    await async_client.post("/admin/config/reload", headers=admin_headers)
+    assert logging.getLogger("app.noisy").level == logging.DEBUG
+
+    settings_env.setenv("TEST_LOG_LEVELS", '{"app": "INFO"}')
+    await async_client.post("/admin/config/reload", headers=admin_headers)
+
+    assert logging.getLogger("app.noisy").level == logging.NOTSET
+    assert logging.getLogger("app.noisy").getEffectiveLevel() == logging.INFO
+
+
+@pytest.mark.anyio
+async def test_reload_invalid_settings(
+    async_client: AsyncClient, admin_headers, settings_env
+):
+    settings_env.setenv("TEST_POST_READ_CACHE_SECONDS", "soon")
+
+    response = await async_client.post("/admin/config/reload", headers=admin_headers)
+
+    assert response.status_code == 422
+    [error] = response.json()["detail"]
+    assert error["loc"] == ["POST_READ_CACHE_SECONDS"]
+    assert "input" not in error
+    assert post_reads.ttl == config.POST_READ_CACHE_SECONDS
+
+
+@pytest.mark.anyio
+async def test_reload_invalid_log_level(
+    async_client: AsyncClient, admin_headers, settings_env
+):
+    levels = config.LOG_LEVELS
+    settings_env.setenv("TEST_LOG_LEVELS", '{"app": "VERBOSE"}')
+
+    response = await async_client.post("/admin/config/reload", headers=admin_headers)
+
+    assert response.status_code == 422
+    [error] = response.json()["detail"]
+    assert error["loc"] == ["LOG_LEVELS", "app"]
+    assert config.LOG_LEVELS == levels
+
+
+@pytest.mark.anyio
+async def test_reload_rolls_back_failed_hook(settings_env, mocker):
+    failing_hook = mocker.Mock(side_effect=[RuntimeError("boom"), None])
+    mocker.patch("app.config.reload_hooks", [*reload_hooks, failing_hook])
+    settings_env.setenv("TEST_POST_READ_CACHE_SECONDS", "5")
+    ttl = config.POST_READ_CACHE_SECONDS
+
+    with pytest.raises(RuntimeError):
+        reload_config()
+
+    assert config.POST_READ_CACHE_SECONDS == ttl
+    assert post_reads.ttl == ttl
+
+
+@pytest.mark.anyio
+async def test_reload_ignores_other_settings(
+    async_client: AsyncClient, admin_headers, settings_env
+):
+    settings_env.setenv("TEST_GZIP_LEVEL", "9")
+
+    response = await async_client.post("/admin/config/reload", headers=admin_headers)
+
+    assert response.json() == {"changed": {}}
+    assert config.GZIP_LEVEL == 5
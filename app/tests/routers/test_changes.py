@@ -0,0 +1,115 @@
+import pytest
+from httpx import AsyncClient
+
+from app.tests.routers.test_posts import create_comment, create_post, like_post
+
+
+async def get_changes(async_client: AsyncClient, **params) -> dict:
+    response = await async_client.get("/changes", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.mark.anyio
+@pytest.mark.query_budget(1, route="GET /changes")
+async def test_changes_since_start(async_client: AsyncClient, logged_in_token: str):
+    post = await create_post("Test Post", async_client, logged_in_token)
+    comment = await create_comment(
+        "Test Comment", post["id"], async_client, logged_in_token
+    )
+    like = await like_post(async_client, logged_in_token, post["id"])
+
+    batch = await get_changes(async_client)
+
+    assert [
+        (change["entity"], change["op"], change["data"]) for change in batch["changes"]
+    ] == [
+        (
+            "post",
+            "upsert",
+            {"id": post["id"], "body": "Test Post", "user_id": 1, "media": []},
+        ),
+        (
+            "comment",
+            "upsert",
+            {
+                "id": comment["id"],
+                "body": "Test Comment",
+                "post_id": post["id"],
+                "user_id": 1,
+                "parent_id": None,
+                "depth": 0,
+            },
+        ),
+        ("like", "upsert", like),
+    ]
+    assert batch["cursor"] == batch["changes"][-1]["seq"]
+    assert batch["has_more"] is False
+
+
+@pytest.mark.anyio
+async def test_changes_since_cursor(async_client: AsyncClient, logged_in_token: str):
+    post = await create_post("Test Post", async_client, logged_in_token)
+    cursor = (await get_changes(async_client))["cursor"]
+
+    await create_comment("Test Comment", post["id"], async_client, logged_in_token)
+    batch = await get_changes(async_client, since=cursor)
+
+    assert [change["entity"] for change in batch["changes"]] == ["comment"]
+    assert batch["changes"][0]["seq"] > cursor
+
+
+@pytest.mark.anyio
+async def test_changes_nothing_new(async_client: AsyncClient, logged_in_token: str):
+    await create_post("Test Post", async_client, logged_in_token)
+    cursor = (await get_changes(async_client))["cursor"]
+
+    batch = await get_changes(async_client, since=cursor)
+
+    assert batch == {"changes": [], "cursor": cursor, "has_more": False}
+
+
+@pytest.mark.anyio
+async def test_changes_unlike_is_delete(
+    async_client: AsyncClient, logged_in_token: str
+):
+    post = await create_post("Test Post", async_client, logged_in_token)
+    like = await like_post(async_client, logged_in_token, post["id"])
+    await async_client.delete(
+        f"/like/{post['id']}", headers={"Authorization": f"Bearer {logged_in_token}"}
+    )
+
+    batch = await get_changes(async_client)
+
+    assert [(c["entity"], c["op"], c["data"]) for c in batch["changes"][-2:]] == [
+        ("like", "upsert", like),
+        ("like", "delete", like),
+    ]
+
+
+@pytest.mark.anyio
+async def test_changes_in_batches(async_client: AsyncClient, logged_in_token: str):
+    for number in range(3):
+        await create_post(f"Post {number}", async_client, logged_in_token)
+
+    first = await get_changes(async_client, limit=2)
+    second = await get_changes(async_client, since=first["cursor"], limit=2)
+
+    assert [c["data"]["body"] for c in first["changes"]] == ["Post 0", "Post 1"]
+    assert first["has_more"] is True
+    assert [c["data"]["body"] for c in second["changes"]] == ["Post 2"]
+    assert second["has_more"] is False
+
+
+@pytest.mark.anyio
+async def test_changes_limit_is_capped(
+    async_client: AsyncClient, logged_in_token: str, mocker
+):
+    mocker.patch("app.routers.changes.config.CHANGES_BATCH_SIZE", 1)
+    await create_post("Post 0", async_client, logged_in_token)
+    await create_post("Post 1", async_client, logged_in_token)
+
+    batch = await get_changes(async_client, limit=100)
+
+    assert len(batch["changes"]) == 1
+    assert batch["has_more"] is True
@@ -0,0 +1,47 @@
+import pytest
+from httpx import AsyncClient
+
+from app import database
+from app.lifecycle import drain
+
+
+@pytest.mark.anyio
+@pytest.mark.query_budget(0, route="GET /health/live")
+async def test_liveness(async_client: AsyncClient):
+    response = await async_client.get("/health/live")
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+
+
+@pytest.mark.anyio
+@pytest.mark.query_budget(1, route="GET /health/ready")
+async def test_readiness(async_client: AsyncClient):
+    response = await async_client.get("/health/ready")
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+
+
+@pytest.mark.anyio
+async def test_readiness_while_draining(async_client: AsyncClient):
+    drain.begin()
+    try:
+        response = await async_client.get("/health/ready")
+    finally:
+        drain.reset()
+
+    assert response.status_code == 503
+    assert response.json() == {"status": "draining"}
+
+
+@pytest.mark.anyio
+async def test_readiness_database_unreachable(async_client: AsyncClient, mocker):
+    mocker.patch.object(
+        database.database, "fetch_val", side_effect=ConnectionError("gone")
+    )
+
+    response = await async_client.get("/health/ready")
+
+    assert response.status_code == 503
+    assert response.json() == {"status": "database unreachable"}
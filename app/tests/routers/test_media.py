@@ -0,0 +1,236 @@
+import shutil
+
+import pytest
+from httpx import AsyncClient
+
+from app import media
+from app.config import config
+from app.jobs import job_queue
+from app.media import store
+from app.tests.test_media import png
+
+
+@pytest.fixture(autouse=True)
+def empty_store():
+    # Files are not rolled back with the database
+    yield
+    shutil.rmtree(store.root, ignore_errors=True)
+
+
+async def upload(
+    content: bytes,
+    async_client: AsyncClient,
+    logged_in_token: str,
+    content_type: str = "application/octet-stream",
+):
+    return await async_client.post(
+        "/media",
+        content=content,
+        headers={
+            "Authorization": f"Bearer {logged_in_token}",
+            "Content-Type": content_type,
+        },
+    )
+
+
+@pytest.mark.anyio
+@pytest.mark.query_budget(3, route="POST /media")
+async def test_upload(async_client: AsyncClient, logged_in_token: str):
+    response = await upload(b"some file", async_client, logged_in_token, "audio/mpeg")
+
+    assert response.status_code == 201
+    body = response.json()
+    assert body["size"] == 9
+    assert body["content_type"] == "audio/mpeg"
+    assert body["url"] == f"/media/{body['digest']}"
+
+    response = await async_client.get(body["url"])
+    assert response.status_code == 200
+    assert response.content == b"some file"
+    assert response.headers["content-type"] == "audio/mpeg"
+    assert response.headers["x-content-type-options"] == "nosniff"
+    assert response.headers["content-disposition"] == "attachment"
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "content_type", ["text/html", "image/svg+xml", "text/xml; charset=utf-8"]
+)
+async def test_upload_unsafe_type_served_as_download(
+    async_client: AsyncClient, logged_in_token: str, content_type: str
+):
+    script = b"<svg xmlns='http://www.w3.org/2000/svg'><script>alert(1)</script></svg>"
+    response = await upload(script, async_client, logged_in_token, content_type)
+
+    assert response.json()["content_type"] == "application/octet-stream"
+    response = await async_client.get(response.json()["url"])
+    assert response.headers["content-type"] == "application/octet-stream"
+    assert response.headers["content-disposition"] == "attachment"
+    assert response.headers["x-content-type-options"] == "nosniff"
+
+
+@pytest.mark.anyio
+async def test_upload_deduplicates(async_client: AsyncClient, logged_in_token: str):
+    first = await upload(b"same", async_client, logged_in_token, "audio/ogg")
+    second = await upload(b"same", async_client, logged_in_token, "image/png")
+
+    assert second.status_code == 200
+    # The first upload decides what the content is
+    assert second.json() == first.json()
+
+
+@pytest.mark.anyio
+async def test_upload_requires_login(async_client: AsyncClient):
+    response = await async_client.post("/media", content=b"file")
+
+    assert response.status_code == 401
+
+
+@pytest.mark.anyio
+async def test_upload_too_large(
+    async_client: AsyncClient, logged_in_token: str, mocker
+):
+    mocker.patch.object(config, "MEDIA_MAX_BYTES", 4)
+
+    response = await upload(b"12345", async_client, logged_in_token)
+
+    assert response.status_code == 413
+
+
+@pytest.mark.anyio
+async def test_upload_too_large_while_streaming(
+    async_client: AsyncClient, logged_in_token: str, mocker
+):
+    mocker.patch.object(config, "MEDIA_MAX_BYTES", 4)
+
+    async def body():
+        yield b"123"
+        yield b"45"
+
+    # No Content-Length up front, the limit applies to what arrives
+    response = await async_client.post(
+        "/media",
+        content=body(),
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 413
+
+
+@pytest.mark.anyio
+async def test_get_media_range(async_client: AsyncClient, logged_in_token: str):
+    url = (await upload(b"0123456789", async_client, logged_in_token)).json()["url"]
+
+    response = await async_client.get(url, headers={"Range": "bytes=2-5"})
+
+    assert response.status_code == 206
+    assert response.content == b"2345"
+    assert response.headers["content-range"] == "bytes 2-5/10"
+
+
+@pytest.mark.anyio
+async def test_get_media_is_not_gzipped(
+    async_client: AsyncClient, logged_in_token: str
+):
+    content = b"compressible " * 1000
+    url = (await upload(content, async_client, logged_in_token)).json()["url"]
+
+    response = await async_client.get(url, headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-length"] == str(len(content))
+
+
+@pytest.mark.anyio
+@pytest.mark.query_budget(1, route="GET /media/{digest}")
+async def test_get_media_not_found(async_client: AsyncClient):
+    response = await async_client.get(f"/media/{'0' * 64}")
+
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_get_media_file_missing(async_client: AsyncClient, logged_in_token: str):
+    digest = (await upload(b"file", async_client, logged_in_token)).json()["digest"]
+    store.path(digest).unlink()
+
+    response = await async_client.get(f"/media/{digest}")
+
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_get_media_invalid_digest(async_client: AsyncClient):
+    response = await async_client.get("/media/..%2F..%2Fetc")
+
+    assert response.status_code in (404, 422)
+
+
+@pytest.mark.anyio
+async def test_get_media_accel_redirect(
+    async_client: AsyncClient, logged_in_token: str, mocker
+):
+    mocker.patch.object(store, "accel_redirect", "/internal/media")
+    digest = (await upload(b"file", async_client, logged_in_token)).json()["digest"]
+
+    response = await async_client.get(f"/media/{digest}")
+
+    assert response.content == b""
+    assert response.headers["x-accel-redirect"] == (
+        f"/internal/media/{digest[:2]}/{digest}"
+    )
+
+
+@pytest.mark.anyio
+async def test_thumbnail(async_client: AsyncClient, logged_in_token: str):
+    response = await upload(png(600, 300), async_client, logged_in_token, "image/png")
+    digest = response.json()["digest"]
+
+    # Made by a background job
+    thumbnail_url = f"/media/{digest}/thumbnail"
+    assert (await async_client.get(thumbnail_url)).status_code == 404
+    await job_queue.run_pending()
+
+    response = await async_client.get(thumbnail_url)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert "content-disposition" not in response.headers
+
+
+@pytest.mark.anyio
+async def test_thumbnail_not_an_image(async_client: AsyncClient, logged_in_token: str):
+    response = await upload(b"not a png", async_client, logged_in_token, "image/png")
+
+    await job_queue.run_pending()
+    assert not store.exists(response.json()["digest"], media.THUMBNAIL)
+
+
+@pytest.mark.anyio
+async def test_post_with_media(async_client: AsyncClient, logged_in_token: str):
+    digest = (await upload(b"file", async_client, logged_in_token)).json()["digest"]
+
+    response = await async_client.post(
+        "/post",
+        json={"body": "With a file", "media": [digest]},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 201
+    post = response.json()
+    assert post["media"] == [digest]
+    response = await async_client.get(f"/post/{post['id']}")
+    assert response.json()["post"]["media"] == [digest]
+
+
+@pytest.mark.anyio
+async def test_post_with_unknown_media(async_client: AsyncClient, logged_in_token: str):
+    digest = (await upload(b"file", async_client, logged_in_token)).json()["digest"]
+
+    response = await async_client.post(
+        "/post",
+        json={"body": "With a file", "media": [digest, "0" * 64]},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 422
+    assert (await async_client.get("/post")).json() == []
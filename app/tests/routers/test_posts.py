@@ -1,7 +1,15 @@
+import asyncio
+
+import msgpack
 import pytest
 from httpx import AsyncClient
+from sqlalchemy.dialects import sqlite
 
-from app import security
+from app import events, security
+from app.config import config
+from app.database import MAX_COMMENT_DEPTH, database
+from app.encoding import MSGPACK
+from app.routers.post import known_posts, select_comments
 
 
 async def create_post(
@@ -20,10 +28,11 @@ async def create_comment(
     post_id: int,
     async_client: AsyncClient,
     logged_in_token: str,
+    parent_id: int | None = None,
 ) -> dict:
     response = await async_client.post(
         "/comment",
-        json={"body": body, "post_id": post_id},
+        json={"body": body, "post_id": post_id, "parent_id": parent_id},
         headers={"Authorization": f"Bearer {logged_in_token}"},
     )
     return response.json()
@@ -42,6 +51,13 @@ async def like_post(
     return response.json()
 
 
+@pytest.fixture()
+def subscription():
+    subscription = events.hub.subscribe()
+    yield subscription
+    events.hub.unsubscribe(subscription)
+
+
 @pytest.fixture()
 async def created_post(async_client: AsyncClient, logged_in_token: str):
     return await create_post("Test Post", async_client, logged_in_token)
@@ -96,6 +112,7 @@ async def test_create_post_missing_data(
 
 
 @pytest.mark.anyio
+@pytest.mark.query_budget(2, route="POST /like")
 async def test_like_post(
     async_client: AsyncClient, logged_in_token: str, created_post: dict
 ):
@@ -108,6 +125,52 @@ async def test_like_post(
     assert response.status_code == 201
 
 
+@pytest.mark.anyio
+async def test_like_post_twice(
+    async_client: AsyncClient, logged_in_token: str, created_post: dict
+):
+    first = await like_post(async_client, logged_in_token, created_post["id"])
+    response = await async_client.post(
+        "/like",
+        json={"post_id": created_post["id"]},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == first
+
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert response.json()["post"]["likes"] == 1
+
+
+@pytest.mark.anyio
+async def test_like_missing_post(async_client: AsyncClient, logged_in_token: str):
+    response = await async_client.post(
+        "/like",
+        json={"post_id": 2},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Post not found"}
+
+
+@pytest.mark.anyio
+async def test_unlike_post(
+    async_client: AsyncClient, logged_in_token: str, created_post: dict
+):
+    await like_post(async_client, logged_in_token, created_post["id"])
+
+    response = await async_client.delete(
+        f"/like/{created_post['id']}",
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 204
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert response.json()["post"]["likes"] == 0
+
+
 @pytest.mark.anyio
 async def test_get_all_posts(
     async_client: AsyncClient, created_post: dict, logged_in_token: str
@@ -122,6 +185,67 @@ async def test_get_all_posts(
     assert response.json() == [created_post]
 
 
+@pytest.mark.anyio
+async def test_get_all_posts_msgpack(async_client: AsyncClient, created_post: dict):
+    response = await async_client.get("/post", headers={"Accept": MSGPACK})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == MSGPACK
+    assert msgpack.unpackb(response.content) == {
+        name: [value] for name, value in created_post.items()
+    }
+
+
+@pytest.mark.anyio
+@pytest.mark.query_budget(2, route="GET /post")
+async def test_get_all_posts_with_author(
+    async_client: AsyncClient, logged_in_token: str
+):
+    for number in range(3):
+        await create_post(f"Test post {number}", async_client, logged_in_token)
+
+    response = await async_client.get("/post", params={"include_author": True})
+
+    assert response.status_code == 200
+    assert [post["author"] for post in response.json()] == [
+        {"id": 1, "name": "te***@example.net"}
+    ] * 3
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_without_author(
+    async_client: AsyncClient, created_post: dict
+):
+    response = await async_client.get("/post")
+
+    assert "author" not in response.json()[0]
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_with_author_msgpack(
+    async_client: AsyncClient, created_post: dict
+):
+    response = await async_client.get(
+        "/post", params={"include_author": True}, headers={"Accept": MSGPACK}
+    )
+
+    assert msgpack.unpackb(response.content)["author"] == [
+        {"id": 1, "name": "te***@example.net"}
+    ]
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_gzip(async_client: AsyncClient, logged_in_token: str):
+    # Enough posts for the response to pass GZIP_MIN_SIZE
+    for number in range(20):
+        await create_post(f"Test post {number}", async_client, logged_in_token)
+
+    response = await async_client.get("/post", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()) == 20
+
+
 @pytest.mark.anyio
 @pytest.mark.parametrize(
     "sorting, expected_order",
@@ -168,6 +292,25 @@ async def test_get_all_posts_sort_likes(
     assert post_ids == expected_order
 
 
+@pytest.mark.anyio
+@pytest.mark.parametrize("posts", [500, 5000])
+@pytest.mark.query_budget(2, route="GET /post")
+async def test_get_all_posts_sort_likes_at_scale(
+    async_client: AsyncClient, make_dataset, posts: int
+):
+    dataset = await make_dataset(
+        users=200, posts=posts, comments=0, likes=posts * 4, viral_share=0.01
+    )
+
+    response = await async_client.get("/post", params={"sorting": "most_likes"})
+    assert response.status_code == 200
+
+    likes = [post["likes"] for post in response.json()]
+    assert len(likes) == posts
+    assert sum(likes) == dataset.spec.likes
+    assert likes == sorted(likes, reverse=True)
+
+
 @pytest.mark.anyio
 async def test_get_all_posts_wrong_sorting(
     async_client: AsyncClient,
@@ -177,6 +320,7 @@ async def test_get_all_posts_wrong_sorting(
 
 
 @pytest.mark.anyio
+@pytest.mark.query_budget(2, route="POST /comment")
 async def test_create_comment(
     async_client: AsyncClient,
     created_post: dict,
@@ -197,6 +341,35 @@ async def test_create_comment(
     assert {"id": 1, "body": "Test Comment"}.items() <= response.json().items()
 
 
+@pytest.mark.anyio
+@pytest.mark.parametrize("cached", [False, True])
+async def test_create_comment_missing_post(
+    async_client: AsyncClient, logged_in_token: str, cached: bool
+):
+    # A cached id whose post is gone must still be caught by the foreign key
+    known_posts.discard(2)
+    if cached:
+        known_posts.add(2)
+
+    response = await create_comment("Test Comment", 2, async_client, logged_in_token)
+
+    assert response == {"detail": "Post not found"}
+    assert 2 not in known_posts
+
+
+@pytest.mark.anyio
+async def test_create_comment_caches_post(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    known_posts.discard(created_post["id"])
+
+    await create_comment(
+        "Test Comment", created_post["id"], async_client, logged_in_token
+    )
+
+    assert created_post["id"] in known_posts
+
+
 @pytest.mark.anyio
 async def test_get_comments_for_post(
     async_client: AsyncClient, created_post: dict, created_comment: dict
@@ -208,6 +381,184 @@ async def test_get_comments_for_post(
     assert response.json() == [created_comment]
 
 
+@pytest.mark.anyio
+async def test_get_comments_for_post_msgpack(
+    async_client: AsyncClient, created_post: dict, created_comment: dict
+):
+    response = await async_client.get(
+        f"/post/{created_post['id']}/comment", headers={"Accept": MSGPACK}
+    )
+
+    assert response.status_code == 200
+    assert msgpack.unpackb(response.content) == {
+        name: [value] for name, value in created_comment.items()
+    }
+
+
+@pytest.mark.anyio
+@pytest.mark.query_budget(2, route="GET /post/{post_id}/comment")
+async def test_get_comments_for_post_with_author(
+    async_client: AsyncClient,
+    created_post: dict,
+    created_comment: dict,
+):
+    response = await async_client.get(
+        f"/post/{created_post['id']}/comment", params={"include_author": True}
+    )
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {**created_comment, "author": {"id": 1, "name": "te***@example.net"}}
+    ]
+
+
+@pytest.fixture()
+async def thread(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+) -> dict:
+    # a
+    # └ b
+    #   └ c
+    # d
+    comments = {}
+    for name, parent in [("a", None), ("b", "a"), ("c", "b"), ("d", None)]:
+        comments[name] = await create_comment(
+            name,
+            created_post["id"],
+            async_client,
+            logged_in_token,
+            parent_id=comments[parent]["id"] if parent else None,
+        )
+    return comments
+
+
+async def get_thread(async_client: AsyncClient, post_id: int, **params) -> list:
+    response = await async_client.get(f"/post/{post_id}/comment", params=params)
+    assert response.status_code == 200
+    return [comment["body"] for comment in response.json()]
+
+
+@pytest.mark.anyio
+async def test_create_reply(thread: dict):
+    assert (thread["b"]["parent_id"], thread["b"]["depth"]) == (thread["a"]["id"], 1)
+    assert thread["c"]["depth"] == 2
+
+
+@pytest.mark.anyio
+@pytest.mark.query_budget(2, route="GET /post/{post_id}/comment")
+async def test_get_comments_in_thread_order(
+    async_client: AsyncClient, created_post: dict, thread: dict
+):
+    response = await async_client.get(f"/post/{created_post['id']}/comment")
+
+    comments = response.json()
+    assert [comment["body"] for comment in comments] == ["a", "b", "c", "d"]
+    assert [comment["depth"] for comment in comments] == [0, 1, 2, 0]
+    assert [comment["replies"] for comment in comments] == [2, 1, 0, 0]
+
+
+@pytest.mark.anyio
+@pytest.mark.query_budget(2, route="GET /post/{post_id}/comment")
+async def test_get_replies(async_client: AsyncClient, created_post: dict, thread):
+    post_id = created_post["id"]
+
+    assert await get_thread(async_client, post_id, parent_id=thread["a"]["id"]) == [
+        "b",
+        "c",
+    ]
+    assert await get_thread(async_client, post_id, parent_id=thread["c"]["id"]) == []
+
+
+@pytest.mark.anyio
+async def test_get_comments_max_depth(
+    async_client: AsyncClient, created_post: dict, thread: dict
+):
+    post_id = created_post["id"]
+
+    assert await get_thread(async_client, post_id, max_depth=1) == ["a", "d"]
+    assert await get_thread(
+        async_client, post_id, parent_id=thread["a"]["id"], max_depth=1
+    ) == ["b"]
+
+
+@pytest.mark.anyio
+async def test_get_comments_pages(
+    async_client: AsyncClient, created_post: dict, thread: dict
+):
+    post_id = created_post["id"]
+
+    assert await get_thread(async_client, post_id, limit=2) == ["a", "b"]
+    assert await get_thread(async_client, post_id, after=thread["b"]["id"]) == [
+        "c",
+        "d",
+    ]
+
+
+@pytest.mark.anyio
+async def test_get_post_with_comments_is_not_paged(
+    async_client: AsyncClient, created_post: dict, thread: dict, mocker
+):
+    mocker.patch.object(config, "COMMENTS_PAGE_SIZE", 2)
+
+    response = await async_client.get(f"/post/{created_post['id']}")
+
+    comments = response.json()["comments"]
+    assert [comment["body"] for comment in comments] == ["a", "b", "c", "d"]
+
+
+@pytest.mark.anyio
+async def test_get_comments_uses_path_index(created_post: dict, thread: dict):
+    query = select_comments(created_post["id"], parent_id=thread["a"]["id"], limit=10)
+    sql = query.compile(
+        dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}
+    )
+
+    plan = await database.fetch_all(f"EXPLAIN QUERY PLAN {sql}")
+
+    details = [row.detail for row in plan]
+    assert any(
+        "ix_comments_post_id_path (post_id=? AND path>? AND path<?)" in detail
+        for detail in details
+    )
+
+
+@pytest.mark.anyio
+async def test_reply_to_comment_of_other_post(
+    async_client: AsyncClient, logged_in_token: str, thread: dict
+):
+    other_post = await create_post("Other post", async_client, logged_in_token)
+
+    response = await async_client.post(
+        "/comment",
+        json={"body": "x", "post_id": other_post["id"], "parent_id": thread["a"]["id"]},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Parent comment not found"}
+
+
+@pytest.mark.anyio
+async def test_reply_too_deep(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    parent_id = None
+    for _ in range(MAX_COMMENT_DEPTH):
+        comment = await create_comment(
+            "reply", created_post["id"], async_client, logged_in_token, parent_id
+        )
+        parent_id = comment["id"]
+
+    response = await async_client.post(
+        "/comment",
+        json={"body": "x", "post_id": created_post["id"], "parent_id": parent_id},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 422
+    assert response.json() == {"detail": "Replies are nested too deep"}
+
+
 @pytest.mark.anyio
 async def test_get_comments_on_post_empty(
     async_client: AsyncClient, created_post: dict
@@ -220,6 +571,7 @@ async def test_get_comments_on_post_empty(
 
 
 @pytest.mark.anyio
+@pytest.mark.query_budget(2, route="GET /post/{post_id}")
 async def test_get_post_with_comments(
     async_client: AsyncClient, created_post: dict, created_comment: dict
 ):
@@ -233,6 +585,37 @@ async def test_get_post_with_comments(
     }
 
 
+@pytest.mark.anyio
+async def test_concurrent_reads_of_a_post_share_queries(
+    async_client: AsyncClient, created_post: dict, query_log: list
+):
+    responses = await asyncio.gather(
+        *(async_client.get(f"/post/{created_post['id']}") for _ in range(10))
+    )
+
+    assert {response.status_code for response in responses} == {200}
+    reads = [stats for stats in query_log if stats.route == "GET /post/{post_id}"]
+    assert len(reads) == 10
+    assert sum(stats.count for stats in reads) == 2
+
+
+@pytest.mark.anyio
+async def test_comment_is_visible_right_away(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    await async_client.get(f"/post/{created_post['id']}")
+    comment = await create_comment(
+        "Test Comment", created_post["id"], async_client, logged_in_token
+    )
+    await like_post(async_client, logged_in_token, created_post["id"])
+
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert response.json() == {
+        "post": {**created_post, "likes": 1},
+        "comments": [comment],
+    }
+
+
 @pytest.mark.anyio
 async def test_get_missing_post_with_comments(
     async_client: AsyncClient, created_post: dict, created_comment: dict
@@ -242,3 +625,38 @@ async def test_get_missing_post_with_comments(
     )
     assert response.status_code == 404
     assert response.json() == {"detail": "Post not found"}
+
+
+@pytest.mark.anyio
+async def test_writes_publish_events(
+    async_client: AsyncClient, logged_in_token: str, subscription
+):
+    post = await create_post("Test Post", async_client, logged_in_token)
+    comment = await create_comment(
+        "Test Comment", post["id"], async_client, logged_in_token
+    )
+    await like_post(async_client, logged_in_token, post["id"])
+    await like_post(async_client, logged_in_token, post["id"])
+    await async_client.delete(
+        f"/like/{post['id']}", headers={"Authorization": f"Bearer {logged_in_token}"}
+    )
+
+    published = []
+    while not subscription.queue.empty():
+        event = subscription.queue.get_nowait()
+        published.append((event.type, event.data))
+
+    assert published == [
+        (
+            "post",
+            {
+                "id": post["id"],
+                "body": "Test Post",
+                "user_id": post["user_id"],
+                "media": [],
+            },
+        ),
+        ("comment", comment),
+        ("like", {"post_id": post["id"], "delta": 1}),
+        ("like", {"post_id": post["id"], "delta": -1}),
+    ]
@@ -2,6 +2,8 @@ import pytest
 from fastapi import Request
 from httpx import AsyncClient
 
+from app.database import database, job_table
+
 
 async def register_user(async_client: AsyncClient, email: str, password: str):
     return await async_client.post(
@@ -21,6 +23,17 @@ async def test_register_user(async_client: AsyncClient):
     assert "user created" in response.json()["detail"]
 
 
+@pytest.mark.anyio
+@pytest.mark.query_budget(2, route="POST /register")
+async def test_register_user_enqueues_confirmation_email(async_client: AsyncClient):
+    await register_user(async_client, "test@mahimai.ca", "1234")
+
+    job = await database.fetch_one(job_table.select())
+    assert job.name == "send_confirmation_email"
+    assert job.payload["email"] == "test@mahimai.ca"
+    assert job.payload["confirmation_url"].startswith("http://testserver/confirm/")
+
+
 @pytest.mark.anyio
 async def test_register_user_already_exist(
     async_client: AsyncClient, registered_user: dict
@@ -104,3 +117,44 @@ async def test_login_user(async_client: AsyncClient, confirmed_user: dict):
 
     assert response.status_code == 200
     assert "bearer" in response.json()["token_type"]
+
+
+@pytest.mark.anyio
+async def test_get_user_stats(async_client: AsyncClient, registered_user: dict):
+    response = await async_client.get(f"/user/{registered_user['id']}/stats")
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "user_id": registered_user["id"],
+        "posts": 0,
+        "comments": 0,
+        "likes_given": 0,
+        "likes_received": 0,
+    }
+
+
+@pytest.mark.anyio
+async def test_get_user_stats_missing_user(async_client: AsyncClient):
+    response = await async_client.get("/user/1/stats")
+
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_revoke_tokens(async_client: AsyncClient, confirmed_user: dict):
+    token = (
+        await async_client.post(
+            "/token",
+            data={
+                "username": confirmed_user["email"],
+                "password": confirmed_user["password"],
+            },
+        )
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = await async_client.post("/token/revoke", headers=headers)
+    assert response.status_code == 204
+
+    response = await async_client.post("/post", json={"body": "x"}, headers=headers)
+    assert response.status_code == 401
@@ -0,0 +1,149 @@
+import time
+
+import pytest
+from httpx import AsyncClient
+
+from app.archive import archive_posts
+from app.database import (
+    archived_comment_table,
+    archived_post_table,
+    change_table,
+    comment_table,
+    database,
+    like_table,
+    post_table,
+)
+from app.tests.routers.test_posts import create_comment, create_post, like_post
+
+DAY = 86400
+
+
+async def age_post(post_id: int, days: float) -> None:
+    query = (
+        post_table.update()
+        .where(post_table.c.id == post_id)
+        .values(created_at=time.time() - days * DAY)
+    )
+    await database.execute(query)
+
+
+@pytest.fixture()
+async def old_post(async_client: AsyncClient, logged_in_token: str) -> dict:
+    post = await create_post("Old post", async_client, logged_in_token)
+    await create_comment("Old comment", post["id"], async_client, logged_in_token)
+    await like_post(async_client, logged_in_token, post["id"])
+    await age_post(post["id"], 30)
+    return post
+
+
+@pytest.mark.anyio
+async def test_archive_moves_old_posts(
+    async_client: AsyncClient, logged_in_token: str, old_post: dict
+):
+    new_post = await create_post("New post", async_client, logged_in_token)
+
+    assert await archive_posts(older_than_days=7, batch_size=10) == 1
+
+    hot_ids = [post.id for post in await database.fetch_all(post_table.select())]
+    assert hot_ids == [new_post["id"]]
+    archived = await database.fetch_one(archived_post_table.select())
+    assert (archived.id, archived.body, archived.likes) == (
+        old_post["id"],
+        "Old post",
+        1,
+    )
+    comments = await database.fetch_all(archived_comment_table.select())
+    assert [comment.body for comment in comments] == ["Old comment"]
+    assert await database.fetch_all(like_table.select()) == []
+
+
+@pytest.mark.anyio
+async def test_archive_in_batches(async_client: AsyncClient, logged_in_token: str):
+    for number in range(5):
+        post = await create_post(f"Post {number}", async_client, logged_in_token)
+        await age_post(post["id"], 30)
+
+    assert await archive_posts(older_than_days=7, batch_size=2) == 5
+    assert await database.fetch_all(post_table.select()) == []
+
+
+@pytest.mark.anyio
+async def test_archive_nothing_old(async_client: AsyncClient, logged_in_token: str):
+    await create_post("New post", async_client, logged_in_token)
+
+    assert await archive_posts(older_than_days=7, batch_size=10) == 0
+
+
+@pytest.mark.anyio
+async def test_archive_does_not_log_unlikes(old_post: dict):
+    await archive_posts(older_than_days=7, batch_size=10)
+
+    changes = await database.fetch_all(change_table.select())
+    assert [change.op for change in changes if change.entity == "like"] == ["upsert"]
+
+
+@pytest.mark.anyio
+async def test_archived_post_is_served(async_client: AsyncClient, old_post: dict):
+    await archive_posts(older_than_days=7, batch_size=10)
+
+    response = await async_client.get(f"/post/{old_post['id']}")
+
+    assert response.status_code == 200
+    assert response.json()["post"] == {**old_post, "likes": 1}
+    assert [comment["body"] for comment in response.json()["comments"]] == [
+        "Old comment"
+    ]
+
+
+@pytest.mark.anyio
+async def test_archived_thread_is_served(
+    async_client: AsyncClient, logged_in_token: str, old_post: dict
+):
+    first = await database.fetch_one(
+        comment_table.select().where(comment_table.c.post_id == old_post["id"])
+    )
+    await create_comment(
+        "Old reply", old_post["id"], async_client, logged_in_token, first.id
+    )
+    await archive_posts(older_than_days=7, batch_size=10)
+
+    response = await async_client.get(
+        f"/post/{old_post['id']}/comment", params={"parent_id": first.id}
+    )
+
+    assert [(c["body"], c["depth"]) for c in response.json()] == [("Old reply", 1)]
+
+
+@pytest.mark.anyio
+async def test_archived_post_not_in_feed(async_client: AsyncClient, old_post: dict):
+    await archive_posts(older_than_days=7, batch_size=10)
+
+    response = await async_client.get("/post")
+
+    assert response.json() == []
+
+
+@pytest.mark.anyio
+async def test_archived_post_is_read_only(
+    async_client: AsyncClient, logged_in_token: str, old_post: dict
+):
+    await archive_posts(older_than_days=7, batch_size=10)
+
+    response = await async_client.post(
+        "/comment",
+        json={"body": "Late comment", "post_id": old_post["id"]},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_archived_post_id_not_reused(
+    async_client: AsyncClient, logged_in_token: str, old_post: dict
+):
+    await archive_posts(older_than_days=7, batch_size=10)
+
+    post = await create_post("New post", async_client, logged_in_token)
+
+    assert post["id"] > old_post["id"]
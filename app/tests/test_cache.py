@@ -0,0 +1,57 @@
+import pytest
+
+from app.cache import RecentDict, RecentSet
+
+
+@pytest.mark.anyio
+async def test_recent_set_evicts_least_recent():
+    recent = RecentSet(maxsize=2)
+    recent.add(1)
+    recent.add(2)
+    assert 1 in recent
+
+    recent.add(3)
+
+    assert 1 in recent
+    assert 2 not in recent
+    assert len(recent) == 2
+
+
+@pytest.mark.anyio
+async def test_recent_set_discard():
+    recent = RecentSet(maxsize=2)
+    recent.add(1)
+    recent.discard(1)
+    recent.discard(1)
+
+    assert 1 not in recent
+
+
+@pytest.mark.anyio
+async def test_recent_dict_evicts_least_recent():
+    recent = RecentDict(maxsize=2)
+    recent.set(1, "a")
+    recent.set(2, "b")
+    assert recent.get(1) == "a"
+
+    recent.set(3, "c")
+
+    assert recent.get(1) == "a"
+    assert recent.get(2) is None
+    assert len(recent) == 2
+
+
+@pytest.mark.anyio
+async def test_recent_dict_default():
+    assert RecentDict(maxsize=2).get(1, "missing") == "missing"
+
+
+@pytest.mark.anyio
+async def test_recent_dict_discard():
+    recent = RecentDict(maxsize=2)
+    recent.set(1, "a")
+    recent.discard(1)
+    recent.discard(1)
+
+    assert recent.get(1) is None
+    assert len(recent) == 0
@@ -0,0 +1,31 @@
+import pytest
+import sqlalchemy
+
+from app import database
+
+
+@pytest.mark.anyio
+async def test_create_schema_is_idempotent(tmp_path, mocker):
+    # A database of its own, the suite's is locked by the open test transaction
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+    mocker.patch.object(database, "get_engine", return_value=engine)
+
+    database.create_schema()
+    database.create_schema()
+
+    assert "posts" in sqlalchemy.inspect(engine).get_table_names()
+
+
+@pytest.mark.anyio
+async def test_sqlite_options_enable_foreign_keys():
+    assert database.database_options() == {"factory": database.ForeignKeysConnection}
+
+
+@pytest.mark.anyio
+async def test_pool_split_between_workers(mocker):
+    url = mocker.patch.object(database, "database_url")
+    url.get_backend_name.return_value = "postgresql"
+    mocker.patch.object(database.config, "DB_POOL_SIZE", 20)
+    mocker.patch.object(database.config, "WEB_CONCURRENCY", 3)
+
+    assert database.database_options() == {"min_size": 1, "max_size": 6}
@@ -0,0 +1,87 @@
+import pytest
+import sqlalchemy
+
+from app.database import comment_table, database, like_table, post_table, user_table
+from app.datagen import DatasetGenerator, DatasetSpec, parse_args
+from app.stats import check_user_stats
+
+SPEC = DatasetSpec(users=50, posts=200, comments=300, likes=1000, seed=7)
+
+
+def rows(spec: DatasetSpec) -> tuple[list, list, list]:
+    generator = DatasetGenerator(spec, first_user_id=1, first_post_id=1)
+    return (
+        list(generator.posts(now=0.0)),
+        list(generator.comments()),
+        list(generator.likes()),
+    )
+
+
+async def count(table: sqlalchemy.Table) -> int:
+    query = sqlalchemy.select(sqlalchemy.func.count()).select_from(table)
+    return await database.fetch_val(query)
+
+
+@pytest.mark.anyio
+async def test_same_seed_same_rows():
+    assert rows(SPEC) == rows(SPEC)
+    assert rows(SPEC) != rows(DatasetSpec(**{**vars(SPEC), "seed": 8}))
+
+
+@pytest.mark.anyio
+async def test_likes_are_unique_per_user_and_post():
+    _, _, likes = rows(SPEC)
+
+    assert len({(like["post_id"], like["user_id"]) for like in likes}) == SPEC.likes
+
+
+@pytest.mark.anyio
+async def test_too_many_likes():
+    with pytest.raises(ValueError):
+        DatasetGenerator(DatasetSpec(users=2, posts=2, likes=3), 1, 1)
+
+
+@pytest.mark.anyio
+async def test_load_dataset(make_dataset):
+    dataset = await make_dataset(users=20, posts=100, comments=50, likes=400)
+
+    assert dataset.user_ids == range(1, 21)
+    assert dataset.post_ids == range(1, 101)
+    assert await count(user_table) == 20
+    assert await count(post_table) == 100
+    assert await count(comment_table) == 50
+    assert await count(like_table) == 400
+    # The triggers kept the stats in step with the bulk insert
+    assert await check_user_stats(batch_size=7) == 0
+
+
+@pytest.mark.anyio
+async def test_load_dataset_appends(make_dataset):
+    await make_dataset(users=10, posts=10, comments=0, likes=10)
+    dataset = await make_dataset(users=10, posts=10, comments=0, likes=10)
+
+    assert dataset.user_ids == range(11, 21)
+    assert dataset.post_ids == range(11, 21)
+
+
+@pytest.mark.anyio
+async def test_likes_are_skewed(large_dataset):
+    likes = sqlalchemy.func.count(like_table.c.id).label("likes")
+    query = (
+        sqlalchemy.select(like_table.c.post_id, likes)
+        .group_by(like_table.c.post_id)
+        .order_by(likes.desc())
+    )
+    counts = [row.likes for row in await database.fetch_all(query)]
+
+    # The top 1% of the posts get a large share of all likes
+    top = len(large_dataset.post_ids) // 100
+    assert sum(counts[:top]) > 0.25 * sum(counts)
+
+
+@pytest.mark.anyio
+async def test_parse_args():
+    spec = parse_args(["--posts", "5", "--viral-share", "0.5", "--seed", "3"])
+
+    assert (spec.posts, spec.viral_share, spec.seed) == (5, 0.5, 3)
+    assert spec.users == DatasetSpec().users
@@ -0,0 +1,115 @@
+import time
+
+import anyio
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from app import deadlines
+from app.database import database
+from app.deadlines import DeadlineExceeded, DeadlineMiddleware
+from app.main import deadline_exceeded_handler
+
+# Takes many seconds unless interrupted
+SLOW_QUERY = (
+    "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c "
+    "WHERE x < 1000000000) SELECT count(*) FROM c"
+)
+
+
+def make_app(route_deadlines: dict[str, float]) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/slow")
+    async def slow():
+        return await database.fetch_val(SLOW_QUERY)
+
+    @app.get("/fast")
+    async def fast():
+        return await database.fetch_val("SELECT 1")
+
+    app.add_exception_handler(DeadlineExceeded, deadline_exceeded_handler)
+    app.add_middleware(DeadlineMiddleware, deadlines=route_deadlines, default=None)
+    return app
+
+
+async def get(app: FastAPI, path: str):
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        return await client.get(path)
+
+
+@pytest.mark.anyio
+async def test_query_within_deadline():
+    response = await get(make_app({"GET /fast": 5}), "/fast")
+
+    assert response.status_code == 200
+    assert response.json() == 1
+
+
+@pytest.mark.anyio
+async def test_slow_query_times_out():
+    timeouts = deadlines.timeouts["GET /slow"]
+    start = time.monotonic()
+
+    response = await get(make_app({"GET /slow": 0.2}), "/slow")
+
+    assert response.status_code == 504
+    assert time.monotonic() - start < 2
+    assert deadlines.timeouts["GET /slow"] == timeouts + 1
+    # The interrupted statement does not keep the connection busy
+    assert await database.fetch_val("SELECT 1") == 1
+
+
+@pytest.mark.anyio
+async def test_no_time_left_is_rejected(mocker):
+    rejections = deadlines.rejections["GET /fast"]
+    fetch_val = mocker.spy(database, "fetch_val")
+
+    response = await get(make_app({"GET /fast": 0}), "/fast")
+
+    assert response.status_code == 503
+    assert deadlines.rejections["GET /fast"] == rejections + 1
+    assert fetch_val.spy_return_list == []
+
+
+@pytest.mark.anyio
+async def test_disconnect_cancels_query():
+    cancellations = deadlines.cancellations["GET /slow"]
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await anyio.sleep(0.2)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/slow",
+        "headers": [],
+        "query_string": b"",
+    }
+    start = time.monotonic()
+
+    await make_app({})(scope, receive, send)
+
+    assert time.monotonic() - start < 2
+    assert sent == []
+    assert deadlines.cancellations["GET /slow"] == cancellations + 1
+    assert await database.fetch_val("SELECT 1") == 1
+
+
+@pytest.mark.anyio
+async def test_completed_request_is_not_cancelled():
+    cancellations = sum(deadlines.cancellations.values())
+
+    await get(make_app({}), "/fast")
+
+    assert sum(deadlines.cancellations.values()) == cancellations
@@ -0,0 +1,59 @@
+import pytest
+from httpx import AsyncClient
+
+from app.encoding import MSGPACK, accepts_msgpack, columnar
+from app.models.post import UserPostWithLikes
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "accept, expected",
+    [
+        (None, False),
+        ("application/json", False),
+        ("*/*", False),
+        (MSGPACK, True),
+        (f"application/json;q=0.5, {MSGPACK};q=1", True),
+    ],
+)
+async def test_accepts_msgpack(accept, expected):
+    assert accepts_msgpack(accept) is expected
+
+
+@pytest.mark.anyio
+async def test_columnar_uses_model_fields():
+    rows = [
+        {"id": 1, "body": "a", "media": [], "user_id": 1, "likes": 0, "extra": "x"},
+        {"id": 2, "body": "b", "media": ["f"], "user_id": 2, "likes": 3, "extra": "y"},
+    ]
+
+    assert columnar(UserPostWithLikes, rows) == {
+        "body": ["a", "b"],
+        "media": [[], ["f"]],
+        "id": [1, 2],
+        "user_id": [1, 2],
+        "likes": [0, 3],
+    }
+
+
+@pytest.mark.anyio
+async def test_columnar_empty():
+    assert columnar(UserPostWithLikes, []) == {
+        "body": [],
+        "media": [],
+        "id": [],
+        "user_id": [],
+        "likes": [],
+    }
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("url", ["/post", "/post/1/comment"])
+@pytest.mark.parametrize("accept", ["application/json", MSGPACK])
+async def test_negotiated_responses_vary_on_accept(
+    async_client: AsyncClient, url: str, accept: str
+):
+    response = await async_client.get(url, headers={"Accept": accept})
+
+    assert response.headers["content-type"].startswith(accept)
+    assert "Accept" in response.headers["vary"].split(", ")
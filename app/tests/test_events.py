@@ -0,0 +1,91 @@
+import pytest
+
+from app.events import EVICTED, RESTARTING, Event, EventHub, event_stream
+
+
+@pytest.mark.anyio
+async def test_event_encode():
+    event = Event("post", {"id": 1}, id=7)
+
+    assert event.encode() == 'id: 7\nevent: post\ndata: {"id": 1}\n\n'
+
+
+@pytest.mark.anyio
+async def test_dispatch_fans_out():
+    hub = EventHub(buffer_size=10)
+    first, second = hub.subscribe(), hub.subscribe()
+    event = Event("post", {"id": 1})
+
+    hub.dispatch(event)
+
+    assert await first.get() is event
+    assert await second.get() is event
+
+
+@pytest.mark.anyio
+async def test_slow_subscriber_is_evicted():
+    hub = EventHub(buffer_size=2)
+    slow, fast = hub.subscribe(), hub.subscribe()
+
+    for number in range(3):
+        hub.dispatch(Event("post", {"id": number}))
+        await fast.get()
+
+    assert slow.evicted
+    assert hub.subscribers == {fast}
+    assert await slow.get() is EVICTED
+    assert slow.queue.empty()
+
+
+@pytest.mark.anyio
+async def test_event_stream_heartbeat_and_eviction():
+    hub = EventHub(buffer_size=1)
+    subscription = hub.subscribe()
+    stream = event_stream(subscription, heartbeat=0.01)
+
+    assert await anext(stream) == ": ping\n\n"
+
+    subscription.evict()
+    assert "event: evicted" in await anext(stream)
+    with pytest.raises(StopAsyncIteration):
+        await anext(stream)
+
+
+@pytest.mark.anyio
+async def test_event_stream_unsubscribes_on_close():
+    hub = EventHub(buffer_size=1)
+    subscription = hub.subscribe()
+    stream = event_stream(subscription, heartbeat=0.01)
+    await anext(stream)
+
+    await stream.aclose()
+
+    assert hub.subscribers == set()
+
+
+@pytest.mark.anyio
+async def test_close_ends_streams_after_buffered_events():
+    hub = EventHub(buffer_size=2)
+    subscription = hub.subscribe()
+    stream = event_stream(subscription, heartbeat=1)
+    hub.dispatch(Event("post", {"id": 1}))
+
+    hub.close()
+
+    assert hub.subscribers == set()
+    assert "event: post" in await anext(stream)
+    assert "event: restarting" in await anext(stream)
+    with pytest.raises(StopAsyncIteration):
+        await anext(stream)
+
+
+@pytest.mark.anyio
+async def test_close_full_subscriber_is_evicted():
+    hub = EventHub(buffer_size=1)
+    subscription = hub.subscribe()
+    hub.dispatch(Event("post", {"id": 1}))
+
+    hub.close()
+
+    assert await subscription.get() is EVICTED
+    assert RESTARTING not in subscription.queue._queue
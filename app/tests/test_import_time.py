@@ -0,0 +1,18 @@
+import os
+
+import pytest
+
+from benchmarks.import_time import import_time_ms, loaded_lazy_modules
+
+# Generous enough for a loaded CI box, tight enough to catch a new eager import
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("IMPORT_TIME_BUDGET_MS", 2000))
+
+
+@pytest.mark.anyio
+async def test_heavy_dependencies_load_lazily():
+    assert loaded_lazy_modules() == []
+
+
+@pytest.mark.anyio
+async def test_import_time_budget():
+    assert import_time_ms() <= IMPORT_TIME_BUDGET_MS
@@ -0,0 +1,185 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+import sqlalchemy
+
+from app.database import database
+from app.jobs import JobQueue, job_queue
+
+
+@pytest.fixture()
+def queue() -> JobQueue:
+    return JobQueue(max_attempts=2, backoff=10, lease=60, poll_interval=0.01)
+
+
+@pytest.mark.anyio
+async def test_enqueue_and_run(queue: JobQueue):
+    calls = []
+
+    @queue.task
+    async def remember(value: int):
+        calls.append(value)
+
+    job_id = await queue.enqueue("remember", value=1)
+    assert (await queue.get(job_id)).status == "pending"
+
+    assert await queue.run_pending() == 1
+    assert calls == [1]
+    job = await queue.get(job_id)
+    assert (job.status, job.attempts) == ("done", 1)
+
+
+@pytest.mark.anyio
+async def test_failed_job_retries_with_backoff(queue: JobQueue):
+    @queue.task
+    async def explode():
+        raise ValueError("boom")
+
+    job_id = await queue.enqueue("explode")
+    now = time.time()
+
+    await queue.run_pending(now)
+    job = await queue.get(job_id)
+    assert (job.status, job.attempts) == ("pending", 1)
+    assert "boom" in job.last_error
+    assert job.run_at >= now + 10
+
+    # Not due yet, then due once the backoff has passed
+    assert await queue.run_pending(now + 1) == 0
+    assert await queue.run_pending(now + 20) == 1
+    job = await queue.get(job_id)
+    assert (job.status, job.attempts) == ("failed", 2)
+
+
+@pytest.mark.anyio
+async def test_expired_lease_is_reclaimed(queue: JobQueue):
+    job_id = await queue.enqueue("missing_handler")
+    now = time.time()
+
+    claimed = await queue._claim(now)
+    assert claimed.id == job_id
+    assert await queue._claim(now + 30) is None
+    assert (await queue._claim(now + 61)).attempts == 2
+
+
+@pytest.mark.anyio
+async def test_workers_process_jobs(queue: JobQueue):
+    done = []
+
+    @queue.task
+    async def remember(value: int):
+        done.append(value)
+
+    await queue.start(2)
+    try:
+        await queue.enqueue("remember", value=1)
+        for _ in range(100):
+            if done:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await queue.stop()
+
+    assert done == [1]
+
+
+@pytest.mark.anyio
+async def test_worker_survives_failed_status_update(queue: JobQueue, mocker):
+    done = []
+
+    @queue.task
+    async def remember(value: int):
+        done.append(value)
+
+    execute = database.execute
+    failures = []
+
+    async def locked_once(query, values=None):
+        if isinstance(query, sqlalchemy.Update) and not failures:
+            failures.append(query)
+            raise sqlite3.OperationalError("database is locked")
+        return await execute(query, values)
+
+    mocker.patch.object(database, "execute", side_effect=locked_once)
+    await queue.start(1)
+    try:
+        first = await queue.enqueue("remember", value=1)
+        second = await queue.enqueue("remember", value=2)
+        for _ in range(100):
+            if len(done) == 2:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await queue.stop()
+
+    assert done == [1, 2]
+    # Left running until its lease expires, the worker carried on
+    assert (await queue.get(first)).status == "running"
+    assert (await queue.get(second)).status == "done"
+
+
+@pytest.mark.anyio
+async def test_stop_lets_running_job_finish(queue: JobQueue):
+    started, done = asyncio.Event(), []
+
+    @queue.task
+    async def slow():
+        started.set()
+        await asyncio.sleep(0.05)
+        done.append(True)
+
+    await queue.start(2)
+    job_id = await queue.enqueue("slow")
+    await asyncio.wait_for(started.wait(), 1)
+    await queue.stop(timeout=1)
+
+    assert done == [True]
+    assert (await queue.get(job_id)).status == "done"
+
+
+@pytest.mark.anyio
+async def test_stop_cancels_job_after_timeout(queue: JobQueue):
+    started = asyncio.Event()
+
+    @queue.task
+    async def stuck():
+        started.set()
+        await asyncio.sleep(60)
+
+    await queue.start(1)
+    job_id = await queue.enqueue("stuck")
+    await asyncio.wait_for(started.wait(), 1)
+    await queue.stop(timeout=0.01)
+
+    # Left to be reclaimed once its lease expires
+    assert (await queue.get(job_id)).status == "running"
+
+
+@pytest.mark.anyio
+async def test_enqueue_with_delay(queue: JobQueue):
+    @queue.task
+    async def later():
+        pass
+
+    now = time.time()
+    await queue.enqueue("later", delay=60)
+
+    assert await queue.run_pending(now) == 0
+    assert await queue.run_pending(now + 61) == 1
+
+
+@pytest.mark.anyio
+async def test_ensure_scheduled_once(queue: JobQueue):
+    await queue.ensure_scheduled("recurring")
+    await queue.ensure_scheduled("recurring")
+
+    job = await queue._claim()
+    assert (job.name, job.payload) == ("recurring", {})
+    assert await queue._claim() is None
+
+
+@pytest.mark.anyio
+async def test_send_confirmation_email_registered():
+    assert "send_confirmation_email" in job_queue.handlers
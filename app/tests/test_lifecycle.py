@@ -0,0 +1,113 @@
+import asyncio
+import signal
+
+import pytest
+import uvicorn
+from httpx import AsyncClient
+
+from app.events import hub
+from app.lifecycle import Drain, drain, stop_accepting_on_signals
+from app.server import DrainingServer
+
+
+@pytest.fixture()
+def draining():
+    yield drain
+    drain.reset()
+    drain.server_managed = False
+
+
+@pytest.mark.anyio
+async def test_wait_idle():
+    state = Drain()
+    assert await state.wait_idle(0)
+
+    state.started()
+    assert not await state.wait_idle(0.01)
+
+    asyncio.get_running_loop().call_later(0.01, state.finished)
+    assert await state.wait_idle(1)
+
+
+@pytest.mark.anyio
+async def test_stop_accepting_closes_event_streams(draining: Drain):
+    subscription = hub.subscribe()
+
+    draining.stop_accepting()
+
+    assert draining.draining
+    assert subscription not in hub.subscribers
+    assert (await subscription.get()).type == "restarting"
+
+
+@pytest.mark.anyio
+async def test_exit_signal_stops_accepting(mocker):
+    state = Drain()
+    server_handler = mocker.Mock()
+    original = signal.signal(signal.SIGTERM, server_handler)
+    try:
+        restore = stop_accepting_on_signals(state)
+        signal.raise_signal(signal.SIGTERM)
+        await asyncio.sleep(0)
+
+        assert not state.accepting
+        server_handler.assert_called_once()
+
+        restore()
+        assert signal.getsignal(signal.SIGTERM) is server_handler
+    finally:
+        signal.signal(signal.SIGTERM, original)
+
+
+@pytest.mark.anyio
+async def test_exit_signal_left_to_draining_server(draining: Drain):
+    DrainingServer(uvicorn.Config(app=None), delay=60)
+    handler = signal.getsignal(signal.SIGTERM)
+
+    stop_accepting_on_signals(draining)
+
+    assert signal.getsignal(signal.SIGTERM) is handler
+
+
+@pytest.mark.anyio
+async def test_draining_still_serves(async_client: AsyncClient, draining: Drain):
+    draining.begin()
+
+    assert (await async_client.get("/post")).status_code == 200
+
+
+@pytest.mark.anyio
+async def test_stopped_rejects_requests(async_client: AsyncClient, draining: Drain):
+    draining.stop_accepting()
+
+    response = await async_client.get("/post")
+
+    assert response.status_code == 503
+    assert response.headers["connection"] == "close"
+    assert (await async_client.get("/health/live")).status_code == 200
+
+
+@pytest.mark.anyio
+async def test_requests_are_counted(async_client: AsyncClient, mocker):
+    started = mocker.spy(drain, "started")
+    finished = mocker.spy(drain, "finished")
+
+    await async_client.get("/post")
+
+    assert started.call_count == finished.call_count == 1
+    assert drain.in_flight == 0
+
+
+@pytest.mark.anyio
+async def test_server_delays_exit(draining: Drain):
+    server = DrainingServer(uvicorn.Config(app=None), delay=60)
+    server.should_exit = True
+
+    assert not await server.on_tick(0)
+    assert draining.draining
+    assert draining.accepting
+
+    # A second Ctrl-C goes ahead without waiting
+    server.force_exit = True
+    assert await server.on_tick(1)
+    assert not draining.accepting
@@ -0,0 +1,89 @@
+import pytest
+import sqlalchemy
+
+from app.cache import RecentDict
+from app.database import database, user_table
+from app.loaders import UserLoader, display_name, with_authors
+from app.models.user import Author
+
+
+@pytest.fixture()
+async def users() -> list[int]:
+    return [
+        await database.execute(user_table.insert().values(email=email))
+        for email in ["alice@example.net", "bob@example.net", "x@example.net"]
+    ]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "email, expected",
+    [
+        ("testemail@example.net", "te***@example.net"),
+        ("x@example.net", "x***@example.net"),
+    ],
+)
+async def test_display_name(email, expected):
+    assert display_name(email) == expected
+
+
+@pytest.mark.anyio
+async def test_load_many_single_query(users: list[int], mocker):
+    fetch_all = mocker.spy(database, "fetch_all")
+    loader = UserLoader(RecentDict(maxsize=10))
+
+    authors = await loader.load_many([users[0], users[1], users[0], users[2]])
+
+    assert fetch_all.call_count == 1
+    assert authors == {
+        users[0]: Author(id=users[0], name="al***@example.net"),
+        users[1]: Author(id=users[1], name="bo***@example.net"),
+        users[2]: Author(id=users[2], name="x***@example.net"),
+    }
+
+
+@pytest.mark.anyio
+async def test_load_many_uses_cache(users: list[int], mocker):
+    cache = RecentDict(maxsize=10)
+    await UserLoader(cache).load_many(users[:2])
+    fetch_all = mocker.spy(database, "fetch_all")
+
+    authors = await UserLoader(cache).load_many(users[:2])
+
+    assert fetch_all.call_count == 0
+    assert set(authors) == set(users[:2])
+
+
+@pytest.mark.anyio
+async def test_load_many_only_fetches_missing(users: list[int], mocker):
+    cache = RecentDict(maxsize=10)
+    await UserLoader(cache).load_many(users[:1])
+    fetch_all = mocker.spy(database, "fetch_all")
+
+    authors = await UserLoader(cache).load_many(users)
+
+    assert fetch_all.call_count == 1
+    assert set(authors) == set(users)
+
+
+@pytest.mark.anyio
+async def test_load_many_empty(mocker):
+    fetch_all = mocker.spy(database, "fetch_all")
+
+    assert await UserLoader(RecentDict(maxsize=10)).load_many([]) == {}
+    assert fetch_all.call_count == 0
+
+
+@pytest.mark.anyio
+async def test_with_authors_missing_user(users: list[int]):
+    deleted = users[-1] + 100
+    query = sqlalchemy.select(sqlalchemy.literal(users[0]).label("user_id")).union_all(
+        sqlalchemy.select(sqlalchemy.literal(deleted).label("user_id"))
+    )
+
+    rows = await with_authors(await database.fetch_all(query))
+
+    assert rows == [
+        {"user_id": users[0], "author": {"id": users[0], "name": "al***@example.net"}},
+        {"user_id": deleted, "author": None},
+    ]
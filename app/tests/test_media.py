@@ -0,0 +1,106 @@
+import asyncio
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from app import media
+from app.media import THUMBNAIL, LocalMediaStore, MediaTooLarge, render_thumbnail
+
+
+async def chunks(*parts: bytes):
+    for part in parts:
+        yield part
+
+
+def png(width: int, height: int) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), "red").save(output, "PNG")
+    return output.getvalue()
+
+
+@pytest.fixture()
+def store(tmp_path) -> LocalMediaStore:
+    return LocalMediaStore(str(tmp_path))
+
+
+@pytest.mark.anyio
+async def test_save_is_content_addressed(store: LocalMediaStore):
+    stored = await store.save(chunks(b"hello ", b"world"), max_bytes=100)
+
+    assert stored.created
+    assert stored.size == 11
+    assert stored.digest == (
+        "b94d27b9934d3e08a52e52d7da7dabfac484efe37a5380ee9088f7ace2efcde9"
+    )
+    assert store.read(stored.digest) == b"hello world"
+    assert store.path(stored.digest).parent.name == stored.digest[:2]
+
+
+@pytest.mark.anyio
+async def test_save_deduplicates(store: LocalMediaStore):
+    first = await store.save(chunks(b"hello world"), max_bytes=100)
+    second = await store.save(chunks(b"hello ", b"world"), max_bytes=100)
+
+    assert second.digest == first.digest
+    assert not second.created
+    assert os.listdir(store.root / "incoming") == []
+
+
+@pytest.mark.anyio
+async def test_save_too_large(store: LocalMediaStore):
+    with pytest.raises(MediaTooLarge):
+        await store.save(chunks(b"12345", b"67890"), max_bytes=8)
+
+    # Nothing is left behind
+    assert os.listdir(store.root) == ["incoming"]
+    assert os.listdir(store.root / "incoming") == []
+
+
+@pytest.mark.anyio
+async def test_write_variant(store: LocalMediaStore):
+    stored = await store.save(chunks(b"original"), max_bytes=100)
+    store.write(stored.digest, THUMBNAIL, b"small")
+
+    assert store.exists(stored.digest, THUMBNAIL)
+    assert store.read(stored.digest, THUMBNAIL) == b"small"
+    assert store.read(stored.digest) == b"original"
+
+
+@pytest.mark.anyio
+async def test_save_cancelled(store: LocalMediaStore):
+    async def stalled():
+        yield b"partial"
+        await asyncio.Event().wait()
+
+    upload = asyncio.create_task(store.save(stalled(), max_bytes=100))
+    await asyncio.sleep(0.05)
+    upload.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await upload
+
+    assert os.listdir(store.root / "incoming") == []
+
+
+@pytest.mark.anyio
+async def test_render_thumbnail():
+    thumbnail = render_thumbnail(io.BytesIO(png(800, 400)), size=100)
+
+    with Image.open(io.BytesIO(thumbnail)) as image:
+        assert image.format == "JPEG"
+        assert image.size == (100, 50)
+
+
+@pytest.mark.anyio
+async def test_create_thumbnail_bad_images(mocker, tmp_path):
+    local = LocalMediaStore(str(tmp_path))
+    mocker.patch.object(media, "store", local)
+    mocker.patch.object(Image, "MAX_IMAGE_PIXELS", 1000)
+    truncated = await local.save(chunks(png(20, 20)[:60]), max_bytes=10_000)
+    bomb = await local.save(chunks(png(100, 100)), max_bytes=100_000)
+
+    # Both are given up on rather than raised for the job to retry
+    assert not await media.create_thumbnail(truncated.digest)
+    assert not await media.create_thumbnail(bomb.digest)
+    assert not local.exists(bomb.digest, THUMBNAIL)
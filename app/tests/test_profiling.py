@@ -0,0 +1,61 @@
+import sys
+import time
+
+import pytest
+
+from app.profiling import SamplingProfiler, route_label
+
+
+def spin(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def run_profiled(profiler: SamplingProfiler, scope: dict, seconds: float):
+    frame = sys._getframe()
+    profiler.register(frame, scope)
+    try:
+        spin(seconds)
+    finally:
+        profiler.unregister(frame)
+
+
+@pytest.mark.anyio
+async def test_route_label_without_route():
+    assert route_label({"method": "GET", "path": "/post/1"}) == "GET /post/1"
+
+
+@pytest.mark.anyio
+async def test_sampler_records_collapsed_stacks():
+    profiler = SamplingProfiler(interval=0.001, max_stacks=100)
+    run_profiled(profiler, {"method": "GET", "path": "/busy"}, 0.2)
+
+    output = profiler.collapsed()
+    assert output.startswith("GET /busy;app.tests.test_profiling:spin ")
+
+
+@pytest.mark.anyio
+async def test_sampler_ignores_unregistered_frames():
+    profiler = SamplingProfiler(interval=0.001, max_stacks=100)
+    profiler.start()
+    spin(0.05)
+
+    assert profiler.collapsed() == ""
+
+
+@pytest.mark.anyio
+async def test_sampler_bounds_distinct_stacks():
+    profiler = SamplingProfiler(interval=0.001, max_stacks=1)
+    run_profiled(profiler, {"method": "GET", "path": "/first"}, 0.05)
+    run_profiled(profiler, {"method": "GET", "path": "/second"}, 0.05)
+
+    assert len(profiler.samples) == 1
+    assert profiler.dropped > 0
+
+
+@pytest.mark.anyio
+async def test_capture_returns_only_window_samples():
+    profiler = SamplingProfiler(interval=0.001, max_stacks=100)
+    assert await profiler.capture(0.01) == ""
+    assert not profiler.capturing
@@ -0,0 +1,59 @@
+import pytest
+from httpx import AsyncClient
+
+from app import query_counter
+from app.query_counter import QueryBudgetExceeded, QueryStats, query_budget
+
+
+@query_budget(1)
+async def budgeted_endpoint():
+    pass
+
+
+def make_stats(mode: str = "raise") -> QueryStats:
+    scope = {"method": "GET", "path": "/budgeted", "endpoint": budgeted_endpoint}
+    return QueryStats("abc", scope, mode)
+
+
+@pytest.mark.anyio
+async def test_query_budget_sets_attribute():
+    assert budgeted_endpoint.__query_budget__ == 1
+
+
+@pytest.mark.anyio
+async def test_record_query_outside_request():
+    query_counter.record_query("SELECT 1")
+
+
+@pytest.mark.anyio
+async def test_record_query_raises_over_budget():
+    token = query_counter._current_stats.set(make_stats())
+    try:
+        query_counter.record_query("SELECT 1")
+        with pytest.raises(QueryBudgetExceeded):
+            query_counter.record_query("SELECT 2")
+    finally:
+        query_counter._current_stats.reset(token)
+
+
+@pytest.mark.anyio
+async def test_record_query_warn_mode_only_counts():
+    stats = make_stats("warn")
+    token = query_counter._current_stats.set(stats)
+    try:
+        query_counter.record_query("SELECT 1")
+        query_counter.record_query("SELECT 2")
+    finally:
+        query_counter._current_stats.reset(token)
+
+    assert stats.count == 2
+    assert stats.exceeded
+
+
+@pytest.mark.anyio
+async def test_requests_are_counted(async_client: AsyncClient, query_log: list):
+    response = await async_client.get("/post")
+
+    assert response.status_code == 200
+    assert [(stats.route, stats.count) for stats in query_log] == [("GET /post", 1)]
+    assert query_counter.recent[query_log[0].correlation_id] is query_log[0]
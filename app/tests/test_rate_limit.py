@@ -0,0 +1,133 @@
+import asyncio
+import sqlite3
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app import security
+from app.main import app
+from app.rate_limit import (
+    MemoryBucketStore,
+    Rate,
+    RateLimitMiddleware,
+    SQLiteBucketStore,
+)
+
+
+def limited_client(app, limits=None, concurrency=None) -> AsyncClient:
+    limited_app = RateLimitMiddleware(
+        app,
+        store=MemoryBucketStore(),
+        limits=limits or {},
+        concurrency=concurrency or {},
+    )
+    return AsyncClient(transport=ASGITransport(app=limited_app), base_url="http://test")
+
+
+@pytest.mark.anyio
+async def test_rate_parse():
+    assert Rate.parse("10/minute") == Rate(10, 60)
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("store", ["memory", "sqlite"])
+async def test_bucket_exhausts_and_refills(store, tmp_path):
+    store = (
+        MemoryBucketStore() if store == "memory" else SQLiteBucketStore(tmp_path / "b")
+    )
+    rate = Rate(2, 10)
+
+    assert await store.take("key", rate, now=100) == 0
+    assert await store.take("key", rate, now=100) == 0
+    assert await store.take("key", rate, now=100) == pytest.approx(5)
+    assert await store.take("other", rate, now=100) == 0
+    assert await store.take("key", rate, now=105) == 0
+
+
+@pytest.mark.anyio
+async def test_sqlite_store_prunes_refilled_buckets(tmp_path):
+    store = SQLiteBucketStore(tmp_path / "b", prune_interval=0)
+    await store.take("minute", Rate(2, 60), now=100)
+    await store.take("hour", Rate(2, 3600), now=100)
+
+    # With one token taken, the minutely bucket is full again after 30s and
+    # the hourly one after 30 minutes
+    await store.take("other", Rate(2, 60), now=200)
+
+    keys = store._connection.execute("SELECT key FROM rate_buckets").fetchall()
+    assert sorted(key for (key,) in keys) == ["hour", "other"]
+
+
+@pytest.mark.anyio
+async def test_sqlite_store_fails_open_when_locked(tmp_path):
+    store = SQLiteBucketStore(tmp_path / "b", timeout=0.01)
+    rate = Rate(1, 60)
+    await store.take("key", rate, now=100)
+
+    # Another worker holding the write lock
+    other = sqlite3.connect(tmp_path / "b", isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        assert await store.take("key", rate, now=100) == 0
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+
+    assert await store.take("key", rate, now=100) == pytest.approx(60)
+
+
+@pytest.mark.anyio
+async def test_memory_store_evicts_oldest_bucket():
+    store = MemoryBucketStore(max_keys=1)
+    rate = Rate(1, 60)
+
+    await store.take("first", rate, now=0)
+    await store.take("second", rate, now=0)
+
+    assert await store.take("first", rate, now=0) == 0
+
+
+@pytest.mark.anyio
+async def test_rate_limited_before_database(query_log: list):
+    async with limited_client(app, limits={"POST /token": "1/minute"}) as client:
+        form = {"username": "nobody@example.net", "password": "1234"}
+        first = await client.post("/token", data=form)
+        second = await client.post("/token", data=form)
+
+    assert first.status_code == 401
+    assert second.status_code == 429
+    assert second.headers["Retry-After"] == "60"
+    assert [stats.route for stats in query_log] == ["POST /token"]
+
+
+@pytest.mark.anyio
+async def test_rate_limit_keyed_by_token_subject():
+    async with limited_client(app, limits={"GET /post": "1/minute"}) as client:
+        for email in ("first@example.net", "second@example.net"):
+            token = security.create_access_token(email)
+            response = await client.get(
+                "/post", headers={"Authorization": f"Bearer {token}"}
+            )
+            assert response.status_code == 200
+
+        assert (await client.get("/post")).status_code == 200
+        assert (await client.get("/post")).status_code == 429
+
+
+@pytest.mark.anyio
+async def test_concurrency_limit_sheds_load():
+    release = asyncio.Event()
+
+    async def slow_app(scope, receive, send):
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async with limited_client(slow_app, concurrency={"GET /slow": 1}) as client:
+        first = asyncio.create_task(client.get("/slow"))
+        await asyncio.sleep(0.01)
+        shed = await client.get("/slow")
+        release.set()
+
+        assert shed.status_code == 503
+        assert (await first).status_code == 200
@@ -1,3 +1,5 @@
+from types import SimpleNamespace
+
 import pytest
 from jose import jwt
 
@@ -158,3 +160,80 @@ async def test_get_current_user_wrong_type_token(registered_user: dict):
 
     with pytest.raises(security.HTTPException):
         await security.get_current_user(token)
+
+
+@pytest.fixture()
+async def user_record(confirmed_user: dict):
+    security.token_versions.clear()
+    yield await security.get_user(confirmed_user["email"])
+    security.token_versions.clear()
+
+
+@pytest.mark.anyio
+async def test_access_token_claims(user_record):
+    token = security.create_access_token(user_record.email, user_record)
+
+    assert {"uid": user_record.id, "confirmed": True, "ver": 0}.items() <= jwt.decode(
+        token, key=security.SECRET_KEY, algorithms=[security.ALGORITHM]
+    ).items()
+
+
+@pytest.mark.anyio
+async def test_get_current_user_from_claims(user_record, mocker):
+    token = security.create_access_token(user_record.email, user_record)
+    security.remember_token_version(user_record.id, 0)
+    fetch = mocker.spy(security.database, "fetch_one")
+    fetch_val = mocker.spy(security.database, "fetch_val")
+
+    user = await security.get_current_user(token)
+
+    assert (user.id, user.email) == (user_record.id, user_record.email)
+    assert fetch.call_count == fetch_val.call_count == 0
+
+
+@pytest.mark.anyio
+async def test_get_current_user_loads_token_version_once(user_record, mocker):
+    token = security.create_access_token(user_record.email, user_record)
+    fetch_val = mocker.spy(security.database, "fetch_val")
+
+    await security.get_current_user(token)
+    await security.get_current_user(token)
+
+    assert fetch_val.call_count == 1
+
+
+@pytest.mark.anyio
+async def test_get_current_user_revoked(user_record):
+    token = security.create_access_token(user_record.email, user_record)
+
+    await security.revoke_tokens(user_record.id)
+
+    with pytest.raises(security.HTTPException) as exec_info:
+        await security.get_current_user(token)
+    assert "Token has been revoked" == exec_info.value.detail
+
+
+@pytest.mark.anyio
+async def test_revocation_seen_after_cache_expires(user_record, mocker):
+    token = security.create_access_token(user_record.email, user_record)
+    await security.get_current_user(token)
+    # Revoked by another worker, this one still has the old version cached
+    await security.database.execute(
+        security.user_table.update().values(token_version=1)
+    )
+    await security.get_current_user(token)
+
+    mocker.patch.object(security.config, "TOKEN_VERSION_CACHE_SECONDS", 0)
+
+    with pytest.raises(security.HTTPException):
+        await security.get_current_user(token)
+
+
+@pytest.mark.anyio
+async def test_get_current_user_unconfirmed_claim(user_record):
+    user = SimpleNamespace(id=user_record.id, confirmed=False, token_version=0)
+    token = security.create_access_token(user_record.email, user)
+
+    with pytest.raises(security.HTTPException) as exec_info:
+        await security.get_current_user(token)
+    assert "User has not confirmed mail" == exec_info.value.detail
@@ -0,0 +1,23 @@
+import signal
+
+import pytest
+
+from app.server import Master
+
+
+@pytest.mark.anyio
+async def test_stop_ignores_child_gone_before_kill(mocker):
+    master = Master(app=None, sock=None, workers=1, timeout=0)
+    master.children = {12345}
+    mocker.patch.object(master, "reap")
+
+    def kill(pid, sig):
+        # The child exits between the last reap and the kill
+        if sig == signal.SIGKILL:
+            raise ProcessLookupError
+
+    mocker.patch("app.server.os.kill", side_effect=kill)
+
+    master.stop()
+
+    assert master.stopping
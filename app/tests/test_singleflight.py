@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from app import singleflight
+from app.singleflight import SingleFlight
+
+
+@pytest.fixture()
+def flight() -> SingleFlight:
+    return SingleFlight("test", ttl=60, maxsize=10)
+
+
+class Source:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def read(self) -> int:
+        self.calls += 1
+        call = self.calls
+        await self.release.wait()
+        return call
+
+    async def fail(self) -> None:
+        self.calls += 1
+        await self.release.wait()
+        raise ValueError("failed")
+
+
+async def started(*calls) -> list[asyncio.Task]:
+    tasks = [asyncio.ensure_future(call) for call in calls]
+    await asyncio.sleep(0)
+    return tasks
+
+
+@pytest.mark.anyio
+async def test_concurrent_calls_share_one_computation(flight: SingleFlight):
+    source = Source()
+    coalesced = singleflight.coalesced["test"]
+    tasks = await started(*(flight.do(1, source.read) for _ in range(5)))
+
+    source.release.set()
+
+    assert await asyncio.gather(*tasks) == [1] * 5
+    assert source.calls == 1
+    assert singleflight.coalesced["test"] - coalesced == 4
+
+
+@pytest.mark.anyio
+async def test_other_keys_run_separately(flight: SingleFlight):
+    source = Source()
+    source.release.set()
+
+    assert await asyncio.gather(flight.do(1, source.read), flight.do(2, source.read))
+    assert source.calls == 2
+
+
+@pytest.mark.anyio
+async def test_result_is_cached_for_ttl(flight: SingleFlight):
+    source = Source()
+    source.release.set()
+
+    assert await flight.do(1, source.read) == 1
+    assert await flight.do(1, source.read) == 1
+
+    flight.ttl = 0
+    assert await flight.do(1, source.read) == 2
+
+
+@pytest.mark.anyio
+async def test_errors_are_shared_but_not_cached(flight: SingleFlight):
+    source = Source()
+    tasks = await started(flight.do(1, source.fail), flight.do(1, source.fail))
+    source.release.set()
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    assert [type(result) for result in results] == [ValueError, ValueError]
+    assert source.calls == 1
+    with pytest.raises(ValueError):
+        await flight.do(1, source.fail)
+    assert source.calls == 2
+
+
+@pytest.mark.anyio
+async def test_cancelled_caller_leaves_others_waiting(flight: SingleFlight):
+    source = Source()
+    first, second = await started(flight.do(1, source.read), flight.do(1, source.read))
+
+    first.cancel()
+    source.release.set()
+
+    assert await second == 1
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+
+@pytest.mark.anyio
+async def test_forget_during_flight(flight: SingleFlight):
+    source = Source()
+    (before,) = await started(flight.do(1, source.read))
+
+    flight.forget(1)
+    (after,) = await started(flight.do(1, source.read))
+    source.release.set()
+
+    # The result read before the write is not kept
+    assert (await before, await after) == (1, 2)
+    assert await flight.do(1, source.read) == 2
@@ -0,0 +1,152 @@
+import sqlite3
+import time
+
+import pytest
+import sqlalchemy
+from httpx import AsyncClient
+
+from app.archive import archive_posts
+from app.database import database, job_table, user_stats_table, user_table
+from app.jobs import job_queue
+from app.stats import check_user_stats
+from app.tests.routers.test_posts import create_comment, create_post, like_post
+
+
+@pytest.fixture()
+async def other_user() -> int:
+    return await database.execute(user_table.insert().values(email="other@b.c"))
+
+
+async def get_stats(async_client: AsyncClient, user_id: int) -> dict:
+    response = await async_client.get(f"/user/{user_id}/stats")
+    return {key: value for key, value in response.json().items() if key != "user_id"}
+
+
+@pytest.mark.anyio
+async def test_stats_follow_writes(
+    async_client: AsyncClient, logged_in_token: str, confirmed_user: dict
+):
+    post = await create_post("Test Post", async_client, logged_in_token)
+    await create_post("Test Post", async_client, logged_in_token)
+    await create_comment("Test Comment", post["id"], async_client, logged_in_token)
+    await like_post(async_client, logged_in_token, post["id"])
+    await like_post(async_client, logged_in_token, post["id"])
+
+    assert await get_stats(async_client, confirmed_user["id"]) == {
+        "posts": 2,
+        "comments": 1,
+        "likes_given": 1,
+        "likes_received": 1,
+    }
+
+
+@pytest.mark.anyio
+async def test_stats_unlike(
+    async_client: AsyncClient, logged_in_token: str, confirmed_user: dict
+):
+    post = await create_post("Test Post", async_client, logged_in_token)
+    await like_post(async_client, logged_in_token, post["id"])
+    await async_client.delete(
+        f"/like/{post['id']}", headers={"Authorization": f"Bearer {logged_in_token}"}
+    )
+
+    stats = await get_stats(async_client, confirmed_user["id"])
+    assert (stats["likes_given"], stats["likes_received"]) == (0, 0)
+
+
+@pytest.mark.anyio
+async def test_stats_survive_archiving(
+    async_client: AsyncClient, logged_in_token: str, confirmed_user: dict
+):
+    post = await create_post("Test Post", async_client, logged_in_token)
+    await create_comment("Test Comment", post["id"], async_client, logged_in_token)
+    await like_post(async_client, logged_in_token, post["id"])
+    before = await get_stats(async_client, confirmed_user["id"])
+
+    await archive_posts(older_than_days=0, batch_size=10, now=time.time() + 1)
+
+    assert await get_stats(async_client, confirmed_user["id"]) == before
+    assert await check_user_stats(batch_size=2) == 0
+
+
+@pytest.mark.anyio
+async def test_check_consistent_stats(
+    async_client: AsyncClient, logged_in_token: str, other_user: int
+):
+    post = await create_post("Test Post", async_client, logged_in_token)
+    await like_post(async_client, logged_in_token, post["id"])
+
+    assert await check_user_stats(batch_size=2) == 0
+
+
+@pytest.mark.anyio
+async def test_check_repairs_drift(
+    async_client: AsyncClient, logged_in_token: str, confirmed_user: dict
+):
+    await create_post("Test Post", async_client, logged_in_token)
+    await database.execute(user_stats_table.update().values(posts=5))
+
+    assert await check_user_stats(batch_size=2) == 1
+    assert (await get_stats(async_client, confirmed_user["id"]))["posts"] == 1
+
+
+@pytest.mark.anyio
+async def test_check_repairs_drift_in_batches(
+    async_client: AsyncClient, logged_in_token: str, other_user: int
+):
+    post = await create_post("Test Post", async_client, logged_in_token)
+    await like_post(async_client, logged_in_token, post["id"])
+    third_user = await database.execute(user_table.insert().values(email="third@b.c"))
+    await database.execute(user_stats_table.update().values(likes_given=3))
+
+    assert await check_user_stats(batch_size=2) == 3
+    assert await check_user_stats(batch_size=2) == 0
+    assert (await get_stats(async_client, third_user))["likes_given"] == 0
+
+
+@pytest.mark.anyio
+async def test_check_creates_missing_row(
+    async_client: AsyncClient, logged_in_token: str, confirmed_user: dict
+):
+    await create_post("Test Post", async_client, logged_in_token)
+    await database.execute(user_stats_table.delete())
+
+    assert await check_user_stats(batch_size=2) == 1
+    assert (await get_stats(async_client, confirmed_user["id"]))["posts"] == 1
+
+
+@pytest.mark.anyio
+async def test_periodic_check_reschedules(mocker):
+    enqueue = mocker.spy(job_queue, "enqueue")
+
+    await job_queue.ensure_scheduled("check_user_stats_periodically")
+    assert await job_queue.run_pending() == 1
+
+    enqueue.assert_called_once_with("check_user_stats_periodically", delay=mocker.ANY)
+    # The next run is not due yet
+    assert await job_queue.run_pending() == 0
+
+
+@pytest.mark.anyio
+async def test_failed_periodic_check_schedules_one_run(mocker):
+    mocker.patch(
+        "app.tasks.check_user_stats",
+        side_effect=[sqlite3.OperationalError("database is locked"), 0],
+    )
+    pending = (
+        sqlalchemy.select(sqlalchemy.func.count())
+        .select_from(job_table)
+        .where(
+            job_table.c.name == "check_user_stats_periodically",
+            job_table.c.status == "pending",
+        )
+    )
+    await job_queue.ensure_scheduled("check_user_stats_periodically")
+    now = time.time()
+    assert await job_queue.run_pending(now) == 1
+    # Only the retry is waiting
+    assert await database.fetch_val(pending) == 1
+
+    assert await job_queue.run_pending(now + 60) == 1
+    # The retry succeeded and scheduled the next run, nothing else
+    assert await database.fetch_val(pending) == 1
@@ -0,0 +1,80 @@
+"""Compare per-worker cold start of forked (preloaded) and spawned workers.
+
+    ENV_STATE=dev python -m benchmarks.cold_start --workers 4
+
+A spawned worker starts a fresh interpreter, imports the app and runs its
+startup; a forked worker inherits the master's imports and only runs the
+startup. Each worker is timed until its lifespan startup has completed.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+STARTUP = """
+import asyncio
+from app.main import app
+
+async def startup():
+    async with app.router.lifespan_context(app):
+        pass
+
+asyncio.run(startup())
+"""
+
+
+def spawned_worker() -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", STARTUP], check=True)
+    return time.perf_counter() - start
+
+
+def forked_worker(app) -> float:
+    start = time.perf_counter()
+    pid = os.fork()
+    if not pid:
+
+        async def startup():
+            async with app.router.lifespan_context(app):
+                pass
+
+        asyncio.run(startup())
+        os._exit(0)
+
+    os.waitpid(pid, 0)
+    return time.perf_counter() - start
+
+
+def report(name: str, timings: list[float]) -> None:
+    print(
+        f"{name:<8} mean {statistics.mean(timings) * 1000:8.1f} ms   "
+        f"median {statistics.median(timings) * 1000:8.1f} ms   "
+        f"max {max(timings) * 1000:8.1f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    from app.database import SCHEMA_READY_ENV, create_schema
+
+    create_schema()
+    os.environ[SCHEMA_READY_ENV] = "1"
+
+    report("spawned", [spawned_worker() for _ in range(args.workers)])
+
+    preload_start = time.perf_counter()
+    from app.main import app
+
+    print(f"preload  {(time.perf_counter() - preload_start) * 1000:8.1f} ms in master")
+    report("forked", [forked_worker(app) for _ in range(args.workers)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Measure how long `import app.main` takes, using `python -X importtime`.
+
+ENV_STATE=dev python -m benchmarks.import_time --runs 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Only needed once a request actually hashes, signs or logs
+LAZY_MODULES = ("passlib", "bcrypt", "jose", "rich", "logtail", "pythonjsonlogger")
+
+
+def parse_importtime(stderr: str) -> dict[str, tuple[int, int]]:
+    # "import time: self [us] | cumulative | imported package"
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def run_importtime(module: str = "app.main") -> dict[str, tuple[int, int]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "ENV_STATE": os.environ.get("ENV_STATE", "test")},
+    )
+    return parse_importtime(result.stderr)
+
+
+def import_time_ms(module: str = "app.main", runs: int = 3) -> float:
+    # The fastest run is the least disturbed by whatever else the host is doing
+    return min(run_importtime(module)[module][1] for _ in range(runs)) / 1000
+
+
+def loaded_lazy_modules(module: str = "app.main") -> list[str]:
+    code = (
+        f"import sys, {module}; "
+        f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "ENV_STATE": os.environ.get("ENV_STATE", "test")},
+    )
+    return [name for name in result.stdout.strip().split(",") if name]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [run_importtime() for _ in range(args.runs)]
+    totals = [timings["app.main"][1] / 1000 for timings in runs]
+    print(
+        f"import app.main: min {min(totals):.1f} ms, "
+        f"median {statistics.median(totals):.1f} ms over {args.runs} runs"
+    )
+
+    print(f"\nslowest modules by self time (last run, top {args.top}):")
+    slowest = sorted(runs[-1].items(), key=lambda item: item[1][0], reverse=True)
+    for name, (self_us, cumulative_us) in slowest[: args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    print(f"\neagerly loaded lazy modules: {loaded_lazy_modules() or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Time the test suite, serially and spread over worker processes.
+
+    python -m benchmarks.test_suite --workers 1 4 auto
+
+Each run is a fresh `pytest -q`; `--workers 1` runs without xdist. Every
+worker gets its own temporary database, so runs do not share any state.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+
+def run_suite(workers: str) -> float:
+    command = [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider"]
+    if workers != "1":
+        command += ["-n", workers]
+    start = time.perf_counter()
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.test_suite")
+    parser.add_argument("--workers", nargs="+", default=["1", "auto"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    for workers in args.workers:
+        times = [run_suite(workers) for _ in range(args.repeat)]
+        print(
+            f"{workers:>5} workers: median {statistics.median(times):.2f}s, "
+            f"min {min(times):.2f}s over {args.repeat} runs"
+        )
+
+
+if __name__ == "__main__":
+    main()
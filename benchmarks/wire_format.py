@@ -0,0 +1,80 @@
+"""Compare bytes on the wire and encode time of the GET /post formats.
+
+    ENV_STATE=dev python -m benchmarks.wire_format --rows 1000
+
+JSON is encoded the way FastAPI does for a response_model (validate, make
+JSON-able, dump); msgpack is the columnar encoding sent to clients that
+ask for it. Both are also shown gzipped at GZIP_LEVEL, as sent above
+GZIP_MIN_SIZE.
+"""
+
+import argparse
+import gzip
+import json
+import random
+import statistics
+import time
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app.config import config
+from app.encoding import MsgPackResponse, columnar
+from app.models.post import UserPostWithLikes
+
+WORDS = "the quick brown fox jumps over a lazy dog while friends like and comment"
+
+
+def make_rows(count: int) -> list[dict]:
+    words = WORDS.split()
+    return [
+        {
+            "id": number,
+            "body": " ".join(random.choices(words, k=random.randint(3, 30))),
+            "user_id": random.randint(1, 1000),
+            "likes": random.randint(0, 500),
+        }
+        for number in range(1, count + 1)
+    ]
+
+
+def encode_json(rows: list[dict]) -> bytes:
+    posts = TypeAdapter(List[UserPostWithLikes]).validate_python(rows)
+    return json.dumps(jsonable_encoder(posts)).encode()
+
+
+def encode_msgpack(rows: list[dict]) -> bytes:
+    return MsgPackResponse(columnar(UserPostWithLikes, rows)).body
+
+
+def timed(encode, rows: list[dict], runs: int) -> tuple[bytes, float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        body = encode(rows)
+        timings.append(time.perf_counter() - start)
+    return body, statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    print(f"{args.rows} posts, median of {args.runs} runs")
+    for name, encode in [("json", encode_json), ("msgpack", encode_msgpack)]:
+        body, encode_time = timed(encode, rows, args.runs)
+        compressed, gzip_time = timed(
+            lambda body: gzip.compress(body, config.GZIP_LEVEL), body, args.runs
+        )
+        print(
+            f"{name:<8} {len(body):>9} bytes  encode {encode_time * 1000:7.2f} ms   "
+            f"gzip {len(compressed):>9} bytes  +{gzip_time * 1000:6.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()